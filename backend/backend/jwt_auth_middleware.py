@@ -1,41 +1,104 @@
+import asyncio
 import urllib.parse
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
 from channels.db import database_sync_to_async
-from rest_framework_simplejwt.backends import TokenBackend
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
 from django.conf import settings
 
+from usuarios import cache_auth
+from usuarios.tokens import versao
+
+
+class _UserLoader:
+    """
+    Coalesces user lookups of concurrent handshakes: every cache miss that
+    arrives within AUTH_USER_BATCH_WINDOW seconds is served by a single
+    ``in_bulk`` query, so a reconnect storm after a deploy costs a handful of
+    queries instead of one per socket.
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._flush_task = None
+
+    async def load(self, user_id, token_version=0):
+        cached = cache_auth.obter_muitos([(user_id, token_version)]).get(user_id)
+        if cached is not None:
+            return cached
+        future = self._pending.get(user_id)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._pending[user_id] = future
+            if self._flush_task is None:
+                self._flush_task = asyncio.ensure_future(self._flush())
+        return await asyncio.shield(future)
+
+    async def _flush(self):
+        try:
+            await asyncio.sleep(getattr(settings, 'AUTH_USER_BATCH_WINDOW', 0.005))
+        finally:
+            pending, self._pending, self._flush_task = self._pending, {}, None
+        try:
+            users = await database_sync_to_async(get_user_model().objects.in_bulk)(list(pending))
+        except Exception as exc:
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        cache_auth.guardar(users.values())
+        for user_id, future in pending.items():
+            if not future.done():
+                future.set_result(users.get(user_id))
+
+
+_loader = _UserLoader()
+
+
+def _token_from_scope(scope):
+    # ?token= first, then the Authorization header; only what we need is parsed
+    query_string = scope.get('query_string', b'')
+    if b'token=' in query_string:
+        token = urllib.parse.parse_qs(query_string.decode()).get('token', [None])[0]
+        if token:
+            return token
+    for name, value in scope.get('headers', ()):
+        if name.lower() == b'authorization':
+            auth = value.decode()
+            if auth.lower().startswith('bearer '):
+                return auth.split(' ', 1)[1]
+            return None
+    return None
+
 
 class TokenAuthMiddleware:
-    """Middleware that takes a token from the query string or headers and authenticates the user for WebSocket connections."""
+    """Middleware that takes a token from the query string or headers and authenticates the user for WebSocket connections.
+
+    Tokens are validated as SimpleJWT access tokens (signature, expiry and
+    ``token_type``: refresh tokens are refused); users come from a
+    short-lived cache invalidated on save, and tokens whose ``ver`` claim is no longer the user's token_version are
+    rejected like on the REST side.
+    The token's ``exp`` is kept in ``scope['token_exp']`` so long-lived
+    connections can re-check it without decoding again.
+    """
     def __init__(self, inner):
         self.inner = inner
 
     async def __call__(self, scope, receive, send):
-        # get token from ?token= or Authorization header
-        token = None
-        query_string = scope.get('query_string', b'').decode()
-        if query_string:
-            qs = urllib.parse.parse_qs(query_string)
-            token = qs.get('token', [None])[0]
-
-        if not token:
-            headers = {k.decode().lower(): v.decode() for k, v in scope.get('headers', [])}
-            auth = headers.get('authorization')
-            if auth and auth.lower().startswith('bearer '):
-                token = auth.split(' ', 1)[1]
-
         scope['user'] = AnonymousUser()
+        scope['token_exp'] = None
+        token = _token_from_scope(scope)
         if token:
             try:
-                tb = TokenBackend(algorithm=getattr(settings, 'SIMPLE_JWT', {}).get('ALGORITHM', 'HS256'),
-                                  signing_key=getattr(settings, 'SIMPLE_JWT', {}).get('SIGNING_KEY', settings.SECRET_KEY))
-                validated = tb.decode(token, verify=True)
-                # SimpleJWT default claim is 'user_id'; support 'id' as fallback
-                user_id = validated.get('user_id') or validated.get('id')
-                User = get_user_model()
-                user = await database_sync_to_async(User.objects.get)(id=user_id)
-                scope['user'] = user
+                # AccessToken also rejects refresh tokens (token_type claim)
+                validated = AccessToken(token)
+                user_id = int(validated[api_settings.USER_ID_CLAIM])
+                token_version = versao(validated)
+                user = await _loader.load(user_id, token_version)
+                if user is not None and user.is_active and user.token_version == token_version:
+                    scope['user'] = user
+                    scope['token_exp'] = validated.get('exp')
             except Exception:
                 scope['user'] = AnonymousUser()
 
@@ -75,12 +75,96 @@ ROOT_URLCONF = 'backend.urls'
 # ⚙️ Configuração do Channels (ASGI)
 ASGI_APPLICATION = 'backend.asgi.application'
 
-# Channels sem Redis (modo DEV)
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer"
-    },
-}
+# Channel layer: com REDIS_URL definido usamos Redis, que permite rodar vários
+# workers daphne/uvicorn atrás de um balanceador (grupos `user_{id}` passam a
+# alcançar sockets em qualquer processo). Várias URLs separadas por vírgula
+# ativam o sharding do channels_redis. Sem REDIS_URL ficamos no InMemory (DEV,
+# um único processo).
+REDIS_URL = os.getenv('REDIS_URL', '').strip()
+REDIS_HOSTS = [url.strip() for url in REDIS_URL.split(',') if url.strip()]
+
+if REDIS_HOSTS:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {
+                "hosts": REDIS_HOSTS,
+                "prefix": os.getenv('CHANNEL_LAYER_PREFIX', 'quartinho'),
+                # mensagens não consumidas expiram rápido; chat é tempo real e
+                # o histórico completo vem da API REST
+                "expiry": int(os.getenv('CHANNEL_LAYER_EXPIRY', '60')),
+                # sockets que caem sem group_discard somem dos grupos sozinhos
+                "group_expiry": int(os.getenv('CHANNEL_LAYER_GROUP_EXPIRY', '86400')),
+                "capacity": int(os.getenv('CHANNEL_LAYER_CAPACITY', '100')),
+                # capacidade por padrão de canal: os canais dos consumers
+                # (`specific.*`) recebem os group_send de `user_{id}`, que podem
+                # chegar em rajadas (fan-out de alertas de preço)
+                "channel_capacity": {
+                    "http.request": 200,
+                    "specific.*": int(os.getenv('CHANNEL_LAYER_USER_CAPACITY', '300')),
+                },
+            },
+        },
+    }
+    # Cache compartilhado entre os workers (contadores, dedupe de alertas e
+    # limite de push dependem de um cache único)
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv('REDIS_CACHE_URL', REDIS_HOSTS[0]),
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer"
+        },
+    }
+
+# 💬 Chat (WebSocket)
+# conversas/destinatários mantidos em cache por conexão (LRU)
+CHAT_CONNECTION_CACHE_SIZE = 64
+# presença (segundos): conexão sem heartbeat por mais que isso conta como offline;
+# usuários online não recebem push de chat
+CHAT_PRESENCE_TTL = 60
+# limites por conexão: token bucket (frames/s e rajada), tamanho de frame/texto,
+# fila de saída (cheia = cliente lento, desconecta) e violações até fechar
+CHAT_RATE_LIMIT = 5
+CHAT_RATE_BURST = 20
+CHAT_MAX_RATE_VIOLATIONS = 50
+CHAT_MAX_FRAME_BYTES = 16 * 1024
+CHAT_MAX_TEXT_LENGTH = 4000
+CHAT_OUTBOUND_QUEUE_SIZE = 100
+# eventos efêmeros (typing/stop_typing/viewing): no máximo 1 repassado por
+# intervalo (segundos) por conexão; bucket próprio, descartados em silêncio
+CHAT_EPHEMERAL_INTERVAL = 1.0
+CHAT_EPHEMERAL_RATE_LIMIT = 20
+CHAT_EPHEMERAL_BURST = 40
+# arquivo (comando `arquivar_mensagens`): conversas paradas há N meses vão para
+# blocos compactados; o histórico continua paginando neles de forma transparente
+MESSAGE_ARCHIVE_AFTER_MONTHS = 6
+MESSAGE_ARCHIVE_CHUNK_SIZE = 500
+# busca com ?archived=1: no máximo N blocos do arquivo abertos por requisição
+MESSAGE_SEARCH_ARCHIVE_BLOCKS = 10
+# retomada: cada evento para `user_{id}` (mensagem, leitura, notificação) recebe
+# um `seq`; os últimos N ficam guardados (por até TTL segundos) para quem
+# reconectar com ?since=<seq>; fora do buffer o cliente usa GET sync/?after=
+CHAT_REPLAY_BUFFER_SIZE = 200
+CHAT_REPLAY_TTL = 24 * 3600
+# tópicos de imóveis no mesmo socket ({"type": "subscribe", "topic": "imovel:<id>"}):
+# máximo por conexão e janela (segundos) em que mudanças no mesmo imóvel viram
+# um só evento; 0 = envia cada mudança na hora
+CHAT_MAX_TOPICS = 20
+LISTING_UPDATE_INTERVAL = 1.0
+
+# 🔐 Autenticação por token (WebSocket)
+# usuários autenticados (WebSocket e REST) ficam em cache (segundos); invalidado ao salvar o Usuario
+AUTH_USER_CACHE_TTL = 60
+# handshakes simultâneos dentro desta janela (segundos) viram uma única consulta
+AUTH_USER_BATCH_WINDOW = 0.005
+# token expirado numa conexão aberta: avisa (`token_expired`) e fecha depois de N
+# segundos sem novo token; None = só avisa (o app mobile ainda não renova token)
+WS_TOKEN_EXPIRY_GRACE = None
 
 # Template padrão
 TEMPLATES = [
@@ -135,10 +219,13 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # ⚙️ Configuração do Django REST Framework
+# usuário do JWT vem do cache (AUTH_USER_CACHE_TTL); sessão é opcional:
+# API_SESSION_AUTH=0 em deploys só de API (o admin continua usando sessão)
+API_SESSION_AUTH = os.getenv('API_SESSION_AUTH', '1').lower() not in ('0', 'false', 'no')
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-        'rest_framework.authentication.SessionAuthentication',
+        'usuarios.authentication.CachedJWTAuthentication',
+        *(('rest_framework.authentication.SessionAuthentication',) if API_SESSION_AUTH else ()),
     )
 }
 
@@ -149,11 +236,51 @@ SIMPLE_JWT = {
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
     'AUTH_HEADER_TYPES': ('Bearer',),
+    # tokens levam a versão do usuário (claim `ver`); trocar a senha revoga os antigos
+    'TOKEN_OBTAIN_SERIALIZER': 'usuarios.tokens.VersionedTokenObtainPairSerializer',
+    # rotação revoga o refresh usado (usuarios.revogacao, sem o app token_blacklist)
+    'TOKEN_REFRESH_SERIALIZER': 'usuarios.tokens.RevocableTokenRefreshSerializer',
 }
+# revogação: filtro de Bloom por processo (capacidade/taxa de falso positivo),
+# sincronizado com o banco a cada N segundos; expirados apagados em lotes a cada N segundos
+REVOCATION_BLOOM_CAPACITY = 100_000
+REVOCATION_BLOOM_ERROR_RATE = 0.001
+REVOCATION_SYNC_INTERVAL = 30
+REVOCATION_PRUNE_INTERVAL = 3600
+REVOCATION_PRUNE_BATCH = 1000
 
 # 🔥 Firebase (opcional, desativado por padrão)
 FIREBASE_CREDENTIALS = None
 FIREBASE_CREDENTIALS_JSON = None
+# Transporte de push; 'notificacoes.push.LocalPushTransport' não envia nada (testes/benchmarks)
+PUSH_TRANSPORT = 'notificacoes.push.FirebaseTransport'
+
+# 🔔 Notificações
+# Fan-out (alertas de preço etc.) roda numa thread depois do commit; False = inline
+NOTIFICATION_FANOUT_ASYNC = True
+# Tamanho dos lotes de bulk_create / envio de push
+NOTIFICATION_BATCH_SIZE = 500
+# Edições de preço dentro desta janela viram um único alerta por usuário
+PRICE_ALERT_DEDUP_WINDOW = timedelta(minutes=10)
+# Séries de preço por cidade ficam em cache (segundos) até um novo preço ser gravado
+PRICE_STATS_CACHE_TTL = 600
+# Cache (segundos) do contador de não lidas; o valor persistido fica em ContadorNaoLidas
+UNREAD_COUNTER_CACHE_TTL = 300
+# Retenção (comando `purgar_notificacoes`): lidas expiram após N dias; 0 desativa
+NOTIFICATION_RETENTION_DAYS = 30
+# Máximo de notificações guardadas por usuário (as mais antigas saem primeiro); 0 desativa
+NOTIFICATION_MAX_PER_USER = 500
+# Exclusões grandes são feitas em lotes deste tamanho
+NOTIFICATION_DELETE_BATCH_SIZE = 1000
+# Notificações não lidas com a mesma chave nesta janela viram uma só (com contagem)
+NOTIFICATION_COALESCE_WINDOW = timedelta(minutes=10)
+# Intervalo mínimo (segundos) entre pushes para o mesmo usuário e conversa; 0 desativa
+NOTIFICATION_PUSH_MIN_INTERVAL = 30
+# Intervalo (segundos) do keep-alive no stream SSE de notificações
+NOTIFICATION_SSE_HEARTBEAT = 15
+# Janela (segundos) em que notificações para o mesmo usuário viram um único evento
+# no WebSocket/SSE, mesmo vindas de commits diferentes; 0 = envia a cada commit
+NOTIFICATION_STREAM_INTERVAL = 0.25
 
 # Payment provider keys removed (Mercado Pago / Stripe) — configure providers separately if needed.
 # Stripe settings have been removed from this deployment. Configure payment
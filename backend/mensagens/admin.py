@@ -1,12 +1,18 @@
 from django.contrib import admin
-from .models import Conversation, Message
+from .models import ArchivedMessageChunk, Conversation, Message
 
 
 @admin.register(Conversation)
 class ConversationAdmin(admin.ModelAdmin):
-    list_display = ['id', 'created_at']
+    list_display = ['id', 'created_at', 'last_activity_at']
 
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
     list_display = ['id', 'sender', 'recipient', 'created_at']
+
+
+@admin.register(ArchivedMessageChunk)
+class ArchivedMessageChunkAdmin(admin.ModelAdmin):
+    list_display = ['id', 'conversation', 'month', 'first_id', 'last_id', 'count']
+    exclude = ['payload']
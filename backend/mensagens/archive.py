@@ -0,0 +1,138 @@
+"""Cold storage for old chat history.
+
+Conversations without activity for MESSAGE_ARCHIVE_AFTER_MONTHS have their
+messages moved out of ``Message`` into compressed ArchivedMessageChunk
+blocks (one calendar month at most per block). The newest message stays in
+the hot table: the conversation list preview and the read cursors point at
+it. History pages read the hot table first and only open archive blocks
+when a page reaches past ``Conversation.archived_until_id``.
+"""
+import json
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import ArchivedMessageChunk, Conversation, Message
+
+FIELDS = ('id', 'sender_id', 'recipient_id', 'text', 'type', 'data', 'created_at')
+
+
+def _chunk_size():
+    return getattr(settings, 'MESSAGE_ARCHIVE_CHUNK_SIZE', 500)
+
+
+def pack(messages):
+    rows = [
+        [m.id, m.sender_id, m.recipient_id, m.text, m.type, m.data, m.created_at.isoformat()]
+        for m in messages
+    ]
+    return zlib.compress(json.dumps(rows, separators=(',', ':')).encode('utf-8'), 6)
+
+
+def unpack(chunk, users=None):
+    """Unsaved Message instances (ascending id); ``users`` maps id -> Usuario for nested serializers."""
+    users = users or {}
+    messages = []
+    for row in json.loads(zlib.decompress(bytes(chunk.payload)).decode('utf-8')):
+        values = dict(zip(FIELDS, row))
+        values['created_at'] = parse_datetime(values['created_at'])
+        msg = Message(conversation_id=chunk.conversation_id, **values)
+        if msg.sender_id in users:
+            msg.sender = users[msg.sender_id]
+        if msg.recipient_id in users:
+            msg.recipient = users[msg.recipient_id]
+        messages.append(msg)
+    return messages
+
+
+def _month(dt):
+    return dt.date().replace(day=1)
+
+
+def _flush(conv, block):
+    first, last = block[0], block[-1]
+    return ArchivedMessageChunk(
+        conversation=conv, month=_month(first.created_at),
+        first_id=first.id, last_id=last.id, first_at=first.created_at, last_at=last.created_at,
+        count=len(block), payload=pack(block),
+    )
+
+
+def archive_conversation(conv, chunk_size=None):
+    """Move every message but the newest into archive blocks; returns how many moved."""
+    chunk_size = chunk_size or _chunk_size()
+    keep_id = conv.last_message_id
+    if not keep_id:
+        return 0
+    moved = 0
+    queryset = Message.objects.filter(conversation_id=conv.pk, id__lt=keep_id).order_by('id')
+    while True:
+        # one block per transaction: a crash never leaves rows both archived and hot
+        with transaction.atomic():
+            rows = list(queryset[:chunk_size])
+            if not rows:
+                return moved
+            month = _month(rows[0].created_at)
+            block = [m for m in rows if _month(m.created_at) == month]
+            _flush(conv, block).save()
+            Message.objects.filter(pk__in=[m.id for m in block]).delete()
+            Conversation.objects.filter(pk=conv.pk, archived_until_id__lt=block[-1].id).update(
+                archived_until_id=block[-1].id
+            )
+            conv.archived_until_id = max(conv.archived_until_id, block[-1].id)
+            moved += len(block)
+
+
+def archive_inactive(months=None, chunk_size=None):
+    """Archive conversations idle for ``months``; returns counters for the command output."""
+    months = getattr(settings, 'MESSAGE_ARCHIVE_AFTER_MONTHS', 6) if months is None else months
+    cutoff = timezone.now() - timedelta(days=30 * months)
+    result = {'conversations': 0, 'messages': 0}
+    stale = Conversation.objects.filter(last_activity_at__lt=cutoff, last_message__isnull=False)
+    for conv in stale.iterator(chunk_size=200):
+        moved = archive_conversation(conv, chunk_size)
+        if moved:
+            result['conversations'] += 1
+            result['messages'] += moved
+    return result
+
+
+def archived_messages(conv, before=None, after=None, limit=50, users=None):
+    """
+    Up to ``limit`` archived messages of ``conv`` older than ``before`` (newest
+    first) or newer than ``after`` (oldest first). Only opens the blocks that
+    can hold them.
+    """
+    if not conv.archived_until_id or limit <= 0:
+        return []
+    chunks = ArchivedMessageChunk.objects.filter(conversation_id=conv.pk)
+    if after is not None:
+        chunks = chunks.filter(last_id__gt=after).order_by('first_id')
+    else:
+        if before is not None:
+            chunks = chunks.filter(first_id__lt=before)
+        chunks = chunks.order_by('-last_id')
+    found = []
+    for chunk in chunks.iterator(chunk_size=4):
+        messages = unpack(chunk, users)
+        if after is not None:
+            found.extend(m for m in messages if m.id > after)
+        else:
+            found.extend(m for m in reversed(messages) if before is None or m.id < before)
+        if len(found) >= limit:
+            break
+    return found[:limit]
+
+
+def all_archived(conv, users=None):
+    """Whole archived history, ascending (legacy full-list endpoint)."""
+    if not conv.archived_until_id:
+        return []
+    messages = []
+    for chunk in ArchivedMessageChunk.objects.filter(conversation_id=conv.pk).order_by('first_id'):
+        messages.extend(unpack(chunk, users))
+    return messages
@@ -1,24 +1,70 @@
+from collections import OrderedDict
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
 from channels.db import database_sync_to_async
 from asgiref.sync import sync_to_async
 import json
-from notificacoes.utils import send_fcm_to_user
+import urllib.parse
+from notificacoes.agregacao import chave_chat, criar_ou_agregar
+from . import metrics, presence, receipts, replay, wire
+import asyncio
 import logging
+import time
 from django.conf import settings
 
 User = get_user_model()
 
+# relayed to the other participant only; never stored, notified or pushed
+EPHEMERAL_EVENTS = ('typing', 'stop_typing', 'viewing')
+EPHEMERAL_TTL = 5
+
+
+def topic_group(topic):
+    """``imovel:<id>`` -> (group name, id); None for anything else."""
+    kind, _, raw_id = str(topic or '').partition(':')
+    if kind != 'imovel':
+        return None
+    try:
+        imovel_id = int(raw_id)
+    except ValueError:
+        return None
+    return f'imovel_{imovel_id}', imovel_id
+
 
 class ChatConsumer(AsyncJsonWebsocketConsumer):
     async def connect(self):
         user = self.scope.get('user')
         if user and user.is_authenticated:
             self.user = user
+            # sender comes from the scope; recipients/conversations are cached per connection
+            self._conversations = _LRU(self._cache_size())
             # use group per user for direct messages
             self.group_name = f'user_{user.id}'
             await self.channel_layer.group_add(self.group_name, self.channel_name)
-            await self.accept()
+            # limits are per connection: a flooding socket only throttles itself
+            self._bucket = _TokenBucket(
+                getattr(settings, 'CHAT_RATE_LIMIT', 5), getattr(settings, 'CHAT_RATE_BURST', 20)
+            )
+            self._violations = 0
+            self._ephemeral_bucket = _TokenBucket(
+                getattr(settings, 'CHAT_EPHEMERAL_RATE_LIMIT', 20), getattr(settings, 'CHAT_EPHEMERAL_BURST', 40)
+            )
+            self._ephemeral_sent_at = _LRU(self._cache_size())
+            self._ephemeral_pending = {}
+            self._ephemeral_flush = {}
+            # listing topics subscribed on this connection (group names)
+            self._topics = set()
+            # optional compact wire format (Sec-WebSocket-Protocol); JSON by default
+            self._codec = wire.negotiate(self.scope.get('subprotocols'))
+            await self.accept(subprotocol=self._codec.subprotocol)
+            self._outbound = asyncio.Queue(maxsize=getattr(settings, 'CHAT_OUTBOUND_QUEUE_SIZE', 100))
+            self._writer_task = asyncio.ensure_future(self._drain_outbound())
+            await self._touch_presence()
+            self._heartbeat_task = asyncio.ensure_future(self._presence_heartbeat())
+            # ?since=<seq>: replay what was sent to the group while we were away
+            self._seq_floor = 0
+            await self.resume(self._since_param())
             try:
                 if settings.DEBUG:
                     logging.getLogger('chat').info(
@@ -36,19 +82,185 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             await self.close()
 
     async def disconnect(self, code):
+        tasks = [getattr(self, '_heartbeat_task', None), getattr(self, '_writer_task', None)]
+        tasks += list(getattr(self, '_ephemeral_flush', {}).values())
+        for task in tasks:
+            if task is not None:
+                task.cancel()
         if hasattr(self, 'group_name'):
             await self.channel_layer.group_discard(self.group_name, self.channel_name)
+            for group in getattr(self, '_topics', ()):
+                await self.channel_layer.group_discard(group, self.channel_name)
+            try:
+                await sync_to_async(presence.get_registry().remove, thread_sensitive=False)(self.user.id, self.channel_name)
+            except Exception:
+                pass
         try:
             if settings.DEBUG:
                 logging.getLogger('chat').info('WS disconnect code=%s channel=%s', code, self.channel_name)
         except Exception:
             pass
 
+    async def receive(self, text_data=None, bytes_data=None, **kwargs):
+        size = len(text_data.encode('utf-8')) if text_data is not None else len(bytes_data or b'')
+        if size > getattr(settings, 'CHAT_MAX_FRAME_BYTES', 16 * 1024):
+            metrics.incr('frames_too_large')
+            await self.send_json({'type': 'error', 'code': 'frame_too_large', 'message': 'Mensagem muito grande'})
+            await self._close_with(1009, 'closed_frame_too_large')
+            return
+        try:
+            content = self._codec.decode(text_data if text_data is not None else bytes_data)
+        except Exception:
+            content = None
+        if isinstance(content, dict) and content.get('type') in EPHEMERAL_EVENTS:
+            # typing & co. have their own, larger bucket and are dropped silently
+            if self._ephemeral_bucket.take():
+                await self.relay_ephemeral(content)
+            else:
+                metrics.incr('ephemeral_throttled')
+            return
+        if not self._bucket.take():
+            metrics.incr('frames_throttled')
+            self._violations += 1
+            if self._violations > getattr(settings, 'CHAT_MAX_RATE_VIOLATIONS', 50):
+                await self._close_with(1008, 'closed_rate_limit')
+            elif self._violations == 1 or self._violations % 10 == 0:
+                # avisa sem responder a cada frame descartado
+                await self.send_json({'type': 'error', 'code': 'rate_limited', 'message': 'Muitas mensagens, aguarde'})
+            return
+        self._violations = 0
+        if not isinstance(content, dict):
+            metrics.incr('frames_invalid')
+            await self.send_json({'type': 'error', 'code': 'invalid_frame', 'message': 'JSON inválido'})
+            return
+        await self.receive_json(content, **kwargs)
+
+    async def relay_ephemeral(self, content):
+        """
+        Relay typing / stop_typing / viewing to the other participant: channel
+        layer only, nothing persisted, no notification or push. Coalesced to
+        one event per CHAT_EPHEMERAL_INTERVAL per sender and recipient; an
+        event arriving inside the window replaces the pending one, which goes
+        out when the window ends (so a stop_typing right after typing is never
+        lost).
+        """
+        try:
+            to_id = int(content.get('to'))
+        except (TypeError, ValueError):
+            return
+        if to_id == self.user.id:
+            return
+        event = {'event': content['type'], 'to': to_id}
+        if content['type'] == 'viewing':
+            try:
+                event['imovel_id'] = int(content.get('imovel_id'))
+            except (TypeError, ValueError):
+                return
+        interval = getattr(settings, 'CHAT_EPHEMERAL_INTERVAL', 1.0)
+        wait = (self._ephemeral_sent_at.get(to_id) or 0.0) + interval - time.monotonic()
+        if wait <= 0 and to_id not in self._ephemeral_flush:
+            await self._send_ephemeral(event)
+            return
+        if to_id in self._ephemeral_pending:
+            metrics.incr('ephemeral_coalesced')
+        self._ephemeral_pending[to_id] = event
+        if to_id not in self._ephemeral_flush:
+            self._ephemeral_flush[to_id] = asyncio.ensure_future(self._flush_ephemeral(to_id, max(wait, 0)))
+
+    async def _flush_ephemeral(self, to_id, delay):
+        try:
+            await asyncio.sleep(delay)
+            event = self._ephemeral_pending.pop(to_id, None)
+            if event is not None:
+                await self._send_ephemeral(event)
+        finally:
+            self._ephemeral_flush.pop(to_id, None)
+
+    async def _send_ephemeral(self, event):
+        self._ephemeral_sent_at.put(event['to'], time.monotonic())
+        # only between users that already talk to each other (read-only check)
+        found = await self._find_conversation(event['to'])
+        if found is None:
+            return
+        conv = found[0]
+        signal = {
+            'type': 'chat.signal',
+            'event': event['event'],
+            'from': self.user.id,
+            'conversation': conv.id,
+            # clients clear typing indicators by themselves after this
+            'expires_in': EPHEMERAL_TTL,
+        }
+        if 'imovel_id' in event:
+            signal['imovel_id'] = event['imovel_id']
+        await self.channel_layer.group_send(f"user_{event['to']}", signal)
+
+    async def send_json(self, content, close=False):
+        """Queue the frame; a connection whose queue fills up is too slow and gets closed."""
+        queue = getattr(self, '_outbound', None)
+        if queue is None:
+            return await super().send_json(content, close=close)
+        if getattr(self, '_closing', False):
+            metrics.incr('frames_dropped')
+            return
+        try:
+            queue.put_nowait(self._codec.encode(content))
+        except asyncio.QueueFull:
+            metrics.incr('frames_dropped')
+            await self._close_with(1013, 'closed_slow_consumer')
+            return
+        if close:
+            await self._close_with(close if close is not True else None, None)
+
+    async def _drain_outbound(self):
+        while True:
+            item = await self._outbound.get()
+            if isinstance(item, tuple):
+                # ('close', code) queued behind the frames that must go out first
+                await self.close(item[1])
+                return
+            if isinstance(item, bytes):
+                await AsyncJsonWebsocketConsumer.send(self, bytes_data=item)
+            else:
+                await AsyncJsonWebsocketConsumer.send(self, text_data=item)
+            self._outbound.task_done()
+
+    async def _close_with(self, code, metric):
+        if getattr(self, '_closing', False):
+            return
+        self._closing = True
+        if metric:
+            metrics.incr(metric)
+        try:
+            if settings.DEBUG and metric:
+                logging.getLogger('chat').warning('WS %s user=%s channel=%s', metric, getattr(self.user, 'id', None), self.channel_name)
+        except Exception:
+            pass
+        try:
+            self._outbound.put_nowait(('close', code))
+        except (AttributeError, asyncio.QueueFull):
+            # slow consumer: nothing more goes out, close right away
+            await self.close(code)
+
     async def receive_json(self, content, **kwargs):
         # expected: action payload
         # {"type":"message","to":123,"text":"hello"}
         # or {"type":"message","to":123,"message_type":"imovel","data":{"imovel_id":1}}
         action = content.get('type')
+        if action == 'ping':
+            # client heartbeat; the server loop keeps presence alive anyway
+            await self._touch_presence()
+            await self.send_json({'type': 'pong'})
+            return
+        if action == 'auth':
+            await self.reauthenticate(content.get('token'))
+            return
+        if action in ('subscribe', 'unsubscribe'):
+            await self.set_topic(content.get('topic'), action == 'subscribe')
+            return
+        if action == 'read':
+            await self.mark_read(content.get('conversation'), content.get('message_id'))
+            return
         if action == 'message':
             to_id = content.get('to')
             text = content.get('text')
@@ -64,27 +276,28 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
                 pass
             if not to_id:
                 return
+            if text is not None and not isinstance(text, str):
+                metrics.incr('frames_invalid')
+                await self.send_json({'type': 'error', 'code': 'invalid_frame', 'message': 'JSON inválido'})
+                return
             if message_type == 'text' and not text:
                 return
+            if text and len(text) > getattr(settings, 'CHAT_MAX_TEXT_LENGTH', 4000):
+                metrics.incr('texts_too_long')
+                await self.send_json({'type': 'error', 'code': 'text_too_long', 'message': 'Mensagem muito longa'})
+                return
             # save message via sync function
             message_data = await self.create_message(self.user.id, to_id, text or '', message_type, data)
             # Verificar se houve erro na validação
             if message_data.get('error'):
                 await self.send_json({'type': 'error', 'message': message_data.get('error')})
                 return
-            # send to recipient group
-            await self.channel_layer.group_send(
-                f'user_{to_id}',
-                {
-                    'type': 'chat.message',
-                    'message': message_data,
-                }
-            )
+            # send to recipient group (sequenced, so an offline device gets it on resume)
+            await replay.apublish(to_id, {'type': 'chat.message', 'message': message_data}, self.channel_layer)
             # also echo back to sender
             await self.send_json({'type': 'message_sent', 'message': message_data})
-            # try to send push notification to recipient
+            # push only if the recipient has no open socket (rate-limited per conversation)
             try:
-                recipient = await database_sync_to_async(User.objects.get)(id=to_id)
                 body = 'te enviou uma mensagem'
                 if message_type == 'imovel':
                     body = 'enviou um imóvel'
@@ -93,8 +306,9 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
                     data = content.get('data') or {}
                     if isinstance(data, dict) and data.get('imovel_id'):
                         payload['imovel'] = data.get('imovel_id')
-                await sync_to_async(send_fcm_to_user, thread_sensitive=False)(
-                    recipient,
+                await sync_to_async(presence.push_unless_online, thread_sensitive=False)(
+                    to_id,
+                    chave_chat(message_data.get('conversation'), self.user.id),
                     'Nova mensagem',
                     f'{self.user} {body}',
                     payload
@@ -102,31 +316,270 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             except Exception:
                 pass
 
+    async def _touch_presence(self):
+        try:
+            await sync_to_async(presence.get_registry().touch, thread_sensitive=False)(self.user.id, self.channel_name)
+        except Exception:
+            pass
+
+    async def _presence_heartbeat(self):
+        # refresh well before the TTL runs out; dies with the worker
+        interval = max(presence.presence_ttl() / 3, 1)
+        while True:
+            await asyncio.sleep(interval)
+            await self._touch_presence()
+            await self._check_token_expiry()
+
+    async def _check_token_expiry(self):
+        """
+        Cheap re-check of the handshake token (its ``exp`` is in the scope):
+        warn once with ``token_expired`` so the client can send a fresh token
+        (``{"type": "auth", "token": ...}``); close only after
+        WS_TOKEN_EXPIRY_GRACE seconds, if that is set.
+        """
+        exp = self.scope.get('token_exp')
+        if not exp or time.time() < exp:
+            return
+        if not getattr(self, '_token_expired_sent', False):
+            self._token_expired_sent = True
+            await self.send_json({'type': 'token_expired'})
+        grace = getattr(settings, 'WS_TOKEN_EXPIRY_GRACE', None)
+        if grace is not None and time.time() >= exp + grace:
+            await self._close_with(4001, 'closed_token_expired')
+
+    async def reauthenticate(self, token):
+        """
+        ``{"type": "auth", "token": <access>}``: same checks as the handshake
+        (access token only, same user, ``ver`` still the user's token_version).
+        """
+        from rest_framework_simplejwt.settings import api_settings
+        from rest_framework_simplejwt.tokens import AccessToken
+        from usuarios import cache_auth
+        from usuarios.tokens import versao
+
+        user = None
+        try:
+            validated = AccessToken(token)
+            if int(validated[api_settings.USER_ID_CLAIM]) == self.user.id:
+                user = await database_sync_to_async(cache_auth.obter)(self.user.id, versao(validated))
+        except Exception:
+            user = None
+        if user is None:
+            await self.send_json({'type': 'error', 'code': 'invalid_token', 'message': 'Token inválido'})
+            return
+        self.user = self.scope['user'] = user
+        self.scope['token_exp'] = validated.get('exp')
+        self._token_expired_sent = False
+        await self.send_json({'type': 'auth_ok', 'exp': validated.get('exp')})
+
+    def _since_param(self):
+        query_string = self.scope.get('query_string', b'')
+        if b'since=' not in query_string:
+            return None
+        try:
+            return int(urllib.parse.parse_qs(query_string.decode()).get('since', [''])[0])
+        except (TypeError, ValueError):
+            return None
+
+    async def resume(self, since):
+        """
+        Replay the events after ``since`` from the user's buffer and answer with
+        ``resume`` (everything replayed) or ``resync`` (part of it was evicted:
+        the client fetches ``GET sync/?after=<last message id>`` instead).
+        Both carry the current ``seq``; live events up to it are not repeated.
+        """
+        if since is None or since < 0:
+            return
+        try:
+            current, events = await sync_to_async(replay.get_buffer().since, thread_sensitive=False)(self.user.id, since)
+        except Exception:
+            current, events = None, None
+        if events is None:
+            metrics.incr('resyncs')
+            await self.send_json({'type': 'resync', 'since': since, 'seq': current})
+            return
+        # in slices that fit the outbound queue, waiting for the writer in between:
+        # a long gap must not look like a slow consumer (and close with 1013)
+        room = max(self._outbound.maxsize // 2, 1) if self._outbound.maxsize > 0 else None
+        for n, event in enumerate(events):
+            if room and n and n % room == 0:
+                await self._outbound.join()
+            if getattr(self, '_closing', False):
+                return
+            await self.dispatch(event)
+        self._seq_floor = max(since, current)
+        metrics.incr('events_replayed', len(events))
+        await self.send_json({'type': 'resume', 'since': since, 'seq': current, 'replayed': len(events)})
+
+    def _stale(self, event):
+        # already replayed on resume; the live copy arrives right after connect
+        seq = event.get('seq')
+        return seq is not None and seq <= getattr(self, '_seq_floor', 0)
+
+    def _with_seq(self, frame, event):
+        if event.get('seq') is not None:
+            frame['seq'] = event['seq']
+        return frame
+
     async def chat_message(self, event):
-        await self.send_json({'type': 'message', 'message': event['message']})
+        if self._stale(event):
+            return
+        await self.send_json(self._with_seq({'type': 'message', 'message': event['message']}, event))
+
+    async def chat_signal(self, event):
+        # ephemeral event from the other participant (typing, viewing...)
+        frame = {k: v for k, v in event.items() if k not in ('type', 'event')}
+        frame['type'] = event.get('event')
+        await self.send_json(frame)
+
+    async def chat_read(self, event):
+        # read receipt: the peer (or another device of ours) moved its cursor
+        if self._stale(event):
+            return
+        await self.send_json(self._with_seq({
+            'type': 'read',
+            'conversation': event.get('conversation'),
+            'reader': event.get('reader'),
+            'last_read_id': event.get('last_read_id'),
+            'unread_count': event.get('unread_count') if event.get('reader') == self.user.id else None,
+        }, event))
+
+    async def mark_read(self, conversation_id, message_id=None):
+        try:
+            conversation_id = int(conversation_id)
+            message_id = int(message_id) if message_id not in (None, '') else None
+        except (TypeError, ValueError):
+            await self.send_json({'type': 'error', 'message': 'Conversa inválida'})
+            return
+        result = await self._mark_read(conversation_id, message_id)
+        if result is None:
+            await self.send_json({'type': 'error', 'message': 'Conversa não encontrada'})
+            return
+        last_read_id, unread_count, user_ids = result
+        event = receipts.read_event(conversation_id, self.user.id, last_read_id, unread_count)
+        for user_id in user_ids:
+            await replay.apublish(user_id, event, self.channel_layer)
+        if not user_ids:
+            # cursor did not move; still answer so the client can settle its badge
+            await self.chat_read(event)
+
+    @database_sync_to_async
+    def _mark_read(self, conversation_id, message_id):
+        from .models import Conversation
+
+        conv = Conversation.objects.filter(pk=conversation_id, participants=self.user.id).first()
+        if conv is None:
+            return None
+        return receipts.mark_read(conv, self.user.id, message_id)
+
+    async def set_topic(self, topic, subscribe):
+        """
+        Join/leave a listing topic (``imovel:<id>``) on this socket; updates
+        arrive as ``imovel`` frames next to chat and notifications.
+        """
+        parsed = topic_group(topic)
+        if parsed is None:
+            await self.send_json({'type': 'error', 'code': 'invalid_topic', 'message': 'Tópico inválido'})
+            return
+        group, imovel_id = parsed
+        if subscribe and group not in self._topics:
+            if len(self._topics) >= getattr(settings, 'CHAT_MAX_TOPICS', 20):
+                await self.send_json({'type': 'error', 'code': 'too_many_topics', 'message': 'Muitos tópicos assinados'})
+                return
+            from propriedades.models import Propriedade
+            if not await Propriedade.objects.filter(id=imovel_id).aexists():
+                await self.send_json({'type': 'error', 'code': 'invalid_topic', 'message': 'Imóvel não encontrado'})
+                return
+            await self.channel_layer.group_add(group, self.channel_name)
+            self._topics.add(group)
+        elif not subscribe and group in self._topics:
+            await self.channel_layer.group_discard(group, self.channel_name)
+            self._topics.discard(group)
+        await self.send_json({'type': 'subscribed' if subscribe else 'unsubscribed', 'topic': f'imovel:{imovel_id}'})
+
+    async def imovel_update(self, event):
+        # listing update (coalesced per topic by propriedades.tempo_real)
+        imovel = event.get('imovel') or {}
+        await self.send_json({
+            'type': 'imovel',
+            'topic': f"imovel:{imovel.get('id')}",
+            'imovel': imovel,
+            'changes': event.get('changes') or [],
+        })
 
     async def notification(self, event):
         # Forward notification events sent to the user's group to the websocket client
+        if self._stale(event):
+            return
         try:
-            await self.send_json({'type': 'notification', 'notification': event.get('notification')})
+            await self.send_json(self._with_seq({'type': 'notification', 'notification': event.get('notification')}, event))
         except Exception:
             pass
 
-    @database_sync_to_async
-    def create_message(self, sender_id, recipient_id, text, message_type='text', data=None):
-        from .models import Message, Conversation
-        from usuarios.models import Usuario
+    async def notification_batch(self, event):
+        # Several notifications in one group send; clients still get one frame each
+        if self._stale(event):
+            return
+        try:
+            for notification in event.get('notifications') or []:
+                await self.send_json(self._with_seq({'type': 'notification', 'notification': notification}, event))
+        except Exception:
+            pass
+
+    def _cache_size(self):
+        return getattr(settings, 'CHAT_CONNECTION_CACHE_SIZE', 64)
+
+    async def _find_conversation(self, recipient_id):
+        """Cached (conversation, recipient) if the pair already talks; read-only."""
+        from .models import Conversation
+
+        cached = self._conversations.get(recipient_id)
+        if cached is not None:
+            return cached
+        low, high = Conversation.objects.pair_key(self.user.id, recipient_id)
+        conv = await (
+            Conversation.objects.select_related('user_low', 'user_high')
+            .filter(user_low_id=low, user_high_id=high)
+            .afirst()
+        )
+        if conv is None:
+            return None
+        recipient = conv.user_high if conv.user_low_id == self.user.id else conv.user_low
+        self._conversations.put(recipient_id, (conv, recipient))
+        return conv, recipient
+
+    async def _resolve_conversation(self, recipient_id):
+        """
+        (conversation, recipient) for a direct chat, cached per connection.
+
+        An existing conversation costs one query (the pair index with both
+        users joined); a brand new one needs the recipient lookup plus the
+        create. Raises User.DoesNotExist for an unknown recipient.
+        """
+        from .models import Conversation
+
+        found = await self._find_conversation(recipient_id)
+        if found is not None:
+            return found
+        recipient = await User.objects.aget(id=recipient_id)
+        conv, _ = await database_sync_to_async(Conversation.objects.get_or_create_direct)(self.user.id, recipient.id)
+        self._conversations.put(recipient_id, (conv, recipient))
+        return conv, recipient
+
+    async def create_message(self, sender_id, recipient_id, text, message_type='text', data=None):
+        sender = self.user
+        try:
+            recipient_id = int(recipient_id)
+        except (TypeError, ValueError):
+            return {'error': 'Destinatário inválido', 'id': None}
 
-        sender = Usuario.objects.get(id=sender_id)
-        recipient = Usuario.objects.get(id=recipient_id)
-        
         # Validação: se for tipo 'imovel', verificar se existe
         if message_type == 'imovel' and isinstance(data, dict):
             imovel_id = data.get('imovel_id')
             if imovel_id:
                 try:
                     from propriedades.models import Propriedade
-                    if not Propriedade.objects.filter(id=imovel_id).exists():
+                    if not await Propriedade.objects.filter(id=imovel_id).aexists():
                         # Retornar mensagem de erro sem criar
                         return {
                             'error': 'Imóvel não encontrado',
@@ -134,25 +587,21 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
                         }
                 except Exception:
                     pass  # Se modelo não existe, continuar
-        
-        conv = Conversation.objects.filter(participants=sender).filter(participants=recipient).first()
-        if not conv:
-            conv = Conversation.objects.create()
-            conv.participants.add(sender)
-            conv.participants.add(recipient)
-        msg = Message.objects.create(
-            conversation=conv,
-            sender=sender,
-            recipient=recipient,
-            text=text or '',
-            type=message_type,
-            data=data,
-        )
+
         try:
-            from notificacoes.models import Notificacao
-            Notificacao.objects.create(usuario=recipient, mensagem=f'{sender} te enviou uma mensagem')
-        except Exception:
-            pass
+            conv, recipient = await self._resolve_conversation(recipient_id)
+        except User.DoesNotExist:
+            return {'error': 'Destinatário não encontrado', 'id': None}
+        try:
+            msg = await self._save_message(conv, sender, recipient, text, message_type, data)
+        except IntegrityError:
+            # cached conversation/recipient went away; resolve again once
+            self._conversations.pop(recipient_id)
+            try:
+                conv, recipient = await self._resolve_conversation(recipient_id)
+            except User.DoesNotExist:
+                return {'error': 'Destinatário não encontrado', 'id': None}
+            msg = await self._save_message(conv, sender, recipient, text, message_type, data)
         return {
             'id': msg.id,
             'conversation': conv.id,
@@ -163,3 +612,80 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             'data': getattr(msg, 'data', None),
             'created_at': msg.created_at.isoformat(),
         }
+
+    @database_sync_to_async
+    def _save_message(self, conv, sender, recipient, text, message_type, data):
+        # insert + notificação agregada num só salto para a thread do ORM
+        # (criar_ou_agregar precisa de transação, que o ORM async não tem)
+        from .models import Message
+
+        # atomic: a stale cached FK fails here (IntegrityError) instead of at commit
+        with transaction.atomic():
+            msg = Message.objects.create(
+                conversation=conv,
+                sender=sender,
+                recipient=recipient,
+                text=text or '',
+                type=message_type,
+                data=data,
+            )
+        try:
+            criar_ou_agregar(
+                recipient.id,
+                chave_chat(conv.id, sender.id),
+                f'{sender} te enviou uma mensagem',
+                mensagem_agregada=lambda n: f'{sender} te enviou {n} mensagens',
+            )
+        except Exception:
+            pass
+        return msg
+
+
+class _TokenBucket:
+    """``rate`` frames per second with bursts up to ``burst``; rate 0 disables."""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate or 0)
+        self.capacity = float(max(burst or 0, 1))
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+
+    def take(self, n=1):
+        if not self.rate:
+            return True
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= n:
+            self.tokens -= n
+            return True
+        return False
+
+
+class _LRU:
+    """Small per-connection LRU map (keeps the ``maxsize`` most recent keys)."""
+
+    def __init__(self, maxsize):
+        self.maxsize = max(int(maxsize or 0), 0)
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        try:
+            self._data.move_to_end(key)
+        except KeyError:
+            return None
+        return self._data[key]
+
+    def put(self, key, value):
+        if not self.maxsize:
+            return
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        return self._data.pop(key, None)
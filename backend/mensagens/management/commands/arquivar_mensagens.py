@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from mensagens import archive
+
+
+class Command(BaseCommand):
+    help = (
+        'Move o histórico de conversas paradas há N meses para o arquivo '
+        'compactado (ArchivedMessageChunk), em blocos de no máximo um mês. '
+        'A última mensagem de cada conversa continua na tabela quente. '
+        'Rode periodicamente (ex.: cron semanal).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--meses', type=int, default=None,
+                            help='Meses sem atividade (padrão: MESSAGE_ARCHIVE_AFTER_MONTHS)')
+        parser.add_argument('--lote', type=int, default=None,
+                            help='Mensagens por bloco (padrão: MESSAGE_ARCHIVE_CHUNK_SIZE)')
+
+    def handle(self, *args, **options):
+        resultado = archive.archive_inactive(months=options['meses'], chunk_size=options['lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{resultado['messages']} mensagem(ns) arquivada(s) de {resultado['conversations']} conversa(s)"
+        ))
@@ -0,0 +1,26 @@
+"""Per-worker counters for the chat WebSocket (throttled/dropped frames etc.).
+
+Cheap in-process counters; each worker reports its own numbers (see
+``GET /mensagens/ws-metrics/``, staff only).
+"""
+import os
+import threading
+from collections import Counter
+
+_counters = Counter()
+_lock = threading.Lock()
+
+
+def incr(name, n=1):
+    with _lock:
+        _counters[name] += n
+
+
+def snapshot():
+    with _lock:
+        return {'pid': os.getpid(), 'counters': dict(_counters)}
+
+
+def reset():
+    with _lock:
+        _counters.clear()
@@ -0,0 +1,80 @@
+# Generated by Django 5.0.4 on 2026-10-19 18:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models, transaction
+
+CHUNK = 500
+
+
+def merge_duplicate_conversations(apps, schema_editor):
+    """Fill the pair key and fold duplicate direct conversations into the oldest one."""
+    Conversation = apps.get_model('mensagens', 'Conversation')
+    Message = apps.get_model('mensagens', 'Message')
+    Participants = Conversation.participants.through
+    MutedBy = Conversation.muted_by.through
+    DeletedBy = Conversation.deleted_by.through
+
+    members = {}
+    rows = Participants.objects.order_by('conversation_id').values_list('conversation_id', 'usuario_id')
+    for conv_id, user_id in rows.iterator(chunk_size=2000):
+        members.setdefault(conv_id, set()).add(user_id)
+
+    by_pair = {}
+    for conv_id, users in members.items():
+        if len(users) == 2:
+            by_pair.setdefault(tuple(sorted(users)), []).append(conv_id)
+
+    pairs = list(by_pair.items())
+    for i in range(0, len(pairs), CHUNK):
+        with transaction.atomic():
+            for (low, high), conv_ids in pairs[i:i + CHUNK]:
+                keep, *duplicates = sorted(conv_ids)
+                if duplicates:
+                    Message.objects.filter(conversation_id__in=duplicates).update(conversation_id=keep)
+                    # muted on any copy stays muted
+                    muted = set(
+                        MutedBy.objects.filter(conversation_id__in=conv_ids).values_list('usuario_id', flat=True)
+                    )
+                    MutedBy.objects.filter(conversation_id=keep).delete()
+                    MutedBy.objects.bulk_create([MutedBy(conversation_id=keep, usuario_id=u) for u in muted])
+                    # hidden only if the user had deleted every copy
+                    hidden = set(
+                        DeletedBy.objects.filter(conversation_id=keep).values_list('usuario_id', flat=True)
+                    )
+                    for dup in duplicates:
+                        hidden &= set(
+                            DeletedBy.objects.filter(conversation_id=dup).values_list('usuario_id', flat=True)
+                        )
+                    DeletedBy.objects.filter(conversation_id=keep).exclude(usuario_id__in=hidden).delete()
+                    Conversation.objects.filter(id__in=duplicates).delete()
+                Conversation.objects.filter(id=keep).update(user_low_id=low, user_high_id=high)
+
+
+class Migration(migrations.Migration):
+
+    # duplicates are merged in chunks, each in its own transaction
+    atomic = False
+
+    dependencies = [
+        ('mensagens', '0002_conversation_flags_message_extras'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='user_high',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='user_low',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(merge_duplicate_conversations, reverse_code=migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.UniqueConstraint(fields=('user_low', 'user_high'), name='unique_direct_conversation_pair'),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.0.4 on 2026-10-19 18:12
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Max
+
+CHUNK = 500
+
+
+def backfill_last_message(apps, schema_editor):
+    Conversation = apps.get_model('mensagens', 'Conversation')
+    Message = apps.get_model('mensagens', 'Message')
+    Conversation.objects.update(last_activity_at=F('created_at'))
+    last_ids = list(
+        Message.objects.filter(conversation__isnull=False)
+        .values_list('conversation_id')
+        .annotate(last=Max('id'))
+        .order_by()
+    )
+    for i in range(0, len(last_ids), CHUNK):
+        chunk = dict(last_ids[i:i + CHUNK])
+        messages = Message.objects.in_bulk(list(chunk.values()))
+        conversations = Conversation.objects.in_bulk(list(chunk.keys()))
+        for conv_id, msg_id in chunk.items():
+            conv, msg = conversations[conv_id], messages[msg_id]
+            conv.last_message_id = msg.id
+            conv.last_message_preview = (msg.text or '')[:255]
+            conv.last_activity_at = msg.created_at
+        Conversation.objects.bulk_update(
+            conversations.values(), ['last_message', 'last_message_preview', 'last_activity_at']
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mensagens', '0003_conversation_pair_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='last_activity_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='mensagens.message'),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_preview',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.CreateModel(
+            name='ParticipantState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='participant_states', to='mensagens.conversation')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversation_states', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='participantstate',
+            constraint=models.UniqueConstraint(fields=('conversation', 'user'), name='unique_participant_state'),
+        ),
+        migrations.RunPython(backfill_last_message, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.4 on 2026-10-19 18:21
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_read_cursors(apps, schema_editor):
+    # participants with nothing unread have read up to the newest message
+    Conversation = apps.get_model('mensagens', 'Conversation')
+    ParticipantState = apps.get_model('mensagens', 'ParticipantState')
+    newest = Conversation.objects.filter(pk=OuterRef('conversation_id')).values('last_message_id')[:1]
+    ParticipantState.objects.filter(unread_count=0).update(last_read_id=Coalesce(Subquery(newest), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mensagens', '0005_message_history_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='participantstate',
+            name='last_read_id',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_read_cursors, migrations.RunPython.noop),
+    ]
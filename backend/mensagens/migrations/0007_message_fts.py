@@ -0,0 +1,64 @@
+# Full-text index over Message.text, maintained by the database itself:
+# SQLite -> FTS5 external-content table kept in sync by triggers;
+# PostgreSQL -> generated tsvector column with a GIN index.
+# Other backends get nothing and search falls back to icontains.
+
+from django.db import migrations
+
+SQLITE_FORWARD = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS mensagens_message_fts USING fts5(
+        text, content='mensagens_message', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS mensagens_message_fts_ai AFTER INSERT ON mensagens_message BEGIN
+        INSERT INTO mensagens_message_fts(rowid, text) VALUES (new.id, new.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS mensagens_message_fts_ad AFTER DELETE ON mensagens_message BEGIN
+        INSERT INTO mensagens_message_fts(mensagens_message_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS mensagens_message_fts_au AFTER UPDATE OF text ON mensagens_message BEGIN
+        INSERT INTO mensagens_message_fts(mensagens_message_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        INSERT INTO mensagens_message_fts(rowid, text) VALUES (new.id, new.text);
+    END""",
+    # index the messages that already exist
+    "INSERT INTO mensagens_message_fts(mensagens_message_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS mensagens_message_fts_au',
+    'DROP TRIGGER IF EXISTS mensagens_message_fts_ad',
+    'DROP TRIGGER IF EXISTS mensagens_message_fts_ai',
+    'DROP TABLE IF EXISTS mensagens_message_fts',
+]
+
+POSTGRES_FORWARD = [
+    """ALTER TABLE mensagens_message ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('portuguese', coalesce(text, ''))) STORED""",
+    'CREATE INDEX IF NOT EXISTS mensagens_message_search_idx ON mensagens_message USING GIN (search_vector)',
+]
+
+POSTGRES_BACKWARD = [
+    'DROP INDEX IF EXISTS mensagens_message_search_idx',
+    'ALTER TABLE mensagens_message DROP COLUMN IF EXISTS search_vector',
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for sql in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mensagens', '0006_participantstate_read_cursor'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            _run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRES_BACKWARD}),
+        ),
+    ]
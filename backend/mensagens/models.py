@@ -1,18 +1,128 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.conf import settings
-from django.db.models import JSONField
+from django.db.models import Count, F, JSONField, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+class ConversationManager(models.Manager):
+    @staticmethod
+    def pair_key(user_a_id, user_b_id):
+        """Canonical (low, high) ordering of a direct conversation's user ids."""
+        a, b = int(user_a_id), int(user_b_id)
+        return (a, b) if a <= b else (b, a)
+
+    def find_direct(self, user_a_id, user_b_id):
+        low, high = self.pair_key(user_a_id, user_b_id)
+        return self.filter(user_low_id=low, user_high_id=high).first()
+
+    def get_or_create_direct(self, user_a_id, user_b_id):
+        """Single index lookup; safe against two first messages racing each other."""
+        low, high = self.pair_key(user_a_id, user_b_id)
+        conv = self.filter(user_low_id=low, user_high_id=high).first()
+        if conv:
+            return conv, False
+        try:
+            with transaction.atomic():
+                conv = self.create(user_low_id=low, user_high_id=high)
+                conv.participants.add(low, high)
+            return conv, True
+        except IntegrityError:
+            # the other request won; use its conversation
+            return self.get(user_low_id=low, user_high_id=high), False
 
 
 class Conversation(models.Model):
     # lightweight: conversation between two users; extend later
     participants = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='conversations')
+    # canonical pair for direct conversations (user_low_id < user_high_id); null for other kinds
+    user_low = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='+', on_delete=models.CASCADE, null=True, blank=True)
+    user_high = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='+', on_delete=models.CASCADE, null=True, blank=True)
     muted_by = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='muted_conversations', blank=True)
     deleted_by = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='deleted_conversations', blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # denormalized from the newest message so the list needs no per-row queries
+    last_message = models.ForeignKey('Message', related_name='+', on_delete=models.SET_NULL, null=True, blank=True)
+    last_message_preview = models.CharField(max_length=255, blank=True, default='')
+    # last message time, or creation time while empty; orders the conversation list
+    last_activity_at = models.DateTimeField(default=timezone.now, db_index=True)
+    # newest message id moved to cold storage (ArchivedMessageChunk); 0 = nothing archived
+    archived_until_id = models.PositiveBigIntegerField(default=0)
+
+    objects = ConversationManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_low', 'user_high'], name='unique_direct_conversation_pair'),
+        ]
 
     def __str__(self):
         return f'Conversation {self.id}'
 
+    def register_message(self, message):
+        """Update the denormalized last-message fields and the recipient's unread count."""
+        preview = (message.text or '')[:255]
+        Conversation.objects.filter(pk=self.pk).update(
+            last_message=message, last_message_preview=preview, last_activity_at=message.created_at,
+        )
+        self.last_message, self.last_message_preview, self.last_activity_at = message, preview, message.created_at
+        ParticipantState.objects.bulk_create(
+            [ParticipantState(conversation_id=self.pk, user_id=message.recipient_id)], ignore_conflicts=True
+        )
+        ParticipantState.objects.filter(conversation_id=self.pk, user_id=message.recipient_id).update(
+            unread_count=F('unread_count') + 1
+        )
+
+    def peer_ids(self, user_id):
+        """Ids of the other participants (no query for direct conversations)."""
+        if self.user_low_id:
+            return [uid for uid in (self.user_low_id, self.user_high_id) if uid != user_id]
+        return list(self.participants.exclude(id=user_id).values_list('id', flat=True))
+
+    def mark_read(self, user_id, message_id=None):
+        """
+        Move ``user_id``'s read cursor forward to ``message_id`` (default: the
+        newest message) and re-derive the unread count in the same UPDATE.
+
+        Returns ``(last_read_id, unread_count, moved)``; cursors never move back.
+        """
+        newest = self.last_message_id or 0
+        target = newest if message_id is None else min(int(message_id), newest)
+        ParticipantState.objects.bulk_create(
+            [ParticipantState(conversation_id=self.pk, user_id=user_id)], ignore_conflicts=True
+        )
+        states = ParticipantState.objects.filter(conversation_id=self.pk, user_id=user_id)
+        moved = 0
+        if target:
+            if target >= newest:
+                unread = Value(0)
+            else:
+                # index range (conversation, id > cursor); only the still-unread tail
+                unread = Coalesce(Subquery(
+                    Message.objects.filter(conversation_id=self.pk, recipient_id=user_id, id__gt=target)
+                    .order_by().values('conversation').annotate(n=Count('id')).values('n')[:1]
+                ), 0)
+            moved = states.filter(last_read_id__lt=target).update(last_read_id=target, unread_count=unread)
+        last_read_id, unread_count = states.values_list('last_read_id', 'unread_count').first() or (0, 0)
+        return last_read_id, unread_count, bool(moved)
+
+
+class ParticipantState(models.Model):
+    """Per-participant state of a conversation (read cursor and unread count)."""
+    conversation = models.ForeignKey(Conversation, related_name='participant_states', on_delete=models.CASCADE)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='conversation_states', on_delete=models.CASCADE)
+    unread_count = models.PositiveIntegerField(default=0)
+    # read cursor: id of the newest message this participant has read
+    last_read_id = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['conversation', 'user'], name='unique_participant_state'),
+        ]
+
+    def __str__(self):
+        return f'Conversation {self.conversation_id} / user {self.user_id}'
+
 
 class Message(models.Model):
     conversation = models.ForeignKey(Conversation, related_name='messages', on_delete=models.CASCADE, null=True, blank=True)
@@ -25,6 +135,37 @@ class Message(models.Model):
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # history windows: WHERE conversation_id = ? AND id < ? ORDER BY id DESC
+            models.Index(fields=['conversation', 'id']),
+        ]
 
     def __str__(self):
         return f'Message {self.id} from {self.sender_id} to {self.recipient_id}'
+
+
+class ArchivedMessageChunk(models.Model):
+    """
+    Block of old messages of one conversation, zlib-compressed JSON (cold
+    storage). Blocks never span two calendar months, so ``month`` works as
+    the partition key; ``first_id``/``last_id`` let the history pages find
+    the right blocks without opening the others.
+    """
+    conversation = models.ForeignKey(Conversation, related_name='archived_chunks', on_delete=models.CASCADE)
+    month = models.DateField()
+    first_id = models.BigIntegerField()
+    last_id = models.BigIntegerField()
+    first_at = models.DateTimeField()
+    last_at = models.DateTimeField()
+    count = models.PositiveIntegerField()
+    payload = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['conversation', 'last_id']),
+            models.Index(fields=['month']),
+        ]
+
+    def __str__(self):
+        return f'Conversation {self.conversation_id} archive {self.month:%Y-%m} ({self.count})'
@@ -0,0 +1,192 @@
+"""Who has an open chat WebSocket, shared across ASGI workers.
+
+Every connection registers its channel name under the user with an expiry
+(``CHAT_PRESENCE_TTL`` seconds) and the consumer refreshes it while the
+socket is open. A user is online while at least one registration has not
+expired, so a worker that dies without running ``disconnect`` stops
+counting after one TTL.
+
+The registry lives wherever the channel layer lives: with channels_redis
+it uses the same Redis hosts and prefix (one sorted set per user, spread
+over the hosts by user id); with the in-memory layer it is a dict in this process,
+which is exactly as far as that layer reaches.
+"""
+import math
+import threading
+import time
+import zlib
+
+from django.conf import settings
+
+from notificacoes.agregacao import enviar_push_limitado
+
+
+def presence_ttl():
+    return getattr(settings, 'CHAT_PRESENCE_TTL', 60)
+
+
+class MemoryPresence:
+    def __init__(self):
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    def touch(self, user_id, channel_name, ttl=None):
+        expires = time.monotonic() + (ttl or presence_ttl())
+        with self._lock:
+            self._connections.setdefault(int(user_id), {})[channel_name] = expires
+
+    def remove(self, user_id, channel_name):
+        with self._lock:
+            channels = self._connections.get(int(user_id))
+            if channels is not None:
+                channels.pop(channel_name, None)
+                if not channels:
+                    self._connections.pop(int(user_id), None)
+
+    def counts(self, user_ids):
+        now = time.monotonic()
+        result = {}
+        with self._lock:
+            for user_id in user_ids:
+                channels = self._connections.get(int(user_id)) or {}
+                for channel_name in [c for c, exp in channels.items() if exp <= now]:
+                    channels.pop(channel_name, None)
+                result[int(user_id)] = len(channels)
+        return result
+
+
+class ShardedRedis:
+    """Per-user keys spread over the channel layer's Redis hosts; a user always lands on the same one."""
+
+    def __init__(self, clients, prefix='asgi'):
+        self.clients = clients
+        self.prefix = prefix
+
+    def _client(self, user_id):
+        if len(self.clients) == 1:
+            return self.clients[0]
+        return self.clients[zlib.crc32(str(int(user_id)).encode()) % len(self.clients)]
+
+
+class RedisPresence(ShardedRedis):
+    def _key(self, user_id):
+        return f'{self.prefix}:presence:{int(user_id)}'
+
+    def touch(self, user_id, channel_name, ttl=None):
+        ttl = ttl or presence_ttl()
+        key = self._key(user_id)
+        pipe = self._client(user_id).pipeline(transaction=False)
+        pipe.zadd(key, {channel_name: time.time() + ttl})
+        # the whole set goes away once nobody refreshes it
+        pipe.expire(key, max(math.ceil(ttl * 2), 1))
+        pipe.execute()
+
+    def remove(self, user_id, channel_name):
+        self._client(user_id).zrem(self._key(user_id), channel_name)
+
+    def counts(self, user_ids):
+        now = time.time()
+        by_client = {}
+        for user_id in {int(u) for u in user_ids}:
+            by_client.setdefault(id(self._client(user_id)), (self._client(user_id), []))[1].append(user_id)
+        result = {}
+        for client, ids in by_client.values():
+            pipe = client.pipeline(transaction=False)
+            for user_id in ids:
+                pipe.zremrangebyscore(self._key(user_id), '-inf', now)
+                pipe.zcard(self._key(user_id))
+            replies = pipe.execute()
+            for user_id, count in zip(ids, replies[1::2]):
+                result[user_id] = int(count)
+        return result
+
+
+def _redis_url(host):
+    if isinstance(host, str):
+        return host
+    if isinstance(host, dict):
+        return host.get('address') or 'redis://{}:{}/{}'.format(
+            host.get('host', 'localhost'), host.get('port', 6379), host.get('db', 0)
+        )
+    host, port = host[0], host[1]
+    return f'redis://{host}:{port}/0'
+
+
+def layer_redis():
+    """(clients, prefix) of the channels_redis hosts, or None for other layers."""
+    layer = (getattr(settings, 'CHANNEL_LAYERS', {}) or {}).get('default', {})
+    if not layer.get('BACKEND', '').startswith('channels_redis.'):
+        return None
+    import redis
+
+    config = layer.get('CONFIG') or {}
+    hosts = config.get('hosts') or ['redis://localhost:6379/0']
+    return [redis.Redis.from_url(_redis_url(h)) for h in hosts], config.get('prefix', 'asgi')
+
+
+def layer_signature():
+    layer = (getattr(settings, 'CHANNEL_LAYERS', {}) or {}).get('default', {})
+    return layer.get('BACKEND'), repr(layer.get('CONFIG'))
+
+
+class PerLayer:
+    """Process-wide ``build(layer_redis())``, rebuilt whenever settings.CHANNEL_LAYERS changes."""
+
+    _unset = object()
+
+    def __init__(self, build):
+        self._build = build
+        self._value = None
+        self._signature = self._unset
+        self._lock = threading.Lock()
+
+    def get(self):
+        signature = layer_signature()
+        if self._signature != signature:
+            with self._lock:
+                if self._signature != signature:
+                    self._value = self._build(layer_redis())
+                    self._signature = signature
+        return self._value
+
+
+def _build_registry(redis_layer):
+    if redis_layer is not None:
+        clients, prefix = redis_layer
+        return RedisPresence(clients, prefix=prefix)
+    return MemoryPresence()
+
+
+_registry = PerLayer(_build_registry)
+
+
+def get_registry():
+    """Process-wide presence registry matching settings.CHANNEL_LAYERS."""
+    return _registry.get()
+
+
+def online_users(user_ids):
+    """Subset of ``user_ids`` with at least one live chat connection."""
+    user_ids = [u for u in user_ids if u is not None]
+    if not user_ids:
+        return set()
+    try:
+        counts = get_registry().counts(user_ids)
+    except Exception:
+        # registry down: treat everybody as offline (pushes still go out)
+        return set()
+    return {user_id for user_id, count in counts.items() if count > 0}
+
+
+def is_online(user_id):
+    return int(user_id) in online_users([user_id])
+
+
+def push_unless_online(user_id, key, title, body, data=None):
+    """
+    Chat push only for recipients without an open socket; online ones already
+    got the message through ``chat.message``. Returns whether a push was sent.
+    """
+    if is_online(user_id):
+        return False
+    return enviar_push_limitado(user_id, key, title, body, data)
@@ -0,0 +1,38 @@
+"""Read cursors and read receipts.
+
+Moving a cursor forward relays a ``chat.read`` event to the other
+participants (so the sender can show "read") and to the reader's own
+group (so their other devices clear the badge), through the same
+``user_{id}`` groups the chat already uses. Receipts are sequenced (see
+``replay``) so a device that was offline still learns about them.
+"""
+from . import replay
+
+
+def read_event(conversation_id, reader_id, last_read_id, unread_count):
+    return {
+        'type': 'chat.read',
+        'conversation': conversation_id,
+        'reader': reader_id,
+        'last_read_id': last_read_id,
+        'unread_count': unread_count,
+    }
+
+
+def mark_read(conv, user_id, message_id=None):
+    """
+    Advance the cursor; returns ``(last_read_id, unread_count, user_ids)`` where
+    ``user_ids`` lists who to notify (empty when the cursor did not move).
+    """
+    last_read_id, unread_count, moved = conv.mark_read(user_id, message_id)
+    user_ids = [user_id, *conv.peer_ids(user_id)] if moved else []
+    return last_read_id, unread_count, user_ids
+
+
+def mark_read_and_relay(conv, user_id, message_id=None):
+    """Sync entry point (REST views): advance the cursor and relay the receipt."""
+    last_read_id, unread_count, user_ids = mark_read(conv, user_id, message_id)
+    event = read_event(conv.id, user_id, last_read_id, unread_count)
+    for uid in user_ids:
+        replay.publish(uid, event)
+    return last_read_id, unread_count
@@ -0,0 +1,173 @@
+"""Sequence numbers and a bounded replay buffer for each ``user_{id}`` stream.
+
+Every persistent event sent to a user's group (chat messages, read
+receipts, notifications) is stamped with a per-user, monotonic ``seq`` and
+kept in a buffer of the last CHAT_REPLAY_BUFFER_SIZE events. A client that
+reconnects with ``?since=<seq>`` gets exactly what it missed; when the
+events it needs were already evicted it is told to ``resync`` through REST
+(``GET sync/?after=<message id>``). Ephemeral events (typing...) are not
+sequenced.
+
+Like presence, the buffer lives where the channel layer lives: Redis (a
+counter and a sorted set per user, same hosts and prefix) with
+channels_redis, a dict in this process with the in-memory layer.
+"""
+import json
+import threading
+import time
+from collections import deque
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from . import presence
+
+
+def buffer_size():
+    return getattr(settings, 'CHAT_REPLAY_BUFFER_SIZE', 200)
+
+
+def buffer_ttl():
+    return getattr(settings, 'CHAT_REPLAY_TTL', 24 * 3600)
+
+
+def _missed(current, since, events):
+    """Events after ``since``, or None when some of them are gone."""
+    if since > current:
+        # counter went backwards (buffer expired / store flushed)
+        return None
+    if since == current:
+        return []
+    events = sorted((e for e in events if e['seq'] > since), key=lambda e: e['seq'])
+    if not events or events[0]['seq'] != since + 1:
+        return None
+    return events
+
+
+class MemoryReplay:
+    """Per-process buffer; a stream idle for CHAT_REPLAY_TTL is dropped, like the Redis keys expire."""
+
+    def __init__(self, size=None, ttl=None):
+        self.size = size or buffer_size()
+        self.ttl = ttl or buffer_ttl()
+        self._streams = {}
+        self._swept_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _stream(self, user_id, now):
+        stream = self._streams.get(int(user_id))
+        if stream is not None and now - stream['touched'] > self.ttl:
+            del self._streams[int(user_id)]
+            return None
+        return stream
+
+    def _sweep(self, now):
+        # at most once per ttl: O(streams) walk, amortised over the appends
+        if now - self._swept_at < self.ttl:
+            return
+        self._swept_at = now
+        for uid in [uid for uid, s in self._streams.items() if now - s['touched'] > self.ttl]:
+            del self._streams[uid]
+
+    def append(self, user_id, event):
+        now = time.monotonic()
+        with self._lock:
+            self._sweep(now)
+            stream = self._stream(user_id, now)
+            if stream is None:
+                stream = self._streams[int(user_id)] = {'seq': 0, 'events': deque(maxlen=self.size)}
+            stream['seq'] += 1
+            stream['touched'] = now
+            event = dict(event, seq=stream['seq'])
+            stream['events'].append(event)
+        return event
+
+    def since(self, user_id, seq):
+        """``(current seq, missed events or None)``."""
+        with self._lock:
+            stream = self._stream(user_id, time.monotonic()) or {'seq': 0, 'events': ()}
+            current, events = stream['seq'], list(stream['events'])
+        return current, _missed(current, seq, events)
+
+    def current(self, user_id):
+        with self._lock:
+            return (self._stream(user_id, time.monotonic()) or {}).get('seq', 0)
+
+
+class RedisReplay(presence.ShardedRedis):
+    def __init__(self, clients, prefix='asgi', size=None):
+        super().__init__(clients, prefix=prefix)
+        self.size = size or buffer_size()
+
+    def _keys(self, user_id):
+        return f'{self.prefix}:seq:{int(user_id)}', f'{self.prefix}:replay:{int(user_id)}'
+
+    def append(self, user_id, event):
+        seq_key, buffer_key = self._keys(user_id)
+        client = self._client(user_id)
+        ttl = buffer_ttl()
+        seq = int(client.incr(seq_key))
+        event = dict(event, seq=seq)
+        pipe = client.pipeline(transaction=False)
+        pipe.zadd(buffer_key, {json.dumps(event, cls=DjangoJSONEncoder): seq})
+        pipe.zremrangebyrank(buffer_key, 0, -(self.size + 1))
+        pipe.expire(buffer_key, ttl)
+        pipe.expire(seq_key, ttl)
+        pipe.execute()
+        return event
+
+    def since(self, user_id, seq):
+        seq_key, buffer_key = self._keys(user_id)
+        pipe = self._client(user_id).pipeline(transaction=False)
+        pipe.get(seq_key)
+        pipe.zrangebyscore(buffer_key, f'({int(seq)}', '+inf')
+        current, raw = pipe.execute()
+        current = int(current or 0)
+        return current, _missed(current, seq, [json.loads(item) for item in raw])
+
+    def current(self, user_id):
+        return int(self._client(user_id).get(self._keys(user_id)[0]) or 0)
+
+
+def _build_buffer(redis_layer):
+    if redis_layer is not None:
+        clients, prefix = redis_layer
+        return RedisReplay(clients, prefix=prefix)
+    return MemoryReplay()
+
+
+_buffer = presence.PerLayer(_build_buffer)
+
+
+def get_buffer():
+    """Process-wide replay buffer matching settings.CHANNEL_LAYERS."""
+    return _buffer.get()
+
+
+def stamp(user_id, event):
+    """Copy of ``event`` with the user's next ``seq``, already buffered; unsequenced if the store is down."""
+    try:
+        return get_buffer().append(user_id, event)
+    except Exception:
+        return event
+
+
+def publish(user_id, event):
+    """Sync entry point (views, on_commit hooks): sequence and send to ``user_{id}``."""
+    event = stamp(user_id, event)
+    try:
+        channel_layer = get_channel_layer()
+        if channel_layer is not None:
+            async_to_sync(channel_layer.group_send)(f'user_{user_id}', event)
+    except Exception:
+        pass
+    return event
+
+
+async def apublish(user_id, event, channel_layer=None):
+    event = await sync_to_async(stamp, thread_sensitive=False)(user_id, event)
+    channel_layer = channel_layer or get_channel_layer()
+    await channel_layer.group_send(f'user_{user_id}', event)
+    return event
@@ -0,0 +1,119 @@
+"""Message search over the full-text index created in migration 0007.
+
+SQLite uses the FTS5 table (prefix match on the last word, accents
+ignored), PostgreSQL the generated ``search_vector`` column; any other
+backend falls back to ``icontains`` per word. Messages already moved to
+cold storage are not in the index; on request, ``search_archived`` scans
+a bounded number of archive blocks of the same conversations with the
+SQLite semantics (whole words, prefix on the last one, accents ignored).
+Results are always limited to the caller's own, not-deleted conversations
+and ordered newest first.
+"""
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+
+from . import archive
+from .models import ArchivedMessageChunk, Conversation, Message
+
+MAX_TERMS = 10
+
+
+def terms(query):
+    return re.findall(r'\w+', query or '', flags=re.UNICODE)[:MAX_TERMS]
+
+
+def _fts5_query(words):
+    # every word quoted (no FTS syntax from the user), prefix match on the last
+    quoted = ['"{}"'.format(w.replace('"', '')) for w in words]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def filter_matching(messages, query):
+    words = terms(query)
+    if not words:
+        return messages.none()
+    vendor = connection.vendor
+    if vendor == 'sqlite':
+        hits = RawSQL(
+            'SELECT rowid FROM mensagens_message_fts WHERE mensagens_message_fts MATCH %s',
+            [_fts5_query(words)],
+        )
+        return messages.filter(id__in=hits)
+    if vendor == 'postgresql':
+        return messages.alias(
+            fts_hit=RawSQL(
+                "search_vector @@ websearch_to_tsquery('portuguese', %s)",
+                [' '.join(words)],
+                output_field=BooleanField(),
+            )
+        ).filter(fts_hit=True)
+    for word in words:
+        messages = messages.filter(text__icontains=word)
+    return messages
+
+
+def _conversations(user_id, conversation_id=None):
+    conversations = Conversation.objects.filter(participants=user_id).exclude(deleted_by=user_id)
+    if conversation_id is not None:
+        conversations = conversations.filter(pk=conversation_id)
+    return conversations
+
+
+def search_messages(user_id, query, conversation_id=None):
+    """Queryset of the user's messages matching ``query`` (newest first)."""
+    messages = Message.objects.filter(conversation__in=_conversations(user_id, conversation_id).values('pk'))
+    return filter_matching(messages, query).order_by('-id')
+
+
+def _fold(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in text if not unicodedata.combining(c)).casefold()
+
+
+def text_matches(text, words):
+    tokens = set(re.findall(r'\w+', _fold(text), flags=re.UNICODE))
+    words = [_fold(w) for w in words]
+    *whole, last = words
+    return all(w in tokens for w in whole) and any(t.startswith(last) for t in tokens)
+
+
+def search_archived(user_id, query, conversation_id=None, before=None, limit=50, max_blocks=None):
+    """
+    ``(messages, floor)``: up to ``limit`` archived messages matching ``query``
+    (unsaved instances, newest first). Blocks are opened newest first and the
+    scan stops once no remaining block can hold a message newer than the
+    ``limit``-th hit, or after ``max_blocks`` blocks
+    (MESSAGE_SEARCH_ARCHIVE_BLOCKS). In the latter case ``floor`` is the
+    ``last_id`` of the first block left out: archived hits up to it may be
+    missing (otherwise ``floor`` is None). Blocks straddling ``before`` do not
+    count, so a page starting at ``floor + 1`` always gets further.
+    """
+    words = terms(query)
+    if not words or limit <= 0:
+        return [], None
+    max_blocks = max_blocks or getattr(settings, 'MESSAGE_SEARCH_ARCHIVE_BLOCKS', 10)
+    conversations = _conversations(user_id, conversation_id).filter(archived_until_id__gt=0)
+    chunks = ArchivedMessageChunk.objects.filter(conversation__in=conversations.values('pk'))
+    if before is not None:
+        chunks = chunks.filter(first_id__lt=before)
+    found = []
+    opened = 0
+    for chunk in chunks.order_by('-last_id').iterator(chunk_size=4):
+        if len(found) >= limit and chunk.last_id < found[limit - 1].id:
+            break
+        if before is None or chunk.last_id < before:
+            if opened >= max_blocks:
+                return found[:limit], chunk.last_id
+            opened += 1
+        found.extend(
+            m for m in archive.unpack(chunk)
+            if (before is None or m.id < before) and text_matches(m.text, words)
+        )
+        found.sort(key=lambda m: m.id, reverse=True)
+    return found[:limit], None
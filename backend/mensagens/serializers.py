@@ -12,6 +12,14 @@ class MessageSerializer(serializers.ModelSerializer):
         fields = ['id', 'conversation', 'sender', 'recipient', 'text', 'type', 'data', 'created_at']
 
 
+class CompactMessageSerializer(serializers.ModelSerializer):
+    """Message with sender/recipient as plain ids (no nested users)."""
+
+    class Meta:
+        model = Message
+        fields = ['id', 'conversation', 'sender', 'recipient', 'text', 'type', 'data', 'created_at']
+
+
 class ConversationSerializer(serializers.ModelSerializer):
     participants = UsuarioSerializer(many=True, read_only=True)
 
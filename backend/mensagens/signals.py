@@ -0,0 +1,11 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Message
+
+
+@receiver(post_save, sender=Message)
+def message_post_save(sender, instance, created, **kwargs):
+    """Keep the conversation's last-message fields and unread counts current."""
+    if created and instance.conversation_id:
+        instance.conversation.register_message(instance)
@@ -0,0 +1,1070 @@
+import asyncio
+import io
+import os
+import threading
+import time
+import unittest
+import uuid
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from notificacoes.models import Device, Notificacao
+from .models import Conversation, Message, ParticipantState
+from notificacoes.push import get_transport
+from usuarios.models import Usuario
+
+
+@override_settings(PUSH_TRANSPORT='notificacoes.push.LocalPushTransport')
+class ChatNotificacaoTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.transport = get_transport()
+        self.transport.sent.clear()
+        self.ana = Usuario.objects.create_user(email='ana@example.com', password='pass123', username='Ana')
+        self.bia = Usuario.objects.create_user(email='bia@example.com', password='pass123', username='Bia')
+        Device.objects.create(usuario=self.bia, registration_id='bia-phone')
+        self.client.force_authenticate(self.ana)
+
+    def _enviar(self, texto):
+        r = self.client.post(reverse('mensagens-list-create'), {'to': self.bia.id, 'text': texto}, format='json')
+        self.assertEqual(r.status_code, 201)
+        return r
+
+    def test_rajada_vira_uma_notificacao_e_um_push(self):
+        for i in range(5):
+            self._enviar(f'oi {i}')
+        notificacoes = Notificacao.objects.filter(usuario=self.bia)
+        self.assertEqual(notificacoes.count(), 1)
+        self.assertEqual(notificacoes.get().quantidade, 5)
+        self.assertIn('5 mensagens', notificacoes.get().mensagem)
+        self.assertEqual(len(self.transport.sent), 1)
+
+    def test_notificacao_lida_nao_e_agregada(self):
+        self._enviar('primeira')
+        Notificacao.objects.filter(usuario=self.bia).update(lida=True)
+        self._enviar('segunda')
+        self.assertEqual(Notificacao.objects.filter(usuario=self.bia).count(), 2)
+
+
+class ConversationPairKeyTests(TestCase):
+    def setUp(self):
+        self.ana = Usuario.objects.create_user(email='ana@example.com', password='pass123', username='Ana')
+        self.bia = Usuario.objects.create_user(email='bia@example.com', password='pass123', username='Bia')
+
+    def test_get_or_create_direct_ignora_a_ordem(self):
+        conv, created = Conversation.objects.get_or_create_direct(self.bia.id, self.ana.id)
+        self.assertTrue(created)
+        again, created = Conversation.objects.get_or_create_direct(self.ana.id, self.bia.id)
+        self.assertFalse(created)
+        self.assertEqual(conv, again)
+        self.assertCountEqual(conv.participants.values_list('id', flat=True), [self.ana.id, self.bia.id])
+
+    def test_par_duplicado_e_rejeitado(self):
+        Conversation.objects.get_or_create_direct(self.ana.id, self.bia.id)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Conversation.objects.create(user_low=self.ana, user_high=self.bia)
+
+
+class ConversationListTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.me = Usuario.objects.create_user(email='me@example.com', password='pass123', username='Me')
+        self.others = [
+            Usuario.objects.create_user(email=f'u{i}@example.com', password='pass123', username=f'U{i}')
+            for i in range(3)
+        ]
+        self.client.force_authenticate(self.me)
+
+    def _mensagem(self, sender, recipient, text):
+        conv, _ = Conversation.objects.get_or_create_direct(sender.id, recipient.id)
+        return Message.objects.create(conversation=conv, sender=sender, recipient=recipient, text=text)
+
+    def test_lista_ordenada_por_atividade_com_nao_lidas(self):
+        for other in self.others:
+            self._mensagem(other, self.me, f'oi de {other.username}')
+        self._mensagem(self.others[0], self.me, 'de novo')
+        r = self.client.get(reverse('conversations-list'))
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.data[0]['last_message'], 'de novo')
+        self.assertEqual(r.data[0]['unread_count'], 2)
+        self.assertEqual(r.data[1]['last_message'], 'oi de U2')
+
+    def test_lista_em_uma_query(self):
+        for other in self.others:
+            self._mensagem(other, self.me, 'oi')
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('conversations-list'))
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_paginacao_por_cursor(self):
+        for other in self.others:
+            self._mensagem(other, self.me, 'oi')
+        r = self.client.get(reverse('conversations-list'), {'page_size': 2})
+        self.assertEqual(len(r.data['results']), 2)
+        r = self.client.get(r.data['next'])
+        self.assertEqual(len(r.data['results']), 1)
+
+
+class MessageHistoryTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.ana = Usuario.objects.create_user(email='ana@example.com', password='pass123', username='Ana')
+        self.bia = Usuario.objects.create_user(email='bia@example.com', password='pass123', username='Bia')
+        conv, _ = Conversation.objects.get_or_create_direct(self.ana.id, self.bia.id)
+        self.ids = [
+            Message.objects.create(conversation=conv, sender=self.ana, recipient=self.bia, text=str(i)).id
+            for i in range(7)
+        ]
+        self.client.force_authenticate(self.ana)
+        self.url = reverse('mensagens-list-create')
+
+    def test_sem_parametros_mantem_lista_completa(self):
+        r = self.client.get(self.url, {'with_user': self.bia.id})
+        self.assertEqual(len(r.data), 7)
+        self.assertEqual(r.data[0]['sender']['id'], self.ana.id)
+
+    def test_paginas_anteriores(self):
+        r = self.client.get(self.url, {'with_user': self.bia.id, 'limit': 3})
+        self.assertEqual([m['id'] for m in r.data['results']], self.ids[4:])
+        self.assertTrue(r.data['has_more'])
+        r = self.client.get(self.url, {'with_user': self.bia.id, 'limit': 3, 'before': r.data['before']})
+        self.assertEqual([m['id'] for m in r.data['results']], self.ids[1:4])
+        r = self.client.get(self.url, {'with_user': self.bia.id, 'limit': 3, 'before': r.data['before']})
+        self.assertEqual([m['id'] for m in r.data['results']], self.ids[:1])
+        self.assertFalse(r.data['has_more'])
+
+    def test_delta_compacto(self):
+        r = self.client.get(self.url, {'with_user': self.bia.id, 'after': self.ids[4], 'compact': 1})
+        self.assertEqual([m['id'] for m in r.data['results']], self.ids[5:])
+        self.assertEqual(r.data['results'][0]['sender'], self.ana.id)
+        self.assertIn(str(self.bia.id), r.data['participants'])
+
+    def test_limite_negativo_vira_um(self):
+        for extra in ({}, {'compact': 1}):
+            r = self.client.get(self.url, {'with_user': self.bia.id, 'limit': -5, **extra})
+            self.assertEqual(r.status_code, 200)
+            self.assertEqual([m['id'] for m in r.data['results']], self.ids[6:])
+
+
+def _servidor_redis_de_teste():
+    """URL de um Redis para o teste de integração: REDIS_URL real se houver,
+    senão um servidor fakeredis local (opcional, só para testes)."""
+    url = os.getenv('REDIS_URL', '').split(',')[0].strip()
+    if url:
+        return url, None
+    try:
+        from fakeredis import TcpFakeServer
+    except Exception:
+        return None, None
+    server = TcpFakeServer(('127.0.0.1', 0), server_type='redis')
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    return f'redis://{host}:{port}/0', server
+
+
+class RedisChannelLayerTests(SimpleTestCase):
+    """Dois RedisChannelLayer independentes simulam dois workers ASGI."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        try:
+            import channels_redis  # noqa: F401
+        except ImportError:
+            raise unittest.SkipTest('channels_redis não instalado')
+        cls.url, cls.server = _servidor_redis_de_teste()
+        if not cls.url:
+            raise unittest.SkipTest('sem Redis disponível (defina REDIS_URL ou instale fakeredis)')
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.server is not None:
+            cls.server.shutdown()
+            cls.server.server_close()
+        super().tearDownClass()
+
+    def _camadas(self):
+        from channels_redis.core import RedisChannelLayer
+        prefixo = f'teste{uuid.uuid4().hex[:8]}'
+        config = {'hosts': [self.url], 'prefix': prefixo, 'expiry': 5, 'group_expiry': 60}
+        return RedisChannelLayer(**config), RedisChannelLayer(**config)
+
+    def test_group_send_atravessa_processos(self):
+        async def cenario():
+            worker_a, worker_b = self._camadas()
+            canal = await worker_a.new_channel()
+            await worker_a.group_add('user_1', canal)
+            await worker_b.group_send('user_1', {'type': 'chat.message', 'message': {'text': 'oi'}})
+            recebido = await asyncio.wait_for(worker_a.receive(canal), timeout=5)
+            await worker_a.flush()
+            return recebido
+
+        recebido = async_to_sync(cenario)()
+        self.assertEqual(recebido['type'], 'chat.message')
+        self.assertEqual(recebido['message']['text'], 'oi')
+
+    def test_group_discard_para_de_entregar(self):
+        async def cenario():
+            worker_a, worker_b = self._camadas()
+            saiu = await worker_a.new_channel()
+            ficou = await worker_a.new_channel()
+            await worker_a.group_add('user_2', saiu)
+            await worker_a.group_add('user_2', ficou)
+            await worker_b.group_discard('user_2', saiu)
+            await worker_b.group_send('user_2', {'type': 'notification', 'notification': {'id': 1}})
+            recebido = await asyncio.wait_for(worker_a.receive(ficou), timeout=5)
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(worker_a.receive(saiu), timeout=0.3)
+            await worker_a.flush()
+            return recebido
+
+        self.assertEqual(async_to_sync(cenario)()['notification']['id'], 1)
+
+
+@override_settings(PUSH_TRANSPORT='notificacoes.push.LocalPushTransport', NOTIFICATION_FANOUT_ASYNC=False)
+class ChatRedisLayerTests(TransactionTestCase):
+    """Presença, replay e consumer do projeto com CHANNEL_LAYERS apontando para o Redis."""
+
+    @classmethod
+    def setUpClass(cls):
+        try:
+            import channels_redis  # noqa: F401
+        except ImportError:
+            raise unittest.SkipTest('channels_redis não instalado')
+        cls.url, cls.server = _servidor_redis_de_teste()
+        if not cls.url:
+            raise unittest.SkipTest('sem Redis disponível (defina REDIS_URL ou instale fakeredis)')
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.server is not None:
+            cls.server.shutdown()
+            cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.prefixo = f'teste{uuid.uuid4().hex[:8]}'
+        camadas = {'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [self.url], 'prefix': self.prefixo, 'expiry': 5, 'group_expiry': 60},
+        }}
+        override = override_settings(CHANNEL_LAYERS=camadas)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.ana = Usuario.objects.create_user(email='ana@example.com', password='pass123', username='Ana')
+        self.bia = Usuario.objects.create_user(email='bia@example.com', password='pass123', username='Bia')
+
+    def test_registro_e_buffer_seguem_a_camada(self):
+        import redis
+        from . import presence, replay
+
+        registro, buffer = presence.get_registry(), replay.get_buffer()
+        self.assertIsInstance(registro, presence.RedisPresence)
+        self.assertIsInstance(buffer, replay.RedisReplay)
+        registro.touch(self.ana.id, 'ana-socket')
+        evento = replay.stamp(self.ana.id, {'type': 'notification', 'notification': {'id': 1}})
+        self.assertEqual(presence.online_users([self.ana.id, self.bia.id]), {self.ana.id})
+        self.assertEqual(buffer.since(self.ana.id, 0), (1, [evento]))
+        # as chaves ficam no mesmo Redis e com o mesmo prefixo da camada
+        cliente = redis.Redis.from_url(self.url)
+        self.assertEqual(cliente.zcard(f'{self.prefixo}:presence:{self.ana.id}'), 1)
+        self.assertEqual(int(cliente.get(f'{self.prefixo}:seq:{self.ana.id}')), 1)
+
+    def test_mensagem_entre_consumers_pelo_redis(self):
+        from . import presence, replay
+        from .consumers import ChatConsumer
+
+        async def conectar(usuario):
+            communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), '/ws/chat/?since=0')
+            communicator.scope['user'] = usuario
+            conectado, _ = await communicator.connect()
+            self.assertTrue(conectado)
+            self.assertEqual((await communicator.receive_json_from(timeout=5))['type'], 'resume')
+            return communicator
+
+        async def cenario():
+            ana, bia = await conectar(self.ana), await conectar(self.bia)
+            online = await sync_to_async(presence.online_users)([self.ana.id, self.bia.id])
+            await ana.send_json_to({'type': 'message', 'to': self.bia.id, 'text': 'oi pelo redis'})
+            enviada = await ana.receive_json_from(timeout=5)
+            recebida = await bia.receive_json_from(timeout=5)
+            while recebida['type'] != 'message':
+                recebida = await bia.receive_json_from(timeout=5)
+            await ana.disconnect()
+            await bia.disconnect()
+            return online, enviada, recebida
+
+        online, enviada, recebida = async_to_sync(cenario)()
+        self.assertEqual(online, {self.ana.id, self.bia.id})
+        self.assertEqual(enviada['type'], 'message_sent')
+        self.assertEqual(recebida['message']['text'], 'oi pelo redis')
+        atual, eventos = replay.get_buffer().since(self.bia.id, 0)
+        self.assertEqual(recebida['seq'], atual)
+        self.assertIn(recebida['message']['id'], [e['message']['id'] for e in eventos if e['type'] == 'chat.message'])
+        self.assertEqual(presence.online_users([self.ana.id, self.bia.id]), set())
+
+
+@override_settings(PUSH_TRANSPORT='notificacoes.push.LocalPushTransport', NOTIFICATION_FANOUT_ASYNC=False)
+class ChatConsumerCacheTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.ana = Usuario.objects.create_user(email='ana@example.com', password='pass123', username='Ana')
+        self.bia = Usuario.objects.create_user(email='bia@example.com', password='pass123', username='Bia')
+
+    def _conversar(self, mensagens):
+        from .consumers import ChatConsumer
+
+        async def cenario():
+            communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), '/ws/chat/')
+            communicator.scope['user'] = self.ana
+            conectado, _ = await communicator.connect()
+            self.assertTrue(conectado)
+            respostas = []
+            for payload in mensagens:
+                await communicator.send_json_to(payload)
+                respostas.append(await communicator.receive_json_from(timeout=5))
+            await communicator.disconnect()
+            return respostas
+
+        return async_to_sync(cenario)()
+
+    def test_destinatario_e_conversa_resolvidos_uma_vez(self):
+        with CaptureQueriesContext(connection) as ctx:
+            respostas = self._conversar([{'type': 'message', 'to': self.bia.id, 'text': f'oi {i}'} for i in range(3)])
+        self.assertTrue(all(r['type'] == 'message_sent' for r in respostas))
+        self.assertEqual(respostas[2]['message']['recipient']['id'], self.bia.id)
+        self.assertEqual(Message.objects.filter(conversation_id=respostas[0]['message']['conversation']).count(), 3)
+        consultas_usuario = [q for q in ctx.captured_queries if q['sql'].startswith('SELECT') and 'FROM "usuarios_usuario"' in q['sql']]
+        self.assertEqual(len(consultas_usuario), 1)
+
+    def test_destinatario_inexistente_vira_erro(self):
+        respostas = self._conversar([{'type': 'message', 'to': 999999, 'text': 'oi'}])
+        self.assertEqual(respostas[0]['type'], 'error')
+        self.assertFalse(Message.objects.exists())
+
+    def test_lru_descarta_o_mais_antigo(self):
+        from .consumers import _LRU
+
+        lru = _LRU(2)
+        lru.put(1, 'a')
+        lru.put(2, 'b')
+        lru.get(1)
+        lru.put(3, 'c')
+        self.assertIsNone(lru.get(2))
+        self.assertEqual((lru.get(1), lru.get(3), len(lru)), ('a', 'c', 2))
+
+
+@override_settings(PUSH_TRANSPORT='notificacoes.push.LocalPushTransport')
+class PresenceTests(APITestCase):
+    def setUp(self):
+        from . import presence
+
+        cache.clear()
+        self.registry = presence.get_registry()
+        self.transport = get_transport()
+        self.transport.sent.clear()
+        self.ana = Usuario.objects.create_user(email='ana@example.com', password='pass123', username='Ana')
+        self.bia = Usuario.objects.create_user(email='bia@example.com', password='pass123', username='Bia')
+        Device.objects.create(usuario=self.bia, registration_id='bia-phone')
+        self.client.force_authenticate(self.ana)
+
+    def tearDown(self):
+        self.registry.remove(self.bia.id, 'bia-socket')
+
+    def test_destinatario_online_nao_recebe_push(self):
+        self.registry.touch(self.bia.id, 'bia-socket')
+        r = self.client.post(reverse('mensagens-list-create'), {'to': self.bia.id, 'text': 'oi'}, format='json')
+        self.assertEqual(r.status_code, 201)
+        self.assertEqual(self.transport.sent, [])
+
+        self.registry.remove(self.bia.id, 'bia-socket')
+        cache.clear()  # limpa o limite de push por conversa
+        self.client.post(reverse('mensagens-list-create'), {'to': self.bia.id, 'text': 'oi de novo'}, format='json')
+        self.assertEqual(len(self.transport.sent), 1)
+
+    def test_lista_de_conversas_traz_presenca(self):
+        Conversation.objects.get_or_create_direct(self.ana.id, self.bia.id)
+        self.registry.touch(self.bia.id, 'bia-socket')
+        data = self.client.get(reverse('conversations-list')).json()
+        online = {p['id']: p['online'] for p in data[0]['participants']}
+        self.assertEqual(online, {self.ana.id: False, self.bia.id: True})
+        r = self.client.get(reverse('mensagens-presence'), {'users': f'{self.ana.id},{self.bia.id},x'})
+        self.assertEqual(r.json(), {'online': [self.bia.id]})
+
+    def test_presenca_so_de_quem_conversa_comigo(self):
+        estranho = Usuario.objects.create_user(email='eva@example.com', password='pass123', username='Eva')
+        Conversation.objects.get_or_create_direct(self.ana.id, self.bia.id)
+        self.registry.touch(self.bia.id, 'bia-socket')
+        self.registry.touch(estranho.id, 'eva-socket')
+        try:
+            r = self.client.get(reverse('mensagens-presence'), {'users': f'{self.bia.id},{estranho.id}'})
+        finally:
+            self.registry.remove(estranho.id, 'eva-socket')
+        self.assertEqual(r.json(), {'online': [self.bia.id]})
+
+    def test_registro_expira_sem_heartbeat(self):
+        from .presence import MemoryPresence
+
+        registry = MemoryPresence()
+        registry.touch(1, 'a', ttl=0.05)
+        registry.touch(1, 'b')
+        registry.remove(1, 'b')
+        self.assertEqual(registry.counts([1]), {1: 1})
+        time.sleep(0.06)
+        self.assertEqual(registry.counts([1, 2]), {1: 0, 2: 0})
+
+    def test_registro_redis_compartilhado(self):
+        try:
+            import fakeredis
+        except ImportError:
+            self.skipTest('fakeredis não instalado')
+        from .presence import RedisPresence
+
+        server = fakeredis.FakeServer()
+        worker_a = RedisPresence([fakeredis.FakeRedis(server=server)], prefix='teste')
+        worker_b = RedisPresence([fakeredis.FakeRedis(server=server)], prefix='teste')
+        worker_a.touch(7, 'specific.a!1')
+        worker_a.touch(7, 'specific.a!2', ttl=0.05)
+        self.assertEqual(worker_b.counts([7, 8]), {7: 2, 8: 0})
+        time.sleep(0.06)
+        worker_b.remove(7, 'specific.a!1')
+        self.assertEqual(worker_b.counts([7]), {7: 0})
+
+
+class ReadReceiptTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.ana = Usuario.objects.create_user(email='ana@example.com', password='pass123', username='Ana')
+        self.bia = Usuario.objects.create_user(email='bia@example.com', password='pass123', username='Bia')
+        self.conv, _ = Conversation.objects.get_or_create_direct(self.ana.id, self.bia.id)
+        self.msgs = [
+            Message.objects.create(conversation=self.conv, sender=self.bia, recipient=self.ana, text=f'm{i}')
+            for i in range(3)
+        ]
+        self.client.force_authenticate(self.ana)
+
+    def _conversa(self, user):
+        self.client.force_authenticate(user)
+        return self.client.get(reverse('conversations-list')).json()[0]
+
+    def test_cursor_deriva_nao_lidas_e_nao_volta(self):
+        url = reverse('conversations-read', args=[self.conv.id])
+        r = self.client.post(url, {'message_id': self.msgs[1].id}, format='json')
+        self.assertEqual(r.json(), {'conversation': self.conv.id, 'last_read_id': self.msgs[1].id, 'unread_count': 1})
+
+        r = self.client.post(url, {'message_id': self.msgs[0].id}, format='json')
+        self.assertEqual(r.json()['last_read_id'], self.msgs[1].id)
+
+        self.assertEqual(self._conversa(self.ana)['unread_count'], 1)
+        self.assertEqual(self._conversa(self.bia)['peer_last_read_id'], self.msgs[1].id)
+
+        self.client.force_authenticate(self.ana)
+        r = self.client.post(url, {}, format='json')
+        self.assertEqual((r.json()['last_read_id'], r.json()['unread_count']), (self.msgs[2].id, 0))
+
+    def test_corpo_que_nao_e_objeto(self):
+        url = reverse('conversations-read', args=[self.conv.id])
+        for corpo in ([1, 2], 'oi', 7):
+            self.assertEqual(self.client.post(url, corpo, format='json').status_code, 400)
+
+    def test_recibo_de_leitura_chega_ao_remetente(self):
+        layer = get_channel_layer()
+        canal = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(f'user_{self.bia.id}', canal)
+        self.client.post(reverse('conversations-read', args=[self.conv.id]), {}, format='json')
+        evento = async_to_sync(layer.receive)(canal)
+        self.assertEqual(evento['type'], 'chat.read')
+        self.assertEqual((evento['reader'], evento['last_read_id']), (self.ana.id, self.msgs[2].id))
+
+    def test_so_abrir_a_conversa_move_o_cursor(self):
+        url = reverse('mensagens-list-create')
+        self.client.get(url, {'with_user': self.bia.id, 'after': self.msgs[0].id, 'compact': 1})
+        self.client.get(url, {'with_user': self.bia.id, 'before': self.msgs[2].id, 'limit': 1})
+        self.assertEqual(self._conversa(self.ana)['unread_count'], 3)
+        self.client.get(url, {'with_user': self.bia.id, 'limit': 1})
+        self.assertEqual(self._conversa(self.ana)['unread_count'], 0)
+
+    def test_conversa_de_outros_da_404(self):
+        carla = Usuario.objects.create_user(email='carla@example.com', password='pass123', username='Carla')
+        self.client.force_authenticate(carla)
+        r = self.client.post(reverse('conversations-read', args=[self.conv.id]), {}, format='json')
+        self.assertEqual(r.status_code, 404)
+
+
+class ReadReceiptConsumerTests(TransactionTestCase):
+    def test_acao_read_pelo_websocket(self):
+        from .consumers import ChatConsumer
+
+        ana = Usuario.objects.create_user(email='ana@example.com', password='pass123', username='Ana')
+        bia = Usuario.objects.create_user(email='bia@example.com', password='pass123', username='Bia')
+        conv, _ = Conversation.objects.get_or_create_direct(ana.id, bia.id)
+        msg = Message.objects.create(conversation=conv, sender=bia, recipient=ana, text='oi')
+
+        async def cenario():
+            communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), '/ws/chat/')
+            communicator.scope['user'] = ana
+            await communicator.connect()
+            await communicator.send_json_to({'type': 'read', 'conversation': conv.id, 'message_id': msg.id})
+            resposta = await communicator.receive_json_from(timeout=5)
+            await communicator.disconnect()
+            return resposta
+
+        resposta = async_to_sync(cenario)()
+        self.assertEqual(resposta['type'], 'read')
+        self.assertEqual((resposta['last_read_id'], resposta['unread_count']), (msg.id, 0))
+        self.assertEqual(ParticipantState.objects.get(conversation=conv, user=ana).last_read_id, msg.id)
+
+
+@override_settings(CHAT_RATE_LIMIT=1, CHAT_RATE_BURST=2, CHAT_MAX_RATE_VIOLATIONS=3,
+                   CHAT_MAX_FRAME_BYTES=200, CHAT_MAX_TEXT_LENGTH=50, CHAT_OUTBOUND_QUEUE_SIZE=2)
+class ChatLimitsTests(SimpleTestCase):
+    def setUp(self):
+        from . import metrics
+
+        metrics.reset()
+        self.user = Usuario(id=424242, email='flood@example.com')
+
+    def _sessao(self, passos):
+        from .consumers import ChatConsumer
+
+        async def cenario():
+            communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), '/ws/chat/')
+            communicator.scope['user'] = self.user
+            conectado, _ = await communicator.connect()
+            self.assertTrue(conectado)
+            saida = []
+            await passos(communicator)
+            while True:
+                try:
+                    evento = await communicator.receive_output(timeout=0.5)
+                except asyncio.TimeoutError:
+                    break
+                saida.append(evento)
+                if evento['type'] == 'websocket.close':
+                    break
+            await communicator.disconnect()
+            return saida
+
+        return async_to_sync(cenario)()
+
+    def _frames(self, saida):
+        import json
+        return [json.loads(e['text']) for e in saida if e['type'] == 'websocket.send']
+
+    def test_token_bucket_descarta_e_fecha(self):
+        from . import metrics
+
+        async def passos(communicator):
+            for _ in range(6):
+                await communicator.send_json_to({'type': 'ping'})
+
+        saida = self._sessao(passos)
+        frames = self._frames(saida)
+        self.assertEqual([f['type'] for f in frames], ['pong', 'pong', 'error'])
+        self.assertEqual(frames[2]['code'], 'rate_limited')
+        self.assertEqual(saida[-1], {'type': 'websocket.close', 'code': 1008})
+        self.assertEqual(metrics.snapshot()['counters'], {'frames_throttled': 4, 'closed_rate_limit': 1})
+
+    def test_frame_e_texto_grandes(self):
+        async def passos(communicator):
+            await communicator.send_json_to({'type': 'message', 'to': 1, 'text': 'x' * 51})
+            await communicator.send_to(text_data='{"type": "ping", "pad": "%s"}' % ('x' * 300))
+
+        saida = self._sessao(passos)
+        self.assertEqual([f['code'] for f in self._frames(saida)], ['text_too_long', 'frame_too_large'])
+        self.assertEqual(saida[-1], {'type': 'websocket.close', 'code': 1009})
+
+    def test_texto_que_nao_e_string(self):
+        async def passos(communicator):
+            await communicator.send_json_to({'type': 'message', 'to': 1, 'text': 12345})
+            await communicator.send_to(text_data='{"type": "ping", "pad": "%s"}' % ('x' * 300))
+
+        self.assertEqual([f['code'] for f in self._frames(self._sessao(passos))], ['invalid_frame', 'frame_too_large'])
+
+    def test_fila_cheia_desconecta_cliente_lento(self):
+        from . import metrics
+
+        async def passos(communicator):
+            layer = get_channel_layer()
+            await layer.group_send(f'user_{self.user.id}', {
+                'type': 'notification.batch',
+                'notifications': [{'id': i} for i in range(5)],
+            })
+
+        saida = self._sessao(passos)
+        self.assertIn({'type': 'websocket.close', 'code': 1013}, saida)
+        counters = metrics.snapshot()['counters']
+        self.assertEqual(counters['closed_slow_consumer'], 1)
+        self.assertGreaterEqual(counters['frames_dropped'], 1)
+
+
+@override_settings(CHAT_EPHEMERAL_INTERVAL=0.2)
+class EphemeralEventsTests(TransactionTestCase):
+    def test_typing_coalescido_sem_gravar_nada(self):
+        from .consumers import ChatConsumer
+
+        ana = Usuario.objects.create_user(email='ana@example.com', password='pass123', username='Ana')
+        bia = Usuario.objects.create_user(email='bia@example.com', password='pass123', username='Bia')
+        carla = Usuario.objects.create_user(email='carla@example.com', password='pass123', username='Carla')
+        conv, _ = Conversation.objects.get_or_create_direct(ana.id, bia.id)
+
+        async def cenario():
+            layer = get_channel_layer()
+            canal_bia = await layer.new_channel()
+            canal_carla = await layer.new_channel()
+            await layer.group_add(f'user_{bia.id}', canal_bia)
+            await layer.group_add(f'user_{carla.id}', canal_carla)
+            communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), '/ws/chat/')
+            communicator.scope['user'] = ana
+            await communicator.connect()
+            for tipo in ('typing', 'typing', 'typing', 'stop_typing'):
+                await communicator.send_json_to({'type': tipo, 'to': bia.id})
+            await communicator.send_json_to({'type': 'viewing', 'to': carla.id, 'imovel_id': 3})
+            eventos = [await asyncio.wait_for(layer.receive(canal_bia), timeout=2) for _ in range(2)]
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(layer.receive(canal_bia), timeout=0.4)
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(layer.receive(canal_carla), timeout=0.1)
+            await communicator.disconnect()
+            return eventos
+
+        eventos = async_to_sync(cenario)()
+        self.assertEqual([e['event'] for e in eventos], ['typing', 'stop_typing'])
+        self.assertEqual((eventos[0]['from'], eventos[0]['conversation']), (ana.id, conv.id))
+        self.assertFalse(Message.objects.exists())
+        self.assertFalse(Notificacao.objects.exists())
+
+
+class MessageSearchTests(APITestCase):
+    def setUp(self):
+        self.ana = Usuario.objects.create_user(email='ana@example.com', password='pass123', username='Ana')
+        self.bia = Usuario.objects.create_user(email='bia@example.com', password='pass123', username='Bia')
+        self.carla = Usuario.objects.create_user(email='carla@example.com', password='pass123', username='Carla')
+        self.conv, _ = Conversation.objects.get_or_create_direct(self.ana.id, self.bia.id)
+        outra, _ = Conversation.objects.get_or_create_direct(self.bia.id, self.carla.id)
+        self.hits = [
+            Message.objects.create(conversation=self.conv, sender=self.bia, recipient=self.ana, text=f'O apartamento {i} tem garagem?')
+            for i in range(3)
+        ]
+        Message.objects.create(conversation=self.conv, sender=self.ana, recipient=self.bia, text='Pode visitar amanhã')
+        Message.objects.create(conversation=outra, sender=self.bia, recipient=self.carla, text='Apartamento com garagem')
+        self.client.force_authenticate(self.ana)
+
+    def _buscar(self, **params):
+        return self.client.get(reverse('mensagens-search'), params)
+
+    def test_busca_restrita_as_conversas_do_usuario_e_paginada(self):
+        r = self._buscar(q='garag', limit=2)
+        self.assertEqual(r.status_code, 200)
+        data = r.json()
+        self.assertEqual([h['message']['id'] for h in data['results']], [self.hits[2].id, self.hits[1].id])
+        self.assertTrue(data['has_more'])
+        self.assertEqual(data['results'][0]['peer']['id'], self.bia.id)
+        self.assertEqual(data['results'][0]['conversation'], self.conv.id)
+
+        data = self._buscar(q='garag', limit=2, before=data['before']).json()
+        self.assertEqual([h['message']['id'] for h in data['results']], [self.hits[0].id])
+        self.assertFalse(data['has_more'])
+
+    def test_indice_atualizado_em_edicao_e_exclusao(self):
+        self.assertEqual(len(self._buscar(q='amanha').json()['results']), 1)  # acentos ignorados
+        self.hits[0].text = 'mudou de ideia'
+        self.hits[0].save()
+        self.hits[1].delete()
+        ids = [h['message']['id'] for h in self._buscar(q='garagem').json()['results']]
+        self.assertEqual(ids, [self.hits[2].id])
+        self.assertEqual(len(self._buscar(q='ideia').json()['results']), 1)
+
+    def test_limite_negativo_na_busca(self):
+        r = self._buscar(q='garag', limit=-3)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual([h['message']['id'] for h in r.json()['results']], [self.hits[2].id])
+
+    def test_busca_encontra_mensagens_arquivadas(self):
+        from . import archive
+
+        self.conv.refresh_from_db()
+        archive.archive_conversation(self.conv)
+        self.assertFalse(Message.objects.filter(pk__in=[m.id for m in self.hits]).exists())
+        # sem ?archived=1 o arquivo não é aberto
+        self.assertEqual(self._buscar(q='garag').json()['results'], [])
+        data = self._buscar(q='garag', limit=2, archived=1).json()
+        self.assertEqual([h['message']['id'] for h in data['results']], [self.hits[2].id, self.hits[1].id])
+        self.assertTrue(data['has_more'])
+        self.assertFalse(data['archive_partial'])
+        self.assertEqual(data['results'][0]['peer']['id'], self.bia.id)
+        data = self._buscar(q='garag', limit=2, archived=1, before=data['before']).json()
+        self.assertEqual([h['message']['id'] for h in data['results']], [self.hits[0].id])
+        self.assertFalse(data['has_more'])
+        # o último da conversa fica na tabela quente e continua indexado
+        self.assertEqual(len(self._buscar(q='amanha').json()['results']), 1)
+
+    @override_settings(MESSAGE_ARCHIVE_CHUNK_SIZE=1, MESSAGE_SEARCH_ARCHIVE_BLOCKS=1)
+    def test_busca_no_arquivo_abre_poucos_blocos_por_pagina(self):
+        from . import archive
+
+        self.conv.refresh_from_db()
+        archive.archive_conversation(self.conv)
+        paginas, before = [], None
+        while True:
+            params = {'q': 'garag', 'archived': 1, 'limit': 5}
+            if before is not None:
+                params['before'] = before
+            data = self._buscar(**params).json()
+            paginas.append(([h['message']['id'] for h in data['results']], data['archive_partial']))
+            if not data['has_more']:
+                break
+            before = data['before']
+        self.assertEqual(paginas, [
+            ([self.hits[2].id], True),
+            ([self.hits[1].id], True),
+            ([self.hits[0].id], False),
+        ])
+
+    def test_conversa_excluida_e_consulta_vazia(self):
+        self.conv.deleted_by.add(self.ana)
+        self.assertEqual(self._buscar(q='garagem').json()['results'], [])
+        self.assertEqual(self._buscar(q='  "*  ').status_code, 400)
+
+
+class MessageArchiveTests(APITestCase):
+    def setUp(self):
+        from datetime import timedelta
+
+        self.ana = Usuario.objects.create_user(email='ana@example.com', password='pass123', username='Ana')
+        self.bia = Usuario.objects.create_user(email='bia@example.com', password='pass123', username='Bia')
+        self.conv, _ = Conversation.objects.get_or_create_direct(self.ana.id, self.bia.id)
+        inicio = timezone.now() - timedelta(days=400)
+        self.ids = []
+        for i in range(7):
+            msg = Message.objects.create(conversation=self.conv, sender=self.bia, recipient=self.ana, text=f'm{i}')
+            # 4 mensagens num mês, 3 no seguinte
+            Message.objects.filter(pk=msg.pk).update(created_at=inicio + timedelta(days=0 if i < 4 else 35, minutes=i))
+            self.ids.append(msg.id)
+        Conversation.objects.filter(pk=self.conv.pk).update(last_activity_at=inicio + timedelta(days=35))
+        self.client.force_authenticate(self.ana)
+
+    def _arquivar(self):
+        from django.core.management import call_command
+        from .models import ArchivedMessageChunk
+
+        call_command('arquivar_mensagens', meses=6, lote=3, stdout=io.StringIO())
+        self.conv.refresh_from_db()
+        return list(ArchivedMessageChunk.objects.filter(conversation=self.conv).order_by('first_id'))
+
+    def test_arquiva_por_mes_e_mantem_a_ultima_quente(self):
+        blocos = self._arquivar()
+        self.assertEqual([b.count for b in blocos], [3, 1, 2])
+        self.assertEqual(len({b.month for b in blocos}), 2)
+        self.assertEqual(list(Message.objects.values_list('id', flat=True)), [self.ids[-1]])
+        self.assertEqual(self.conv.archived_until_id, self.ids[-2])
+        self.assertEqual(self.conv.last_message_id, self.ids[-1])
+
+    def test_historico_pagina_no_arquivo(self):
+        self._arquivar()
+        url = reverse('mensagens-list-create')
+        vistos, before = [], None
+        while True:
+            params = {'with_user': self.bia.id, 'limit': 2}
+            if before:
+                params['before'] = before
+            data = self.client.get(url, params).json()
+            vistos = [m['id'] for m in data['results']] + vistos
+            before = data['before']
+            if not data['has_more']:
+                break
+        self.assertEqual(vistos, self.ids)
+
+        data = self.client.get(url, {'with_user': self.bia.id, 'after': self.ids[1], 'limit': 10, 'compact': 1}).json()
+        self.assertEqual([m['id'] for m in data['results']], self.ids[2:])
+        self.assertEqual(data['results'][0]['sender'], self.bia.id)
+
+        legado = self.client.get(url, {'with_user': self.bia.id}).json()
+        self.assertEqual([m['text'] for m in legado], [f'm{i}' for i in range(7)])
+        self.assertEqual(legado[0]['sender']['id'], self.bia.id)
+
+    def test_conversa_ativa_nao_e_arquivada(self):
+        Conversation.objects.filter(pk=self.conv.pk).update(last_activity_at=timezone.now())
+        self.assertEqual(self._arquivar(), [])
+        self.assertEqual(Message.objects.count(), 7)
+
+
+class WireFormatTests(SimpleTestCase):
+    def _ping(self, subprotocols, frame):
+        from .consumers import ChatConsumer
+
+        async def cenario():
+            communicator = WebsocketCommunicator(
+                ChatConsumer.as_asgi(), '/ws/chat/', subprotocols=subprotocols
+            )
+            communicator.scope['user'] = Usuario(id=515151, email='wire@example.com')
+            conectado, subprotocol = await communicator.connect()
+            self.assertTrue(conectado)
+            await communicator.send_to(**frame)
+            saida = await communicator.receive_output(timeout=2)
+            await communicator.disconnect()
+            return subprotocol, saida
+
+        return async_to_sync(cenario)()
+
+    def test_msgpack_negociado(self):
+        from . import wire
+
+        if wire.MSGPACK not in wire.CODECS:
+            self.skipTest('msgpack não instalado')
+        import msgpack
+
+        subprotocol, saida = self._ping(['outro.v1', wire.MSGPACK], {'bytes_data': msgpack.packb({'t': 'ping'})})
+        self.assertEqual(subprotocol, wire.MSGPACK)
+        self.assertEqual(msgpack.unpackb(saida['bytes']), {'t': 'pong'})
+
+    def test_json_continua_padrao(self):
+        subprotocol, saida = self._ping(['outro.v1'], {'text_data': '{"type": "ping"}'})
+        self.assertIsNone(subprotocol)
+        self.assertEqual(saida['text'], '{"type": "pong"}')
+
+    def test_compacto_encurta_chaves_e_achata_usuarios(self):
+        from . import wire
+
+        codec = wire.CODECS[wire.COMPACT]
+        frame = {'type': 'message', 'message': {
+            'id': 1, 'sender': {'id': 2, 'nome': 'Ana'}, 'recipient': {'id': 3, 'nome': 'Bia'},
+            'text': 'oi', 'data': {'type': 'livre', 'id': 9},
+        }}
+        encoded = codec.encode(frame)
+        self.assertIn('"s":2', encoded)
+        self.assertIn('"d":{"type":"livre","id":9}', encoded)
+        decoded = codec.decode(encoded)
+        self.assertEqual(decoded['message']['sender'], 2)
+        self.assertEqual(decoded['message']['data'], {'type': 'livre', 'id': 9})
+        self.assertEqual(codec.decode('{"t":"message","o":5,"x":"oi"}'), {'type': 'message', 'to': 5, 'text': 'oi'})
+
+
+@override_settings(CHAT_PRESENCE_TTL=3, WS_TOKEN_EXPIRY_GRACE=0)
+class TokenExpiryTests(SimpleTestCase):
+    def test_token_expirado_avisa_e_fecha(self):
+        from .consumers import ChatConsumer
+
+        async def cenario():
+            communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), '/ws/chat/')
+            communicator.scope['user'] = Usuario(id=616161, email='exp@example.com')
+            communicator.scope['token_exp'] = 1
+            await communicator.connect()
+            aviso = await communicator.receive_json_from(timeout=3)
+            fechamento = await communicator.receive_output(timeout=3)
+            await communicator.disconnect()
+            return aviso, fechamento
+
+        aviso, fechamento = async_to_sync(cenario)()
+        self.assertEqual(aviso, {'type': 'token_expired'})
+        self.assertEqual(fechamento, {'type': 'websocket.close', 'code': 4001})
+
+
+class ReauthTests(TransactionTestCase):
+    def test_reautenticacao_exige_access_da_versao_atual(self):
+        from usuarios.tokens import VersionedRefreshToken
+        from .consumers import ChatConsumer
+
+        user = Usuario.objects.create_user(email='reauth@example.com', password='pass123', username='Reauth')
+        refresh = VersionedRefreshToken.for_user(user)
+        antigo = str(refresh.access_token)
+        user.set_password('outra123')
+        user.save()
+        novo = str(VersionedRefreshToken.for_user(user).access_token)
+
+        async def cenario():
+            communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), '/ws/chat/')
+            communicator.scope['user'] = user
+            await communicator.connect()
+            respostas = []
+            for token in (str(refresh), antigo, novo):
+                await communicator.send_json_to({'type': 'auth', 'token': token})
+                respostas.append(await communicator.receive_json_from(timeout=5))
+            await communicator.disconnect()
+            return respostas
+
+        com_refresh, versao_velha, ok = async_to_sync(cenario)()
+        self.assertEqual(com_refresh['code'], 'invalid_token')
+        self.assertEqual(versao_velha['code'], 'invalid_token')
+        self.assertEqual(ok['type'], 'auth_ok')
+
+
+class ReplayTests(SimpleTestCase):
+    def _verificar_buffer(self, buffer):
+        for n in range(1, 6):
+            buffer.append(7, {'type': 'chat.message', 'message': {'id': n}})
+        atual, eventos = buffer.since(7, 2)
+        self.assertEqual(atual, 5)
+        self.assertEqual([e['seq'] for e in eventos], [3, 4, 5])
+        self.assertEqual(eventos[0]['message'], {'id': 3})
+        self.assertEqual(buffer.since(7, 5), (5, []))
+        # seq 2 já saiu do buffer (tamanho 3) e seq 9 nunca existiu: resync
+        self.assertIsNone(buffer.since(7, 1)[1])
+        self.assertIsNone(buffer.since(7, 9)[1])
+        self.assertEqual(buffer.since(8, 0), (0, []))
+
+    def test_buffer_em_memoria(self):
+        from .replay import MemoryReplay
+
+        self._verificar_buffer(MemoryReplay(size=3))
+
+    def test_buffer_em_memoria_esquece_fluxos_parados(self):
+        from unittest import mock
+        from .replay import MemoryReplay
+
+        with mock.patch('mensagens.replay.time.monotonic', return_value=1000):
+            buffer = MemoryReplay(size=3, ttl=60)
+            buffer.append(7, {'type': 'chat.message'})
+        with mock.patch('mensagens.replay.time.monotonic', return_value=1100):
+            buffer.append(8, {'type': 'chat.message'})
+            self.assertEqual(list(buffer._streams), [8])
+            # como a chave expirada no Redis: o cliente é mandado ao resync
+            self.assertEqual(buffer.since(7, 1), (0, None))
+
+    def test_buffer_redis(self):
+        try:
+            import fakeredis
+        except ImportError:
+            self.skipTest('fakeredis não instalado')
+        from .replay import RedisReplay
+
+        self._verificar_buffer(RedisReplay([fakeredis.FakeRedis()], prefix='teste', size=3))
+
+    def _conectar(self, user_id, path, depois=None):
+        from .consumers import ChatConsumer
+
+        async def cenario():
+            communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), path)
+            communicator.scope['user'] = Usuario(id=user_id, email='replay@example.com')
+            await communicator.connect()
+            frames = []
+            while True:
+                frame = await communicator.receive_json_from(timeout=2)
+                frames.append(frame)
+                if frame['type'] in ('resume', 'resync'):
+                    break
+            if depois is not None:
+                await depois()
+                frames.append(await communicator.receive_json_from(timeout=2))
+            await communicator.disconnect()
+            return frames
+
+        return async_to_sync(cenario)()
+
+    def test_reconexao_recebe_so_o_que_perdeu(self):
+        from . import replay
+
+        user_id = 717171
+        base = replay.get_buffer().current(user_id)
+        replay.publish(user_id, {'type': 'chat.message', 'message': {'id': 1, 'text': 'oi'}})
+        replay.publish(user_id, {'type': 'notification', 'notification': {'id': 2}})
+
+        async def ao_vivo():
+            await replay.apublish(user_id, {'type': 'chat.message', 'message': {'id': 3, 'text': 'tudo bem?'}})
+
+        frames = self._conectar(user_id, f'/ws/chat/?since={base}', ao_vivo)
+        self.assertEqual([f['type'] for f in frames], ['message', 'notification', 'resume', 'message'])
+        self.assertEqual([f['seq'] for f in frames], [base + 1, base + 2, base + 2, base + 3])
+        self.assertEqual(frames[2]['replayed'], 2)
+        self.assertEqual(frames[3]['message']['id'], 3)
+
+    @override_settings(CHAT_OUTBOUND_QUEUE_SIZE=10)
+    def test_replay_maior_que_a_fila_de_saida(self):
+        from . import metrics, replay
+
+        metrics.reset()
+        user_id = 737373
+        base = replay.get_buffer().current(user_id)
+        for n in range(25):
+            replay.stamp(user_id, {'type': 'chat.message', 'message': {'id': n}})
+        frames = self._conectar(user_id, f'/ws/chat/?since={base}')
+        self.assertEqual([f['message']['id'] for f in frames[:-1]], list(range(25)))
+        self.assertEqual((frames[-1]['type'], frames[-1]['replayed']), ('resume', 25))
+        self.assertNotIn('frames_dropped', metrics.snapshot()['counters'])
+
+    def test_buffer_despejado_pede_resync(self):
+        from . import replay
+
+        user_id = 727272
+        for n in range(replay.buffer_size() + 2):
+            replay.stamp(user_id, {'type': 'chat.message', 'message': {'id': n}})
+        frames = self._conectar(user_id, '/ws/chat/?since=0')
+        self.assertEqual(frames, [{'type': 'resync', 'since': 0, 'seq': replay.buffer_size() + 2}])
+
+
+class SyncViewTests(APITestCase):
+    def test_delta_rest_depois_do_resync(self):
+        ana = Usuario.objects.create_user(email='ana@example.com', password='pass123', username='Ana')
+        bia = Usuario.objects.create_user(email='bia@example.com', password='pass123', username='Bia')
+        self.client.force_authenticate(ana)
+        antiga = self.client.post(reverse('mensagens-list-create'), {'to': bia.id, 'text': 'antiga'}, format='json').data
+        self.client.force_authenticate(bia)
+        self.client.post(reverse('mensagens-list-create'), {'to': ana.id, 'text': 'nova'}, format='json')
+        Notificacao.objects.create(usuario=ana, mensagem='Preço baixou')
+
+        self.client.force_authenticate(ana)
+        r = self.client.get(reverse('mensagens-sync'), {'after': antiga['id']})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual([m['text'] for m in r.data['messages']], ['nova'])
+        self.assertFalse(r.data['has_more'])
+        self.assertIsInstance(r.data['seq'], int)
+        self.assertIn('Preço baixou', [n['mensagem'] for n in r.data['notifications']])
+        self.assertEqual(self.client.get(reverse('mensagens-sync')).status_code, 400)
+        r = self.client.get(reverse('mensagens-sync'), {'after': 0, 'limit': -3})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(([m['text'] for m in r.data['messages']], r.data['has_more']), (['antiga'], True))
+
+
+@override_settings(NOTIFICATION_FANOUT_ASYNC=False, LISTING_UPDATE_INTERVAL=0, CHAT_MAX_TOPICS=1)
+class ImovelTopicTests(TransactionTestCase):
+    def test_assina_recebe_e_cancela(self):
+        from propriedades.models import Propriedade
+        from .consumers import ChatConsumer
+
+        dono = Usuario.objects.create_user(email='dono@example.com', password='pass123', username='Dono')
+        prop = Propriedade.objects.create(
+            proprietario=dono, titulo='Kitnet Centro', tipo='kitnet', preco=900,
+            cidade='Palmas', estado='TO', cep='77000-000'
+        )
+        outra = Propriedade.objects.create(
+            proprietario=dono, titulo='Casa', tipo='casa', preco=1500,
+            cidade='Palmas', estado='TO', cep='77000-000'
+        )
+
+        def baixar_preco():
+            prop.preco = 850
+            prop.save()
+
+        async def cenario():
+            communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), '/ws/chat/')
+            communicator.scope['user'] = dono
+            await communicator.connect()
+            frames = []
+            for topico in (f'imovel:{prop.id}', f'imovel:{outra.id}', 'imovel:abc'):
+                await communicator.send_json_to({'type': 'subscribe', 'topic': topico})
+                frames.append(await communicator.receive_json_from(timeout=5))
+            await sync_to_async(baixar_preco)()
+            frames.append(await communicator.receive_json_from(timeout=5))
+            await communicator.send_json_to({'type': 'unsubscribe', 'topic': f'imovel:{prop.id}'})
+            frames.append(await communicator.receive_json_from(timeout=5))
+            await communicator.disconnect()
+            return frames
+
+        assinado, limite, invalido, update, cancelado = async_to_sync(cenario)()
+        self.assertEqual(assinado, {'type': 'subscribed', 'topic': f'imovel:{prop.id}'})
+        self.assertEqual(limite['code'], 'too_many_topics')
+        self.assertEqual(invalido['code'], 'invalid_topic')
+        self.assertEqual(update['type'], 'imovel')
+        self.assertEqual((update['topic'], update['changes'], update['imovel']['preco']), (f'imovel:{prop.id}', ['preco'], '850.00'))
+        self.assertEqual(cancelado, {'type': 'unsubscribed', 'topic': f'imovel:{prop.id}'})
@@ -1,8 +1,13 @@
 from django.urls import path
-from .views import MessageListCreateView, ConversationListView, ConversationDetailUpdateView
+from .views import MessageListCreateView, ConversationListView, ConversationDetailUpdateView, ConversationReadView, PresenceView, ChatMetricsView, MessageSearchView, SyncView
 
 urlpatterns = [
     path('mensagens/', MessageListCreateView.as_view(), name='mensagens-list-create'),
+    path('mensagens/search/', MessageSearchView.as_view(), name='mensagens-search'),
     path('conversations/', ConversationListView.as_view(), name='conversations-list'),
     path('conversations/<int:pk>/', ConversationDetailUpdateView.as_view(), name='conversations-detail-update'),
+    path('conversations/<int:pk>/read/', ConversationReadView.as_view(), name='conversations-read'),
+    path('presence/', PresenceView.as_view(), name='mensagens-presence'),
+    path('sync/', SyncView.as_view(), name='mensagens-sync'),
+    path('ws-metrics/', ChatMetricsView.as_view(), name='mensagens-ws-metrics'),
 ]
@@ -1,17 +1,71 @@
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
-from .models import Message, Conversation
-from .serializers import MessageSerializer, ConversationSerializer
-from notificacoes.utils import send_fcm_to_user
+from django.db.models import Exists, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from .models import Message, Conversation, ParticipantState
+from .pagination import ConversationCursorPagination
+from .serializers import MessageSerializer, CompactMessageSerializer, ConversationSerializer
+from notificacoes.agregacao import chave_chat, criar_ou_agregar
+from .presence import online_users, push_unless_online
+from .receipts import mark_read_and_relay
+from . import metrics as ws_metrics
+from . import archive, replay, search
+from django.conf import settings
 from usuarios.models import Usuario
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+
+
+def _int_param(params, name):
+    try:
+        return int(params[name]) if params.get(name) not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _limit_param(params, default, maximum):
+    """``limit`` clamped to 1..maximum (missing, zero or garbage -> default)."""
+    return max(1, min(_int_param(params, 'limit') or default, maximum))
 
 
 class MessageListCreateView(generics.GenericAPIView):
+    """GET ?with_user=<id> returns the history with that user.
+
+    Without extra parameters the whole history is returned as a list (legacy
+    clients). Windowed mode, constant cost per call:
+      - ``before=<id>``: the ``limit`` messages older than ``id`` (scroll back);
+      - ``after=<id>``: messages newer than ``id`` (delta sync after reconnect);
+      - ``limit`` alone: the newest page.
+    ``compact=1`` references sender/recipient by id and lists the two
+    participants once under ``participants``.
+    """
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = MessageSerializer
+    default_limit = 50
+    max_limit = 200
+
+    def get_window(self, messages, params, conv=None, users=None):
+        """Hot rows first; archive blocks only when the page reaches past them."""
+        before = _int_param(params, 'before')
+        after = _int_param(params, 'after')
+        limit = _limit_param(params, self.default_limit, self.max_limit)
+        if after is not None:
+            rows = []
+            if conv is not None and after < conv.archived_until_id:
+                rows = archive.archived_messages(conv, after=after, limit=limit + 1, users=users)
+            if len(rows) <= limit:
+                rows += list(messages.filter(id__gt=after).order_by('id')[:limit + 1 - len(rows)])
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+        else:
+            if before is not None:
+                messages = messages.filter(id__lt=before)
+            rows = list(messages.order_by('-id')[:limit + 1])
+            if len(rows) <= limit and conv is not None:
+                oldest = rows[-1].id if rows else before
+                rows += archive.archived_messages(conv, before=oldest, limit=limit + 1 - len(rows), users=users)
+            has_more = len(rows) > limit
+            rows = list(reversed(rows[:limit]))
+        return rows, has_more
 
     def get(self, request):
         other_id = request.query_params.get('with_user')
@@ -22,17 +76,49 @@ class MessageListCreateView(generics.GenericAPIView):
         except Usuario.DoesNotExist:
             return Response({'detail': 'user not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        # try to find conversation between the two users
-        conv = Conversation.objects.filter(participants=request.user).filter(participants=other).first()
+        # try to find conversation between the two users (pair-key index lookup)
+        conv = Conversation.objects.find_direct(request.user.id, other.id)
+        params = request.query_params
         if conv:
             messages = conv.messages.all()
+            # Opening the conversation (full list or newest page) moves the read
+            # cursor to the newest message, as legacy clients expect. Scrolling
+            # back (``before``) and delta syncs (``after``, e.g. in the background
+            # after a reconnect) never do: otherwise the sender would get receipts
+            # for messages nobody saw. Explicit reads go through the WS ``read``
+            # action or POST conversations/<id>/read/.
+            if 'before' not in params and 'after' not in params:
+                mark_read_and_relay(conv, request.user.id)
         else:
             # also include direct messages by sender/recipient when no conversation exists
             messages = Message.objects.filter(sender=request.user, recipient=other) | Message.objects.filter(sender=other, recipient=request.user)
             messages = messages.order_by('created_at')
 
-        serializer = MessageSerializer(messages, many=True)
-        return Response(serializer.data)
+        compact = str(params.get('compact', '')).lower() in ('1', 'true', 'yes')
+        windowed = compact or any(k in params for k in ('before', 'after', 'limit'))
+        users = {request.user.id: request.user, other.id: other}
+        if not windowed:
+            rows = messages.select_related('sender', 'recipient')
+            if conv and conv.archived_until_id:
+                rows = archive.all_archived(conv, users) + list(rows)
+            serializer = MessageSerializer(rows, many=True)
+            return Response(serializer.data)
+
+        if compact:
+            rows, has_more = self.get_window(messages, params, conv, users)
+            from usuarios.serializers import UsuarioSerializer
+            data = {
+                'results': CompactMessageSerializer(rows, many=True).data,
+                'participants': {str(u.id): UsuarioSerializer(u).data for u in (request.user, other)},
+            }
+        else:
+            rows, has_more = self.get_window(messages.select_related('sender', 'recipient'), params, conv, users)
+            data = {'results': MessageSerializer(rows, many=True).data}
+        data['has_more'] = has_more
+        # cursors for the next calls: older page / delta sync
+        data['before'] = rows[0].id if rows else _int_param(params, 'before')
+        data['after'] = rows[-1].id if rows else _int_param(params, 'after')
+        return Response(data)
 
     def post(self, request):
         to_id = request.data.get('to')
@@ -43,6 +129,8 @@ class MessageListCreateView(generics.GenericAPIView):
             return Response({'detail': 'to required'}, status=status.HTTP_400_BAD_REQUEST)
         if msg_type == 'text' and not text:
             return Response({'detail': 'text required for message_type=text'}, status=status.HTTP_400_BAD_REQUEST)
+        if text and len(str(text)) > getattr(settings, 'CHAT_MAX_TEXT_LENGTH', 4000):
+            return Response({'detail': 'text too long'}, status=status.HTTP_400_BAD_REQUEST)
         
         # Validação extra: se for tipo 'imovel', verificar se o imóvel existe
         if msg_type == 'imovel' and isinstance(data, dict):
@@ -58,11 +146,7 @@ class MessageListCreateView(generics.GenericAPIView):
         other = get_object_or_404(Usuario, id=to_id)
 
         # find or create conversation
-        conv = Conversation.objects.filter(participants=request.user).filter(participants=other).first()
-        if not conv:
-            conv = Conversation.objects.create()
-            conv.participants.add(request.user)
-            conv.participants.add(other)
+        conv, _ = Conversation.objects.get_or_create_direct(request.user.id, other.id)
 
         msg = Message.objects.create(
             conversation=conv,
@@ -73,14 +157,19 @@ class MessageListCreateView(generics.GenericAPIView):
             data=data,
         )
         # create notification record and try to send push (best-effort)
+        chave = chave_chat(conv.id, request.user.id)
         try:
-            from notificacoes.models import Notificacao
             sender_name = getattr(request.user, "nome", None)
             if not sender_name:
                 sender_name = getattr(request.user, "first_name", None)
             if not sender_name:
                 sender_name = request.user.username
-            Notificacao.objects.create(usuario=other, mensagem=f'{sender_name} te enviou uma mensagem')
+            criar_ou_agregar(
+                other.id,
+                chave,
+                f'{sender_name} te enviou uma mensagem',
+                mensagem_agregada=lambda n: f'{sender_name} te enviou {n} mensagens',
+            )
         except Exception:
             pass
         try:
@@ -90,8 +179,9 @@ class MessageListCreateView(generics.GenericAPIView):
             payload = {'type': 'chat', 'conversation': conv.id, 'from_user': request.user.id}
             if msg_type == 'imovel' and isinstance(data, dict) and data.get('imovel_id'):
                 payload['imovel'] = data.get('imovel_id')
-            send_fcm_to_user(
-                other,
+            push_unless_online(
+                other.id,
+                chave,
                 'Nova mensagem',
                 f'{getattr(request.user, "nome", str(request.user))} {body}',
                 data=payload
@@ -99,40 +189,231 @@ class MessageListCreateView(generics.GenericAPIView):
         except Exception:
             pass
         serializer = MessageSerializer(msg)
-        # Notificar via WebSocket (se destinatário estiver conectado)
-        try:
-            channel_layer = get_channel_layer()
-            if channel_layer is not None:
-                async_to_sync(channel_layer.group_send)(
-                    f'user_{other.id}',
-                    { 'type': 'chat.message', 'message': serializer.data }
-                )
-        except Exception:
-            pass
+        # Notificar via WebSocket (sequenciado: quem reconectar com ?since= recebe)
+        replay.publish(other.id, {'type': 'chat.message', 'message': serializer.data})
 
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
 class ConversationListView(generics.GenericAPIView):
+    """Conversations ordered by last activity, built from a single query.
+
+    Returns a plain list as before; pass ``cursor`` or ``page_size`` to get
+    cursor-paginated results (``next``/``previous``/``results``).
+    """
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ConversationCursorPagination
 
-    def get(self, request):
-        # list conversations for the user (exclude deleted)
-        convs = Conversation.objects.filter(participants=request.user).exclude(deleted_by=request.user).order_by('-created_at')
-        data = []
+    def get_queryset(self):
+        user_id = self.request.user.id
+        muted = Conversation.muted_by.through.objects.filter(conversation_id=OuterRef('pk'), usuario_id=user_id)
+        own_state = ParticipantState.objects.filter(conversation_id=OuterRef('pk'), user_id=user_id)
+        peer_state = ParticipantState.objects.filter(conversation_id=OuterRef('pk')).exclude(user_id=user_id).order_by('last_read_id')
+        return (
+            Conversation.objects.filter(participants=user_id)
+            .exclude(deleted_by=user_id)
+            .select_related('user_low', 'user_high')
+            .annotate(
+                is_muted=Exists(muted),
+                unread=Coalesce(Subquery(own_state.values('unread_count')[:1]), 0),
+                last_read=Coalesce(Subquery(own_state.values('last_read_id')[:1]), 0),
+                # lowest peer cursor: messages up to it were read by everybody
+                peer_last_read=Coalesce(Subquery(peer_state.values('last_read_id')[:1]), 0),
+            )
+            .order_by('-last_activity_at', '-id')
+        )
+
+    def serialize(self, conversations):
         from usuarios.serializers import UsuarioSerializer
-        for c in convs:
-            last = c.messages.last()
-            # Serializar participantes usando UsuarioSerializer
-            participants_data = UsuarioSerializer(c.participants.all(), many=True).data
+        rows = []
+        for c in conversations:
+            if c.user_low_id:
+                participants = [c.user_low, c.user_high]
+            else:
+                # conversations without a pair key (not direct); rare
+                participants = list(c.participants.all())
+            rows.append((c, participants))
+        # one presence round-trip for the whole page
+        online = online_users({u.id for _, participants in rows for u in participants})
+        data = []
+        for c, participants in rows:
+            users = UsuarioSerializer(participants, many=True).data
+            for user in users:
+                user['online'] = user.get('id') in online
             data.append({
                 'id': c.id,
-                'participants': participants_data,
-                'last_message': last.text if last else None,
-                'updated_at': last.created_at.isoformat() if last else c.created_at.isoformat(),
-                'muted': c.muted_by.filter(id=request.user.id).exists(),
+                'participants': users,
+                'last_message': c.last_message_preview if c.last_message_id else None,
+                'last_message_id': c.last_message_id,
+                'updated_at': c.last_activity_at.isoformat(),
+                'muted': c.is_muted,
+                'unread_count': c.unread,
+                'last_read_id': c.last_read,
+                'peer_last_read_id': c.peer_last_read,
             })
-        return Response(data)
+        return data
+
+    def get(self, request):
+        queryset = self.get_queryset()
+        if 'cursor' in request.query_params or 'page_size' in request.query_params:
+            page = self.paginate_queryset(queryset)
+            return self.get_paginated_response(self.serialize(page))
+        return Response(self.serialize(queryset))
+
+
+class PresenceView(generics.GenericAPIView):
+    """GET ?users=1,2,3 -> {"online": [ids with an open chat socket]}.
+
+    Only users who share a conversation with the caller are reported, so the
+    endpoint cannot be used to enumerate who is online.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    max_users = 200
+
+    def get(self, request):
+        ids = []
+        for raw in str(request.query_params.get('users', '')).split(','):
+            try:
+                ids.append(int(raw))
+            except (TypeError, ValueError):
+                continue
+        ids = ids[:self.max_users]
+        if ids:
+            peers = set(
+                Usuario.objects.filter(id__in=ids, conversations__participants=request.user)
+                .values_list('id', flat=True)
+            )
+            ids = [i for i in ids if i in peers]
+        return Response({'online': sorted(online_users(ids))})
+
+
+class ConversationReadView(generics.GenericAPIView):
+    """POST {"message_id": <id>} (optional, default newest) moves the read cursor."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, pk):
+        conv = get_object_or_404(Conversation, id=pk, participants=request.user)
+        if not isinstance(request.data, dict):
+            return Response({'detail': 'expected a JSON object'}, status=status.HTTP_400_BAD_REQUEST)
+        message_id = _int_param(request.data, 'message_id')
+        if 'message_id' in request.data and message_id is None:
+            return Response({'detail': 'message_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        last_read_id, unread_count = mark_read_and_relay(conv, request.user.id, message_id)
+        return Response({'conversation': conv.id, 'last_read_id': last_read_id, 'unread_count': unread_count})
+
+
+class MessageSearchView(generics.GenericAPIView):
+    """GET ?q=<words> searches the caller's messages (full-text index), newest first.
+
+    Optional ``conversation=<id>`` narrows to one conversation; ``limit`` and
+    ``before=<id>`` page through the hits like the history windows do.
+    ``archived=1`` also scans the archive blocks, at most
+    MESSAGE_SEARCH_ARCHIVE_BLOCKS per call: when the scan stops early the
+    page ends where it stopped (``archive_partial``) and the next ``before``
+    continues from there.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    default_limit = 20
+    max_limit = 100
+
+    def get(self, request):
+        from usuarios.serializers import UsuarioSerializer
+
+        params = request.query_params
+        query = params.get('q', '')
+        if not search.terms(query):
+            return Response({'detail': 'q parameter required'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = _limit_param(params, self.default_limit, self.max_limit)
+        conversation_id = _int_param(params, 'conversation')
+        hits = search.search_messages(request.user.id, query, conversation_id)
+        before = _int_param(params, 'before')
+        if before is not None:
+            hits = hits.filter(id__lt=before)
+        rows = list(hits.select_related('sender', 'recipient')[:limit + 1])
+        archived, floor = [], None
+        if str(params.get('archived', '')).lower() in ('1', 'true', 'yes'):
+            # archived messages are not indexed: merge the hits from the cold blocks
+            archived, floor = search.search_archived(request.user.id, query, conversation_id, before=before, limit=limit + 1)
+        if archived:
+            users = Usuario.objects.in_bulk({uid for m in archived for uid in (m.sender_id, m.recipient_id)})
+            for msg in archived:
+                msg.sender, msg.recipient = users.get(msg.sender_id), users.get(msg.recipient_id)
+            rows = sorted(rows + archived, key=lambda m: m.id, reverse=True)[:limit + 1]
+        if floor is not None:
+            # below the floor some archive blocks were not opened: stop the page there
+            rows = [m for m in rows if m.id > floor]
+        has_more = len(rows) > limit or floor is not None
+        rows = rows[:limit]
+        results = []
+        for msg in rows:
+            peer = msg.recipient if msg.sender_id == request.user.id else msg.sender
+            results.append({
+                'message': CompactMessageSerializer(msg).data,
+                'conversation': msg.conversation_id,
+                'peer': UsuarioSerializer(peer).data,
+            })
+        if len(rows) == limit or floor is None:
+            cursor = rows[-1].id if rows else before
+        else:
+            cursor = floor + 1
+        return Response({
+            'results': results,
+            'has_more': has_more,
+            'before': cursor,
+            'archive_partial': floor is not None,
+        })
+
+
+class SyncView(generics.GenericAPIView):
+    """GET ?after=<message id> -> REST delta for clients told to ``resync``.
+
+    Returns the current stream ``seq`` (reconnect with ``?since=<seq>``), the
+    caller's messages newer than ``after`` (oldest first, ``limit`` per page)
+    and the unread notifications. Read cursors come with the conversation list.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    default_limit = 200
+    max_limit = 500
+    max_notifications = 100
+
+    def get(self, request):
+        from django.db.models import Q
+        from notificacoes.models import Notificacao
+        from notificacoes.tempo_real import serializar
+
+        params = request.query_params
+        after = _int_param(params, 'after')
+        if after is None:
+            return Response({'detail': 'after parameter required'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = _limit_param(params, self.default_limit, self.max_limit)
+        # seq first: anything sent after this point is replayed by the socket
+        try:
+            seq = replay.get_buffer().current(request.user.id)
+        except Exception:
+            seq = None
+        user = request.user
+        rows = list(
+            Message.objects.filter(Q(sender=user) | Q(recipient=user), id__gt=after)
+            .select_related('sender', 'recipient').order_by('id')[:limit + 1]
+        )
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        notifications = Notificacao.objects.filter(usuario=user, lida=False)[:self.max_notifications]
+        return Response({
+            'seq': seq,
+            'messages': MessageSerializer(rows, many=True).data,
+            'has_more': has_more,
+            'after': rows[-1].id if rows else after,
+            'notifications': [serializar(n) for n in notifications],
+        })
+
+
+class ChatMetricsView(generics.GenericAPIView):
+    """Counters of throttled/dropped WebSocket frames for this worker (staff only)."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(ws_metrics.snapshot())
 
 
 class ConversationDetailUpdateView(generics.GenericAPIView):
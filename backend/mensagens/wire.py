@@ -0,0 +1,143 @@
+"""Wire formats of the chat WebSocket, negotiated via Sec-WebSocket-Protocol.
+
+- no subprotocol: plain JSON with the full keys (what clients use today);
+- ``quartinho.compact.v1``: JSON text frames with short keys and the nested
+  ``sender``/``recipient`` objects reduced to ids (orjson when installed);
+- ``quartinho.msgpack.v1``: the same compact frames as MessagePack binary
+  frames (msgpack ships with channels_redis).
+
+Clients list what they support; the server picks the first one it knows in
+PREFERENCE order. No Django imports here so the benchmark script can load it.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:  # optional
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional
+    msgpack = None
+
+COMPACT = 'quartinho.compact.v1'
+MSGPACK = 'quartinho.msgpack.v1'
+
+# full key -> short key; applied to every dict except user payloads (SKIP)
+SHORT_KEYS = {
+    'type': 't',
+    'message': 'm',
+    'messages': 'ms',
+    'id': 'i',
+    'conversation': 'c',
+    'sender': 's',
+    'recipient': 'r',
+    'text': 'x',
+    'data': 'd',
+    'created_at': 'at',
+    'to': 'o',
+    'from': 'f',
+    'notification': 'n',
+    'notifications': 'ns',
+    'message_type': 'mt',
+    'message_id': 'mi',
+    'last_read_id': 'lr',
+    'unread_count': 'u',
+    'reader': 'rd',
+    'imovel_id': 'im',
+    'expires_in': 'e',
+    'code': 'k',
+    'seq': 'q',
+    'since': 'sn',
+    'replayed': 'rp',
+    'topic': 'tp',
+    'changes': 'ch',
+}
+LONG_KEYS = {short: full for full, short in SHORT_KEYS.items()}
+# free-form payloads are passed through untouched
+SKIP = ('data', 'imovel')
+# nested user objects collapse to their id
+USER_KEYS = ('sender', 'recipient')
+
+
+def _shorten(value):
+    if isinstance(value, dict):
+        out = {}
+        for key, item in value.items():
+            if key in USER_KEYS and isinstance(item, dict) and 'id' in item:
+                item = item['id']
+            elif key not in SKIP:
+                item = _shorten(item)
+            out[SHORT_KEYS.get(key, key)] = item
+        return out
+    if isinstance(value, list):
+        return [_shorten(v) for v in value]
+    return value
+
+
+def _expand(value):
+    if isinstance(value, dict):
+        out = {}
+        for key, item in value.items():
+            full = LONG_KEYS.get(key, key)
+            out[full] = item if full in SKIP else _expand(item)
+        return out
+    if isinstance(value, list):
+        return [_expand(v) for v in value]
+    return value
+
+
+class JsonCodec:
+    """Today's format: stdlib json, full keys, text frames."""
+    subprotocol = None
+    binary = False
+
+    def encode(self, content):
+        return json.dumps(content)
+
+    def decode(self, frame):
+        return json.loads(frame)
+
+
+class CompactJsonCodec:
+    subprotocol = COMPACT
+    binary = False
+
+    def encode(self, content):
+        content = _shorten(content)
+        if orjson is not None:
+            return orjson.dumps(content).decode('utf-8')
+        return json.dumps(content, separators=(',', ':'), ensure_ascii=False)
+
+    def decode(self, frame):
+        return _expand(orjson.loads(frame) if orjson is not None else json.loads(frame))
+
+
+class MsgpackCodec:
+    subprotocol = MSGPACK
+    binary = True
+
+    def encode(self, content):
+        return msgpack.packb(_shorten(content), use_bin_type=True)
+
+    def decode(self, frame):
+        if isinstance(frame, str):
+            frame = frame.encode('utf-8')
+        return _expand(msgpack.unpackb(frame, raw=False))
+
+
+DEFAULT = JsonCodec()
+CODECS = {COMPACT: CompactJsonCodec()}
+if msgpack is not None:
+    CODECS[MSGPACK] = MsgpackCodec()
+PREFERENCE = (MSGPACK, COMPACT)
+
+
+def negotiate(offered):
+    """Codec for the client's Sec-WebSocket-Protocol list (default JSON)."""
+    offered = set(offered or ())
+    for name in PREFERENCE:
+        if name in offered and name in CODECS:
+            return CODECS[name]
+    return DEFAULT
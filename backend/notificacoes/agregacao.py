@@ -0,0 +1,73 @@
+"""Agregação de notificações repetidas e limite de pushes.
+
+Uma rajada de 20 mensagens no chat vira uma única Notificacao ("X te
+enviou 20 mensagens") e no máximo um push a cada
+NOTIFICATION_PUSH_MIN_INTERVAL segundos por usuário e conversa.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import tempo_real
+from .models import Notificacao
+from .utils import send_fcm_to_user
+
+
+def chave_chat(conversation_id, remetente_id):
+    return f'chat:{conversation_id}:{remetente_id}'
+
+
+def criar_ou_agregar(usuario_id, chave, mensagem, mensagem_agregada=None, imovel_id=None):
+    """
+    Cria a notificação ou, se já houver uma não lida com a mesma ``chave``
+    dentro de NOTIFICATION_COALESCE_WINDOW, soma 1 à ``quantidade`` dela.
+
+    ``mensagem_agregada(quantidade)`` monta o texto da linha agregada; sem
+    ele o texto passa a ser ``mensagem``. Retorna (notificacao, criada).
+    """
+    janela = getattr(settings, 'NOTIFICATION_COALESCE_WINDOW', timedelta(minutes=10))
+    agora = timezone.now()
+    with transaction.atomic():
+        existente = (
+            Notificacao.objects.select_for_update()
+            .filter(usuario_id=usuario_id, chave=chave, lida=False, data_atualizacao__gte=agora - janela)
+            .order_by('-data_atualizacao')
+            .first()
+        )
+        if existente is None:
+            notificacao = Notificacao.objects.create(
+                usuario_id=usuario_id, imovel_id=imovel_id, chave=chave,
+                mensagem=mensagem, data_atualizacao=agora,
+            )
+            return notificacao, True
+
+        existente.quantidade += 1
+        existente.mensagem = mensagem_agregada(existente.quantidade) if mensagem_agregada else mensagem
+        existente.data_atualizacao = agora
+        # update() direto: continua sendo uma única não lida, o contador não muda
+        Notificacao.objects.filter(pk=existente.pk).update(
+            quantidade=F('quantidade') + 1,
+            mensagem=existente.mensagem,
+            data_atualizacao=agora,
+        )
+        tempo_real.emitir([existente])
+        return existente, False
+
+
+def permitir_push(usuario_id, chave):
+    """True no máximo uma vez a cada NOTIFICATION_PUSH_MIN_INTERVAL segundos por (usuário, chave)."""
+    intervalo = getattr(settings, 'NOTIFICATION_PUSH_MIN_INTERVAL', 30)
+    if not intervalo:
+        return True
+    return cache.add(f'push_rl:{usuario_id}:{chave}', 1, intervalo)
+
+
+def enviar_push_limitado(usuario_id, chave, title, body, data=None):
+    """Envia o push só se o limite por usuário/chave permitir; retorna se enviou."""
+    if not permitir_push(usuario_id, chave):
+        return False
+    send_fcm_to_user(usuario_id, title, body, data)
+    return True
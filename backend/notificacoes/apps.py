@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class NotificacoesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'notificacoes'
+
+    def ready(self):
+        # Mantém o contador de não lidas em dia
+        import notificacoes.signals
@@ -0,0 +1,83 @@
+"""Contador de notificações não lidas por usuário (banco + cache).
+
+Todas as funções recebem ids de usuário. O valor persistido fica em
+ContadorNaoLidas; o cache só guarda a última leitura e é invalidado
+depois do commit de qualquer alteração.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Value
+from django.db.models.functions import Greatest
+
+from .models import ContadorNaoLidas, Notificacao
+
+
+def _cache_key(usuario_id):
+    return f'notif_nao_lidas:{usuario_id}'
+
+
+def _invalidar(usuario_ids):
+    keys = [_cache_key(uid) for uid in usuario_ids]
+    cache.delete_many(keys)
+    # de novo após o commit: uma leitura concorrente pode ter cacheado o valor antigo
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def incrementar(usuario_ids, n=1):
+    usuario_ids = list(usuario_ids)
+    if not usuario_ids or n <= 0:
+        return
+    ContadorNaoLidas.objects.bulk_create(
+        [ContadorNaoLidas(usuario_id=uid) for uid in usuario_ids], ignore_conflicts=True
+    )
+    ContadorNaoLidas.objects.filter(usuario_id__in=usuario_ids).update(total=F('total') + n)
+    _invalidar(usuario_ids)
+
+
+def decrementar(usuario_ids, n=1):
+    usuario_ids = list(usuario_ids)
+    if not usuario_ids or n <= 0:
+        return
+    ContadorNaoLidas.objects.filter(usuario_id__in=usuario_ids).update(
+        total=Greatest(F('total') - n, Value(0))
+    )
+    _invalidar(usuario_ids)
+
+
+def obter(usuario_id):
+    """Leitura O(1): cache ou busca pela chave primária, nunca um COUNT."""
+    key = _cache_key(usuario_id)
+    total = cache.get(key)
+    if total is None:
+        total = (
+            ContadorNaoLidas.objects.filter(usuario_id=usuario_id)
+            .values_list('total', flat=True).first()
+        ) or 0
+        cache.set(key, total, getattr(settings, 'UNREAD_COUNTER_CACHE_TTL', 300))
+    return total
+
+
+def reconciliar(lote=500):
+    """Recalcula todos os contadores com uma contagem agrupada.
+
+    Retorna quantos contadores estavam errados e foram corrigidos.
+    """
+    reais = dict(
+        Notificacao.objects.filter(lida=False)
+        .values_list('usuario_id')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    ContadorNaoLidas.objects.bulk_create(
+        [ContadorNaoLidas(usuario_id=uid) for uid in reais], batch_size=lote, ignore_conflicts=True
+    )
+    corrigidos = []
+    for contador in ContadorNaoLidas.objects.only('usuario_id', 'total').iterator(chunk_size=lote):
+        real = reais.get(contador.usuario_id, 0)
+        if contador.total != real:
+            contador.total = real
+            corrigidos.append(contador)
+    ContadorNaoLidas.objects.bulk_update(corrigidos, ['total'], batch_size=lote)
+    cache.delete_many([_cache_key(c.usuario_id) for c in corrigidos])
+    return len(corrigidos)
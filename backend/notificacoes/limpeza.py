@@ -0,0 +1,107 @@
+"""Exclusão em lotes e política de retenção das notificações.
+
+Cada lote é um DELETE curto por chave primária (em autocommit), então a
+tabela nunca fica travada por muito tempo, mesmo com milhões de linhas.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+
+from . import contador
+from .models import Notificacao
+
+
+def _lote_padrao():
+    return getattr(settings, 'NOTIFICATION_DELETE_BATCH_SIZE', 1000)
+
+
+def excluir_em_lotes(queryset, lote=None):
+    """Apaga as linhas de ``queryset`` em blocos de ``lote``; retorna o total apagado.
+
+    Não mexe no contador de não lidas; quem chama é responsável por ele.
+    """
+    lote = lote or _lote_padrao()
+    total = 0
+    while True:
+        ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:lote])
+        if not ids:
+            return total
+        apagados, _ = Notificacao.objects.filter(pk__in=ids).delete()
+        total += apagados
+
+
+def excluir_lote_do_usuario(usuario_id, ids):
+    """Apaga ``ids`` do usuário e desconta do contador só as não lidas que saíram."""
+    nao_lidas, _ = Notificacao.objects.filter(usuario_id=usuario_id, pk__in=ids, lida=False).delete()
+    lidas, _ = Notificacao.objects.filter(usuario_id=usuario_id, pk__in=ids).delete()
+    contador.decrementar([usuario_id], nao_lidas)
+    return nao_lidas + lidas
+
+
+def excluir_todas_do_usuario(usuario_id, ate_id=None, lote=None):
+    """Apaga as notificações do usuário (até ``ate_id``, se dado), descontando as não lidas do contador.
+
+    As criadas depois de ``ate_id`` continuam lá e continuam contando.
+    """
+    lote = lote or _lote_padrao()
+    queryset = Notificacao.objects.filter(usuario_id=usuario_id)
+    if ate_id is not None:
+        queryset = queryset.filter(pk__lte=ate_id)
+    total = 0
+    while True:
+        ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:lote])
+        if not ids:
+            return total
+        total += excluir_lote_do_usuario(usuario_id, ids)
+
+
+def _excluir_excedentes(usuario_id, maximo, lote):
+    """Mantém só as ``maximo`` notificações mais recentes do usuário."""
+    excedentes = list(
+        Notificacao.objects.filter(usuario_id=usuario_id)
+        .order_by('-data_atualizacao', '-pk')
+        .values_list('pk', 'lida')[maximo:]
+    )
+    total = 0
+    for i in range(0, len(excedentes), lote):
+        bloco = excedentes[i:i + lote]
+        apagados, _ = Notificacao.objects.filter(pk__in=[pk for pk, _ in bloco]).delete()
+        total += apagados
+        nao_lidas = sum(1 for _, lida in bloco if not lida)
+        contador.decrementar([usuario_id], nao_lidas)
+    return total
+
+
+def aplicar_retencao(dias=None, maximo_por_usuario=None, lote=None):
+    """
+    Aplica a política de retenção:
+      - notificações lidas há mais de ``dias`` dias são apagadas;
+      - cada usuário mantém no máximo ``maximo_por_usuario`` notificações
+        (as mais antigas saem primeiro).
+
+    Valores None usam NOTIFICATION_RETENTION_DAYS / NOTIFICATION_MAX_PER_USER;
+    0 desativa a regra correspondente. Retorna {'expiradas': n, 'excedentes': n}.
+    """
+    if dias is None:
+        dias = getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 30)
+    if maximo_por_usuario is None:
+        maximo_por_usuario = getattr(settings, 'NOTIFICATION_MAX_PER_USER', 500)
+    lote = lote or _lote_padrao()
+
+    resultado = {'expiradas': 0, 'excedentes': 0}
+    if dias:
+        limite = timezone.now() - timedelta(days=dias)
+        expiradas = Notificacao.objects.filter(lida=True, data_criacao__lt=limite)
+        resultado['expiradas'] = excluir_em_lotes(expiradas, lote)
+
+    if maximo_por_usuario:
+        acima_do_limite = (
+            Notificacao.objects.values('usuario_id')
+            .annotate(n=Count('pk'))
+            .filter(n__gt=maximo_por_usuario)
+            .values_list('usuario_id', flat=True)
+        )
+        for usuario_id in list(acima_do_limite):
+            resultado['excedentes'] += _excluir_excedentes(usuario_id, maximo_por_usuario, lote)
+    return resultado
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from notificacoes import limpeza
+
+
+class Command(BaseCommand):
+    help = (
+        'Aplica a política de retenção: apaga notificações lidas antigas e '
+        'o excedente acima do limite por usuário, em lotes pequenos. '
+        'Rode periodicamente (ex.: cron diário).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=None,
+                            help='Idade máxima das notificações lidas (padrão: NOTIFICATION_RETENTION_DAYS)')
+        parser.add_argument('--maximo', type=int, default=None,
+                            help='Máximo de notificações por usuário (padrão: NOTIFICATION_MAX_PER_USER)')
+        parser.add_argument('--lote', type=int, default=None,
+                            help='Linhas por DELETE (padrão: NOTIFICATION_DELETE_BATCH_SIZE)')
+
+    def handle(self, *args, **options):
+        resultado = limpeza.aplicar_retencao(
+            dias=options['dias'],
+            maximo_por_usuario=options['maximo'],
+            lote=options['lote'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{resultado['expiradas']} expirada(s), {resultado['excedentes']} acima do limite"
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from notificacoes import contador
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula o contador de notificações não lidas de cada usuário. '
+        'Rode periodicamente (ex.: cron a cada hora) para corrigir desvios.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500, help='Tamanho dos lotes de atualização')
+
+    def handle(self, *args, **options):
+        corrigidos = contador.reconciliar(lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(f'{corrigidos} contador(es) corrigido(s)'))
@@ -0,0 +1,40 @@
+# Generated by Django 5.0.4 on 2026-10-19 18:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def preencher_contadores(apps, schema_editor):
+    Notificacao = apps.get_model('notificacoes', 'Notificacao')
+    ContadorNaoLidas = apps.get_model('notificacoes', 'ContadorNaoLidas')
+    contagens = (
+        Notificacao.objects.filter(lida=False)
+        .values_list('usuario_id')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    ContadorNaoLidas.objects.bulk_create(
+        [ContadorNaoLidas(usuario_id=uid, total=n) for uid, n in contagens], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notificacoes', '0002_device'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorNaoLidas',
+            fields=[
+                ('usuario', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='contador_nao_lidas', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(preencher_contadores, reverse_code=migrations.RunPython.noop),
+    ]
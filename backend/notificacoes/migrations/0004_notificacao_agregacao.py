@@ -0,0 +1,47 @@
+# Generated by Django 5.0.4 on 2026-10-19 18:07
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copiar_data_criacao(apps, schema_editor):
+    # Notificações antigas mantêm a posição na lista
+    Notificacao = apps.get_model('notificacoes', 'Notificacao')
+    Notificacao.objects.update(data_atualizacao=F('data_criacao'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notificacoes', '0003_contadornaolidas'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='notificacao',
+            options={'ordering': ['-data_atualizacao', '-id'], 'verbose_name_plural': 'Notificações'},
+        ),
+        migrations.AddField(
+            model_name='notificacao',
+            name='chave',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='notificacao',
+            name='data_atualizacao',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='notificacao',
+            name='quantidade',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddIndex(
+            model_name='notificacao',
+            index=models.Index(fields=['usuario', 'chave', 'lida'], name='notificacoe_usuario_d712ed_idx'),
+        ),
+        migrations.RunPython(copiar_data_criacao, reverse_code=migrations.RunPython.noop),
+    ]
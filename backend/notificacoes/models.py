@@ -4,6 +4,7 @@
 from propriedades.models import Propriedade
 from django.db import models
 from django.conf import settings # Importa as configurações
+from django.utils import timezone
 
 
 class Notificacao(models.Model):
@@ -19,12 +20,36 @@ class Notificacao(models.Model):
     
     data_criacao = models.DateTimeField(auto_now_add=True)
 
+    # Agregação: notificações com a mesma chave (ex.: 'chat:<conversa>:<remetente>')
+    # dentro da janela viram uma só linha, com `quantidade` eventos
+    chave = models.CharField(max_length=100, null=True, blank=True)
+    quantidade = models.PositiveIntegerField(default=1)
+    # Último evento agregado; é o que ordena a lista
+    data_atualizacao = models.DateTimeField(default=timezone.now)
+
     def __str__(self):
         return f'Notificação para {self.usuario.username}: {self.mensagem[:30]}...'
 
     class Meta:
-        ordering = ['-data_criacao']
+        ordering = ['-data_atualizacao', '-id']
         verbose_name_plural = "Notificações"
+        indexes = [
+            models.Index(fields=['usuario', 'chave', 'lida']),
+        ]
+
+
+class ContadorNaoLidas(models.Model):
+    """Total de notificações não lidas por usuário, mantido incrementalmente.
+
+    Evita o COUNT(*) a cada poll do badge; `reconciliar_contadores` corrige
+    eventuais desvios (ex.: exclusões em cascata).
+    """
+    usuario = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='contador_nao_lidas')
+    total = models.PositiveIntegerField(default=0)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.usuario_id}: {self.total} não lidas'
 
 
 class Device(models.Model):
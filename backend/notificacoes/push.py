@@ -0,0 +1,120 @@
+"""Push transports used by ``notificacoes.utils``.
+
+The transport is chosen by ``settings.PUSH_TRANSPORT`` (dotted path). Every
+transport implements ``send_multicast(tokens, title, body, data)`` and returns
+one result per token: ``RESULT_OK``, ``RESULT_INVALID`` (token is dead and
+should be removed) or ``RESULT_ERROR`` (transient failure, keep the token).
+"""
+import logging
+import threading
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+RESULT_OK = 'ok'
+RESULT_INVALID = 'invalid'
+RESULT_ERROR = 'error'
+
+# FCM accepts at most 500 tokens per multicast request
+MULTICAST_LIMIT = 500
+
+
+class FirebaseTransport:
+    """Sends through firebase-admin, initializing the app once per process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._initialized = False
+        self._app = None
+
+    def get_app(self):
+        if self._initialized:
+            return self._app
+        with self._lock:
+            if not self._initialized:
+                self._app = self._init_app()
+                self._initialized = True
+        return self._app
+
+    def _init_app(self):
+        try:
+            import firebase_admin
+            from firebase_admin import credentials
+            if firebase_admin._apps:
+                return firebase_admin.get_app()
+            cred_path = getattr(settings, 'FIREBASE_CREDENTIALS', None)
+            cred_json = getattr(settings, 'FIREBASE_CREDENTIALS_JSON', None)
+            if cred_path:
+                cred = credentials.Certificate(cred_path)
+            elif cred_json:
+                cred = credentials.Certificate(cred_json)
+            else:
+                logger.warning('No Firebase credentials configured')
+                return None
+            return firebase_admin.initialize_app(cred)
+        except Exception as e:
+            logger.exception('Failed to init firebase: %s', e)
+            return None
+
+    def _classify(self, exc):
+        from firebase_admin import messaging
+        # INVALID_ARGUMENT também vem de mensagem rejeitada (ex.: payload > 4 KB):
+        # falha comum, nunca motivo para apagar o token
+        dead = (messaging.UnregisteredError, messaging.SenderIdMismatchError)
+        if isinstance(exc, dead):
+            return RESULT_INVALID
+        return RESULT_ERROR
+
+    def send_multicast(self, tokens, title, body, data=None):
+        app = self.get_app()
+        if app is None:
+            return [RESULT_ERROR] * len(tokens)
+        from firebase_admin import messaging
+        message = messaging.MulticastMessage(
+            tokens=list(tokens),
+            notification=messaging.Notification(title=title, body=body),
+            data=data or {},
+        )
+        # send_each_for_multicast replaces send_multicast in newer firebase-admin
+        send = getattr(messaging, 'send_each_for_multicast', None) or messaging.send_multicast
+        try:
+            batch = send(message, app=app)
+        except Exception:
+            logger.exception('Failed to send FCM multicast')
+            return [RESULT_ERROR] * len(tokens)
+        logger.info('FCM multicast sent: %s ok, %s failed', batch.success_count, batch.failure_count)
+        return [RESULT_OK if r.success else self._classify(r.exception) for r in batch.responses]
+
+
+class LocalPushTransport:
+    """In-memory stand-in for tests and benchmarks; nothing leaves the process.
+
+    Tokens added to ``invalid_tokens`` are reported as dead.
+    """
+
+    def __init__(self):
+        self.sent = []
+        self.invalid_tokens = set()
+
+    def send_multicast(self, tokens, title, body, data=None):
+        tokens = list(tokens)
+        self.sent.append({'tokens': tokens, 'title': title, 'body': body, 'data': data or {}})
+        return [RESULT_INVALID if t in self.invalid_tokens else RESULT_OK for t in tokens]
+
+
+_transport = None
+_transport_path = None
+_transport_lock = threading.Lock()
+
+
+def get_transport():
+    """Return the process-wide transport configured in settings.PUSH_TRANSPORT."""
+    global _transport, _transport_path
+    path = getattr(settings, 'PUSH_TRANSPORT', 'notificacoes.push.FirebaseTransport')
+    if _transport is None or _transport_path != path:
+        with _transport_lock:
+            if _transport is None or _transport_path != path:
+                _transport = import_string(path)()
+                _transport_path = path
+    return _transport
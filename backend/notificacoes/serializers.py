@@ -10,7 +10,9 @@ class NotificacaoSerializer(serializers.ModelSerializer):
             'imovel', 
             'mensagem', 
             'lida', 
-            'data_criacao'
+            'data_criacao',
+            'quantidade',
+            'data_atualizacao',
         ]
 
 
@@ -0,0 +1,31 @@
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver
+
+from . import contador, tempo_real
+from .models import Notificacao
+
+
+@receiver(pre_save, sender=Notificacao)
+def notificacao_pre_save(sender, instance, **kwargs):
+    """Guarda o valor antigo de `lida` para o post_save ajustar o contador."""
+    instance._old_lida = None
+    if instance.pk is not None:
+        instance._old_lida = (
+            Notificacao.objects.filter(pk=instance.pk).values_list('lida', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Notificacao)
+def notificacao_post_save(sender, instance, created, **kwargs):
+    if created:
+        if not instance.lida:
+            contador.incrementar([instance.usuario_id])
+        tempo_real.emitir([instance])
+        return
+    old_lida = getattr(instance, '_old_lida', None)
+    if old_lida is None or old_lida == instance.lida:
+        return
+    if instance.lida:
+        contador.decrementar([instance.usuario_id])
+    else:
+        contador.incrementar([instance.usuario_id])
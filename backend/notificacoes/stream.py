@@ -0,0 +1,80 @@
+"""Server-Sent Events para clientes que não conseguem manter um WebSocket.
+
+GET /notificacoes/stream/?token=<access> (ou header Authorization: Bearer).
+O endpoint escuta o mesmo grupo `user_{id}` do ChatConsumer e repassa cada
+notificação como `event: notification`. Precisa rodar sob ASGI (daphne).
+"""
+import asyncio
+import json
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from usuarios import cache_auth
+from usuarios.tokens import versao
+from . import contador
+
+
+def _token_da_requisicao(request):
+    token = request.GET.get('token')
+    if not token:
+        auth = request.headers.get('Authorization', '')
+        if auth.lower().startswith('bearer '):
+            token = auth.split(' ', 1)[1]
+    return token
+
+
+async def _usuario_da_requisicao(request):
+    token = _token_da_requisicao(request)
+    if not token:
+        return None
+    try:
+        validated = AccessToken(token)
+        user_id = validated[api_settings.USER_ID_CLAIM]
+        # mesmo caminho do REST: cache + versão do token (senha trocada derruba o stream)
+        return await sync_to_async(cache_auth.obter)(user_id, versao(validated))
+    except Exception:
+        return None
+
+
+def _sse(evento, dados):
+    return f'event: {evento}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n'
+
+
+async def _eventos(usuario_id):
+    channel_layer = get_channel_layer()
+    heartbeat = getattr(settings, 'NOTIFICATION_SSE_HEARTBEAT', 15)
+    grupo = f'user_{usuario_id}'
+    canal = await channel_layer.new_channel()
+    await channel_layer.group_add(grupo, canal)
+    try:
+        total = await sync_to_async(contador.obter)(usuario_id)
+        yield _sse('unread', {'count': total})
+        while True:
+            try:
+                mensagem = await asyncio.wait_for(channel_layer.receive(canal), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                # comentário SSE mantém proxies e o cliente cientes de que a conexão vive
+                yield ': ping\n\n'
+                continue
+            tipo = mensagem.get('type')
+            if tipo == 'notification':
+                yield _sse('notification', mensagem.get('notification'))
+            elif tipo == 'notification.batch':
+                for notificacao in mensagem.get('notifications') or []:
+                    yield _sse('notification', notificacao)
+    finally:
+        await channel_layer.group_discard(grupo, canal)
+
+
+async def notificacoes_stream(request):
+    usuario = await _usuario_da_requisicao(request)
+    if usuario is None:
+        return JsonResponse({'detail': 'Token inválido ou ausente.'}, status=401)
+    response = StreamingHttpResponse(_eventos(usuario.id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,67 @@
+"""Envio de notificações em tempo real pelo grupo `user_{id}` do Channels.
+
+Toda Notificacao criada (ou agregada) é enviada depois do commit. Os envios
+são agrupados por usuário: o que chega para o mesmo usuário dentro de
+NOTIFICATION_STREAM_INTERVAL segundos, em qualquer número de commits, vira
+um único group_send, feito por uma única thread. Cada evento recebe o `seq`
+do fluxo do usuário (mensagens.replay), então quem estava offline recebe ao
+reconectar.
+"""
+import asyncio
+import logging
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+from .utils import Descarregador
+
+logger = logging.getLogger(__name__)
+
+
+def serializar(notificacao):
+    return {
+        'id': notificacao.id,
+        'mensagem': notificacao.mensagem,
+        'imovel': notificacao.imovel_id,
+        'lida': notificacao.lida,
+        'quantidade': notificacao.quantidade,
+        'data_criacao': notificacao.data_criacao.isoformat() if notificacao.data_criacao else None,
+        'data_atualizacao': notificacao.data_atualizacao.isoformat() if notificacao.data_atualizacao else None,
+    }
+
+
+def _evento(payloads):
+    if len(payloads) == 1:
+        return {'type': 'notification', 'notification': payloads[0]}
+    return {'type': 'notification.batch', 'notifications': payloads}
+
+
+async def _enviar_grupos(channel_layer, eventos):
+    await asyncio.gather(*(
+        channel_layer.group_send(f'user_{usuario_id}', evento)
+        for usuario_id, evento in eventos.items()
+    ))
+
+
+def _enviar(eventos):
+    from mensagens.replay import stamp
+
+    try:
+        channel_layer = get_channel_layer()
+        if channel_layer is not None and eventos:
+            eventos = {usuario_id: stamp(usuario_id, _evento(payloads)) for usuario_id, payloads in eventos.items()}
+            async_to_sync(_enviar_grupos)(channel_layer, eventos)
+    except Exception:
+        logger.exception('Failed to stream notifications')
+
+
+_fila = Descarregador(_enviar, 'NOTIFICATION_STREAM_INTERVAL', 0.25, lambda pendentes, novos: pendentes + novos)
+
+
+def emitir(notificacoes):
+    """Agenda o envio das notificações para depois do commit atual."""
+    eventos = {}
+    for notificacao in notificacoes:
+        eventos.setdefault(notificacao.usuario_id, []).append(serializar(notificacao))
+    if eventos:
+        transaction.on_commit(lambda: _fila.agendar(eventos))
@@ -1,3 +1,213 @@
-from django.test import TestCase
+import time
+from datetime import timedelta
+from io import StringIO
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from usuarios.models import Usuario
+from . import contador, limpeza
+from .models import ContadorNaoLidas, Device, Notificacao
+from .push import get_transport
+from .utils import send_fcm_to_user, send_fcm_to_users
+
+
+@override_settings(PUSH_TRANSPORT='notificacoes.push.LocalPushTransport')
+class PushTransportTests(TestCase):
+    def setUp(self):
+        self.transport = get_transport()
+        self.transport.sent.clear()
+        self.transport.invalid_tokens.clear()
+        self.ana = Usuario.objects.create_user(email='ana@example.com', password='pass123', username='Ana')
+        self.bia = Usuario.objects.create_user(email='bia@example.com', password='pass123', username='Bia')
+        Device.objects.create(usuario=self.ana, registration_id='ana-phone')
+        Device.objects.create(usuario=self.ana, registration_id='ana-tablet')
+        Device.objects.create(usuario=self.bia, registration_id='bia-phone')
+
+    def test_um_multicast_por_usuario(self):
+        send_fcm_to_user(self.ana, 'Oi', 'corpo', {'conversation': 7})
+        self.assertEqual(len(self.transport.sent), 1)
+        enviado = self.transport.sent[0]
+        self.assertCountEqual(enviado['tokens'], ['ana-phone', 'ana-tablet'])
+        # FCM só aceita strings no payload
+        self.assertEqual(enviado['data'], {'conversation': '7'})
+
+    def test_multicast_entre_usuarios(self):
+        send_fcm_to_users([self.ana.id, self.bia.id], 'Oi', 'corpo')
+        self.assertEqual(len(self.transport.sent), 1)
+        self.assertEqual(len(self.transport.sent[0]['tokens']), 3)
+
+    def test_tokens_invalidos_sao_removidos(self):
+        self.transport.invalid_tokens.add('ana-tablet')
+        send_fcm_to_user(self.ana, 'Oi', 'corpo')
+        self.assertFalse(Device.objects.filter(registration_id='ana-tablet').exists())
+        self.assertTrue(Device.objects.filter(registration_id='ana-phone').exists())
+
+    def test_mensagem_rejeitada_nao_apaga_token(self):
+        from firebase_admin import exceptions, messaging
+        from .push import RESULT_ERROR, RESULT_INVALID, FirebaseTransport
+
+        transport = FirebaseTransport()
+        # INVALID_ARGUMENT vem também de payload grande demais: não é token morto
+        self.assertEqual(transport._classify(exceptions.InvalidArgumentError('payload > 4KB')), RESULT_ERROR)
+        self.assertEqual(transport._classify(messaging.UnregisteredError('token morto')), RESULT_INVALID)
+
+
+class ContadorNaoLidasTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = Usuario.objects.create_user(email='badge@example.com', password='pass123', username='Badge')
+        self.client.force_authenticate(self.user)
+        self.url = reverse('notificacao-contagem-nao-lida')
+
+    def _contagem(self):
+        return self.client.get(self.url).data['count']
+
+    def test_contador_acompanha_criacao_leitura_e_exclusao(self):
+        n1 = Notificacao.objects.create(usuario=self.user, mensagem='a')
+        Notificacao.objects.create(usuario=self.user, mensagem='b')
+        Notificacao.objects.create(usuario=self.user, mensagem='c')
+        self.assertEqual(self._contagem(), 3)
+
+        self.client.patch(reverse('notificacao-detail', args=[n1.id]), {'lida': True}, format='json')
+        self.assertEqual(self._contagem(), 2)
+
+        self.client.post(reverse('notificacao-marcar-todas-como-lidas'))
+        self.assertEqual(self._contagem(), 0)
+
+        Notificacao.objects.create(usuario=self.user, mensagem='d')
+        self.client.delete(reverse('notificacao-excluir-todas'))
+        self.assertEqual(self._contagem(), 0)
+
+    def test_marcar_todas_desconta_so_as_marcadas(self):
+        Notificacao.objects.create(usuario=self.user, mensagem='a')
+        Notificacao.objects.create(usuario=self.user, mensagem='b')
+        # uma notificação concorrente já contada mas ainda não visível para o UPDATE
+        contador.incrementar([self.user.id])
+        self.client.post(reverse('notificacao-marcar-todas-como-lidas'))
+        self.assertEqual(self._contagem(), 1)
+
+    def test_badge_nao_faz_count(self):
+        Notificacao.objects.create(usuario=self.user, mensagem='a')
+        with CaptureQueriesContext(connection) as ctx:
+            self._contagem()
+        self.assertFalse(any('COUNT' in q['sql'].upper() for q in ctx.captured_queries))
+
+    def test_reconciliacao_corrige_desvios(self):
+        Notificacao.objects.create(usuario=self.user, mensagem='a')
+        ContadorNaoLidas.objects.filter(usuario=self.user).update(total=42)
+        call_command('reconciliar_contadores', stdout=StringIO())
+        self.assertEqual(self._contagem(), 1)
+
+
+@override_settings(NOTIFICATION_FANOUT_ASYNC=False, NOTIFICATION_DELETE_BATCH_SIZE=2)
+class RetencaoTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = Usuario.objects.create_user(email='ret@example.com', password='pass123', username='Ret')
+        self.client.force_authenticate(self.user)
+
+    def test_excluir_todas_em_lotes(self):
+        for i in range(5):
+            Notificacao.objects.create(usuario=self.user, mensagem=str(i))
+        r = self.client.delete(reverse('notificacao-excluir-todas'))
+        self.assertEqual(r.status_code, 200)
+        self.assertFalse(Notificacao.objects.filter(usuario=self.user).exists())
+        self.assertEqual(contador.obter(self.user.id), 0)
+
+    def test_excluir_ate_id_mantem_as_mais_novas_no_contador(self):
+        for i in range(3):
+            ultima = Notificacao.objects.create(usuario=self.user, mensagem=str(i))
+        Notificacao.objects.create(usuario=self.user, mensagem='nova')
+        apagadas = limpeza.excluir_todas_do_usuario(self.user.id, ate_id=ultima.id)
+        self.assertEqual(apagadas, 3)
+        self.assertEqual(contador.obter(self.user.id), 1)
+
+    def test_purgar_lidas_antigas_e_excedentes(self):
+        antiga = Notificacao.objects.create(usuario=self.user, mensagem='antiga', lida=True)
+        Notificacao.objects.filter(pk=antiga.pk).update(data_criacao=timezone.now() - timedelta(days=60))
+        for i in range(4):
+            Notificacao.objects.create(usuario=self.user, mensagem=str(i))
+        call_command('purgar_notificacoes', '--dias=30', '--maximo=3', stdout=StringIO())
+        restantes = Notificacao.objects.filter(usuario=self.user)
+        self.assertEqual(restantes.count(), 3)
+        self.assertFalse(restantes.filter(pk=antiga.pk).exists())
+        self.assertEqual(contador.obter(self.user.id), 3)
+
+
+@override_settings(NOTIFICATION_STREAM_INTERVAL=0)
+class TempoRealTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = Usuario.objects.create_user(email='rt@example.com', password='pass123', username='RT')
+        self.layer = get_channel_layer()
+        self.canal = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)(f'user_{self.user.id}', self.canal)
+
+    def tearDown(self):
+        async_to_sync(self.layer.flush)()
+
+    def test_notificacao_enviada_apos_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            notificacao = Notificacao.objects.create(usuario=self.user, mensagem='oi')
+        for callback in callbacks:
+            callback()
+        evento = async_to_sync(self.layer.receive)(self.canal)
+        self.assertEqual(evento['type'], 'notification')
+        self.assertEqual(evento['notification']['id'], notificacao.id)
+
+    @override_settings(NOTIFICATION_STREAM_INTERVAL=0.1)
+    def test_commits_seguidos_viram_um_evento_por_usuario(self):
+        for texto in ('a', 'b'):
+            with self.captureOnCommitCallbacks(execute=True):
+                Notificacao.objects.create(usuario=self.user, mensagem=texto)
+        # o envio sai da thread do descarregador: espera a janela passar antes de ler
+        time.sleep(0.5)
+        evento = async_to_sync(self.layer.receive)(self.canal)
+        self.assertEqual(evento['type'], 'notification.batch')
+        self.assertEqual([n['mensagem'] for n in evento['notifications']], ['a', 'b'])
+
+    @override_settings(TESTE_INTERVALO=0.05)
+    def test_descarregador_junta_por_chave_e_segue_depois_de_erro(self):
+        from .utils import Descarregador
+
+        lotes = []
+
+        def enviar(lote):
+            lotes.append(lote)
+            if len(lotes) == 1:
+                raise RuntimeError('falhou')
+
+        fila = Descarregador(enviar, 'TESTE_INTERVALO', 0, lambda pendentes, novos: pendentes + novos)
+        with self.assertLogs('notificacoes.utils', 'ERROR'):
+            fila.agendar({1: ['a']})
+            fila.agendar({1: ['b'], 2: ['c']})
+            time.sleep(0.3)
+        # o erro do primeiro lote não deixa a fila travada
+        fila.agendar({1: ['d']})
+        time.sleep(0.3)
+        self.assertEqual(lotes, [{1: ['a', 'b'], 2: ['c']}, {1: ['d']}])
+
+    def test_stream_exige_token(self):
+        r = self.client.get(reverse('notificacoes-stream'))
+        self.assertEqual(r.status_code, 401)
+
+    def test_stream_recusa_token_de_antes_da_troca_de_senha(self):
+        from django.test import RequestFactory
+        from usuarios.tokens import VersionedRefreshToken
+        from .stream import _usuario_da_requisicao
+
+        antigo = str(VersionedRefreshToken.for_user(self.user).access_token)
+        request = RequestFactory().get('/', {'token': antigo})
+        self.assertEqual(async_to_sync(_usuario_da_requisicao)(request), self.user)
+        self.user.set_password('outra123')
+        self.user.save()
+        self.assertIsNone(async_to_sync(_usuario_da_requisicao)(request))
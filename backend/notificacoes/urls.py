@@ -1,11 +1,14 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import NotificacaoViewSet, RegisterDeviceView
+from .stream import notificacoes_stream
 
 router = DefaultRouter()
 router.register(r'', NotificacaoViewSet, basename='notificacao')
 
 urlpatterns = [
+    # antes do router, senão 'stream' é tratado como pk
+    path('stream/', notificacoes_stream, name='notificacoes-stream'),
     path('', include(router.urls)),
     path('register-device/', RegisterDeviceView.as_view(), name='register-device'),
 ]
\ No newline at end of file
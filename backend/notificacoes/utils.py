@@ -1,52 +1,146 @@
 import logging
+import threading
+import time
 from django.conf import settings
+from django.db import connections
 
 logger = logging.getLogger(__name__)
 
+
+def run_in_background(func, *args, **kwargs):
+    """Run ``func`` in a daemon thread so fan-out work doesn't hold the request.
+
+    Set ``NOTIFICATION_FANOUT_ASYNC = False`` to run inline (tests, scripts).
+    """
+    if not getattr(settings, 'NOTIFICATION_FANOUT_ASYNC', True):
+        return func(*args, **kwargs)
+
+    def runner():
+        try:
+            func(*args, **kwargs)
+        except Exception:
+            logger.exception('Background task %s failed', getattr(func, '__name__', func))
+        finally:
+            # the thread opened its own DB connection; don't leak it
+            connections.close_all()
+
+    threading.Thread(target=runner, daemon=True).start()
+
+
+class Descarregador:
+    """Junta envios por chave e os entrega em lote a ``enviar({chave: valor})``.
+
+    O intervalo vem de ``settings.<configuracao>`` a cada chamada. Uma única
+    thread, criada sob demanda, envia a cada intervalo o que juntou e termina
+    quando a fila esvazia; ``juntar(pendente, novo)`` combina o que chega para
+    uma chave já pendente. Com intervalo 0 o envio é feito na hora, na thread
+    de quem chamou.
+    """
+
+    def __init__(self, enviar, configuracao, padrao, juntar):
+        self.enviar = enviar
+        self.configuracao = configuracao
+        self.padrao = padrao
+        self.juntar = juntar
+        self._pendentes = {}
+        self._lock = threading.Lock()
+        self._descarregando = False
+
+    def agendar(self, itens):
+        intervalo = getattr(settings, self.configuracao, self.padrao)
+        if not intervalo:
+            self.enviar(itens)
+            return
+        with self._lock:
+            for chave, valor in itens.items():
+                pendente = self._pendentes.get(chave)
+                self._pendentes[chave] = valor if pendente is None else self.juntar(pendente, valor)
+            if self._descarregando:
+                return
+            self._descarregando = True
+        threading.Thread(target=self._descarregador, args=(intervalo,), daemon=True).start()
+
+    def _descarregador(self, intervalo):
+        while True:
+            time.sleep(intervalo)
+            with self._lock:
+                lote, self._pendentes = self._pendentes, {}
+                if not lote:
+                    self._descarregando = False
+                    return
+            try:
+                self.enviar(lote)
+            except Exception:
+                logger.exception('Batched send %s failed', self.configuracao)
+            finally:
+                connections.close_all()
+
+
 def try_init_firebase():
-    try:
-        import firebase_admin
-        from firebase_admin import credentials
-        if not firebase_admin._apps:
-            cred_path = getattr(settings, 'FIREBASE_CREDENTIALS', None)
-            cred_json = getattr(settings, 'FIREBASE_CREDENTIALS_JSON', None)
-            if cred_path:
-                cred = credentials.Certificate(cred_path)
-            elif cred_json:
-                cred = credentials.Certificate(cred_json)
-            else:
-                logger.warning('No Firebase credentials configured')
-                return None
-            firebase_admin.initialize_app(cred)
-        return firebase_admin
-    except Exception as e:
-        logger.exception('Failed to init firebase: %s', e)
-        return None
+    """Return the firebase app, initializing it at most once per process."""
+    from .push import FirebaseTransport, get_transport
+    transport = get_transport()
+    if isinstance(transport, FirebaseTransport):
+        return transport.get_app()
+    return None
+
+
+def _stringify(data):
+    # FCM only accepts string values in the data payload
+    return {str(k): str(v) for k, v in (data or {}).items() if v is not None}
+
+
+def send_to_tokens(tokens, title, body, data=None):
+    """Multicast one push to ``tokens`` and delete the ones FCM reports as dead.
+
+    Returns the number of tokens that accepted the message.
+    """
+    from .models import Device
+    from .push import MULTICAST_LIMIT, RESULT_INVALID, RESULT_OK, get_transport
+
+    tokens = list(dict.fromkeys(tokens))
+    if not tokens:
+        return 0
+    transport = get_transport()
+    payload = _stringify(data)
+    delivered = 0
+    dead = []
+    for i in range(0, len(tokens), MULTICAST_LIMIT):
+        chunk = tokens[i:i + MULTICAST_LIMIT]
+        try:
+            results = transport.send_multicast(chunk, title, body, payload)
+        except Exception:
+            logger.exception('Failed to send FCM')
+            continue
+        for token, result in zip(chunk, results):
+            if result == RESULT_OK:
+                delivered += 1
+            elif result == RESULT_INVALID:
+                dead.append(token)
+    if dead:
+        removed, _ = Device.objects.filter(registration_id__in=dead).delete()
+        logger.info('Pruned %s dead FCM registrations', removed)
+    return delivered
+
 
 def send_fcm_notification_to_registration(registration_id, title, body, data=None):
-    firebase_admin = try_init_firebase()
-    if not firebase_admin:
-        return False
     try:
-        from firebase_admin import messaging
-        message = messaging.Message(
-            notification=messaging.Notification(title=title, body=body),
-            token=registration_id,
-            data=data or {},
-        )
-        resp = messaging.send(message)
-        logger.info('FCM sent: %s', resp)
-        return True
+        return send_to_tokens([registration_id], title, body, data) > 0
     except Exception:
         logger.exception('Failed to send FCM')
         return False
 
 def send_fcm_to_user(user, title, body, data=None):
-    # best-effort: loop through device registrations
+    """Send one multicast to every device registered for ``user``."""
+    user_id = getattr(user, 'pk', user)
+    send_fcm_to_users([user_id], title, body, data)
+
+
+def send_fcm_to_users(user_ids, title, body, data=None):
+    """Send the same push to many users: one Device query, then multicast batches."""
     try:
         from .models import Device
-        devices = Device.objects.filter(usuario=user)
-        for d in devices:
-            send_fcm_notification_to_registration(d.registration_id, title, body, data)
+        tokens = Device.objects.filter(usuario_id__in=list(user_ids)).values_list('registration_id', flat=True)
+        send_to_tokens(tokens, title, body, data)
     except Exception:
-        logger.exception('Failed to send fcm to user')
\ No newline at end of file
+        logger.exception('Failed to send fcm to users')
@@ -9,7 +9,9 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from .serializers import DeviceSerializer
 from .models import Device
-from .utils import send_fcm_to_user
+from .utils import send_fcm_to_user, run_in_background
+from . import contador, limpeza
+from django.conf import settings
 
 class NotificacaoViewSet(viewsets.ModelViewSet):
     """
@@ -23,6 +25,12 @@ class NotificacaoViewSet(viewsets.ModelViewSet):
         # Filtra o queryset para retornar apenas
         # notificações do usuário logado
         return Notificacao.objects.filter(usuario=self.request.user)
+
+    def perform_destroy(self, instance):
+        lida, usuario_id = instance.lida, instance.usuario_id
+        instance.delete()
+        if not lida:
+            contador.decrementar([usuario_id])
     
     @action(detail=False, methods=['get'])
     def contagem_nao_lida(self, request):
@@ -30,11 +38,8 @@ class NotificacaoViewSet(viewsets.ModelViewSet):
         Retorna apenas a contagem de notificações não lidas
         para o usuário logado.
         """
-        # Pega o queryset (que já está filtrado pelo get_queryset)
-        queryset = self.get_queryset()
-        
-        # Filtra mais uma vez por 'lida=False' e pega a contagem
-        contagem = queryset.filter(lida=False).count()
+        # Lê o contador mantido incrementalmente (sem COUNT na tabela)
+        contagem = contador.obter(request.user.id)
         
         # Retorna um JSON simples
         return Response({'count': contagem})
@@ -48,7 +53,9 @@ class NotificacaoViewSet(viewsets.ModelViewSet):
         queryset = self.get_queryset()
         
         # Filtra pelas não lidas e atualiza o campo 'lida' para True
-        queryset.filter(lida=False).update(lida=True)
+        # desconta só as que este UPDATE marcou (uma nova pode ter chegado no meio)
+        marcadas = queryset.filter(lida=False).update(lida=True)
+        contador.decrementar([request.user.id], marcadas)
         
         # Retorna uma resposta de sucesso sem conteúdo
         return Response(status=status.HTTP_204_NO_CONTENT)
@@ -60,10 +67,16 @@ class NotificacaoViewSet(viewsets.ModelViewSet):
         """
         # Pega o queryset (já filtrado para o usuário logado)
         queryset = self.get_queryset()
-        
-        # Deleta todas as notificações do usuário
-        count = queryset.count()
-        queryset.delete()
+        lote = getattr(settings, 'NOTIFICATION_DELETE_BATCH_SIZE', 1000)
+
+        # Apaga o primeiro lote agora; se houver mais, o resto é apagado
+        # em segundo plano, em lotes, sem travar a tabela
+        ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:lote + 1])
+        count = limpeza.excluir_lote_do_usuario(request.user.id, ids[:lote])
+        if len(ids) > lote:
+            ate_id = queryset.order_by('-pk').values_list('pk', flat=True).first()
+            run_in_background(limpeza.excluir_todas_do_usuario, request.user.id, ate_id=ate_id, lote=lote)
+            return Response({'deleted': count, 'pendente': True}, status=status.HTTP_200_OK)
         
         # Retorna uma resposta de sucesso
         return Response({'deleted': count}, status=status.HTTP_200_OK)    
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Propriedade, FotoPropriedade
+from .models import Propriedade, FotoPropriedade, HistoricoPreco
 
 
 class FotoInline(admin.TabularInline):
@@ -19,3 +19,10 @@ class PropriedadeAdmin(admin.ModelAdmin):
 class FotoPropriedadeAdmin(admin.ModelAdmin):
     list_display = ('id', 'propriedade', 'principal')
     search_fields = ('propriedade__titulo',)
+
+
+@admin.register(HistoricoPreco)
+class HistoricoPrecoAdmin(admin.ModelAdmin):
+    list_display = ('id', 'propriedade', 'preco', 'cidade', 'data')
+    list_filter = ('cidade',)
+    readonly_fields = ('propriedade', 'preco', 'cidade', 'data')
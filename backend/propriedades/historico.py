@@ -0,0 +1,85 @@
+"""Séries de preço por cidade calculadas a partir do HistoricoPreco."""
+import hashlib
+import statistics
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import HistoricoPreco, chave_cidade
+
+
+def _cache_key(cidade):
+    # mesma normalização da coluna cidade_chave; o md5 deixa a chave válida para o cache
+    digest = hashlib.md5(chave_cidade(cidade).encode('utf-8')).hexdigest()
+    return f'historico_preco_cidade:{digest}'
+
+
+def invalidar_serie_cidade(cidade):
+    if cidade:
+        cache.delete(_cache_key(cidade))
+
+
+def _percentis(valores):
+    if len(valores) == 1:
+        return valores[0], valores[0], valores[0]
+    p25, mediana, p75 = statistics.quantiles(valores, n=4, method='inclusive')
+    return p25, mediana, p75
+
+
+def _meses_ate_hoje(inicio):
+    """Primeiros dias de mês de ``inicio`` até o mês atual (inclusive)."""
+    fim = timezone.localtime(timezone.now()).date().replace(day=1)
+    mes = inicio
+    while mes.date() <= fim:
+        yield mes
+        mes = mes.replace(year=mes.year + (mes.month == 12), month=mes.month % 12 + 1)
+
+
+def serie_precos_cidade(cidade):
+    """
+    Retorna, mês a mês, mediana e percentis 25/75 dos preços de uma cidade.
+
+    Em cada mês vale o último preço conhecido de cada imóvel: um imóvel sem
+    mudança de preço continua contando nos meses seguintes (até o mês atual)
+    com o preço anterior. Imóveis removidos levam o histórico junto (cascade)
+    e saem da série. O resultado fica em cache até um novo preço ser
+    registrado na cidade.
+    """
+    key = _cache_key(cidade)
+    serie = cache.get(key)
+    if serie is not None:
+        return serie
+
+    linhas = (
+        HistoricoPreco.objects
+        .filter(cidade_chave=chave_cidade(cidade))
+        .annotate(mes=TruncMonth('data'))
+        .order_by('mes', 'propriedade_id', 'data')
+        .values_list('mes', 'propriedade_id', 'preco')
+    )
+
+    # agrupa por mês; o último registro de cada imóvel no mês sobrescreve os anteriores
+    meses = {}
+    for mes, propriedade_id, preco in linhas.iterator():
+        meses.setdefault(mes, {})[propriedade_id] = float(preco)
+
+    serie = []
+    atuais = {}
+    for mes in _meses_ate_hoje(min(meses)) if meses else ():
+        # preços do mês substituem os anteriores; os demais imóveis seguem com o último conhecido
+        atuais.update(meses.get(mes, {}))
+        valores = sorted(atuais.values())
+        p25, mediana, p75 = _percentis(valores)
+        serie.append({
+            'mes': mes.date().isoformat(),
+            'imoveis': len(valores),
+            'mediana': round(mediana, 2),
+            'p25': round(p25, 2),
+            'p75': round(p75, 2),
+            'minimo': valores[0],
+            'maximo': valores[-1],
+        })
+
+    cache.set(key, serie, getattr(settings, 'PRICE_STATS_CACHE_TTL', 600))
+    return serie
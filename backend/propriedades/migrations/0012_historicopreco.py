@@ -0,0 +1,45 @@
+# Generated by Django 5.0.4 on 2026-10-19 18:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def registrar_precos_atuais(apps, schema_editor):
+    # Ponto de partida do histórico: o preço atual de cada imóvel
+    Propriedade = apps.get_model('propriedades', 'Propriedade')
+    HistoricoPreco = apps.get_model('propriedades', 'HistoricoPreco')
+    registros = [
+        HistoricoPreco(propriedade_id=pid, preco=preco, cidade=cidade)
+        for pid, preco, cidade in Propriedade.objects.values_list('id', 'preco', 'cidade').iterator()
+    ]
+    HistoricoPreco.objects.bulk_create(registros, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('propriedades', '0011_add_status_paid'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='contratosolicitacao',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pendente'), ('approved', 'Aprovado'), ('rejected', 'Rejeitado'), ('paid', 'Pago')], default='pending', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='HistoricoPreco',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('preco', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('cidade', models.CharField(max_length=100)),
+                ('data', models.DateTimeField(auto_now_add=True)),
+                ('propriedade', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='historico_precos', to='propriedades.propriedade')),
+            ],
+            options={
+                'ordering': ['data'],
+                'indexes': [models.Index(fields=['propriedade', 'data'], name='propriedade_proprie_c9908b_idx'), models.Index(fields=['cidade', 'data'], name='propriedade_cidade_19ef25_idx')],
+            },
+        ),
+        migrations.RunPython(registrar_precos_atuais, reverse_code=migrations.RunPython.noop),
+    ]
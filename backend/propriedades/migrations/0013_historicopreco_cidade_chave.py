@@ -0,0 +1,42 @@
+# Generated by Django 5.0.4 on 2026-10-19 18:55
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+def _chave(cidade):
+    # cópia de propriedades.models.chave_cidade (migrações não importam o código atual)
+    sem_acento = unicodedata.normalize('NFKD', cidade or '').encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(sem_acento.casefold().split())
+
+
+def preencher_chaves(apps, schema_editor):
+    HistoricoPreco = apps.get_model('propriedades', 'HistoricoPreco')
+    cidades = HistoricoPreco.objects.values_list('cidade', flat=True).distinct()
+    for cidade in list(cidades):
+        HistoricoPreco.objects.filter(cidade=cidade).update(cidade_chave=_chave(cidade))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('propriedades', '0012_historicopreco'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='historicopreco',
+            name='propriedade_cidade_19ef25_idx',
+        ),
+        migrations.AddField(
+            model_name='historicopreco',
+            name='cidade_chave',
+            field=models.CharField(default='', max_length=100),
+        ),
+        migrations.RunPython(preencher_chaves, reverse_code=migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='historicopreco',
+            index=models.Index(fields=['cidade_chave', 'data'], name='propriedade_cidade__0cba2e_idx'),
+        ),
+    ]
@@ -1,3 +1,5 @@
+import unicodedata
+
 from django.db import models
 from django.conf import settings
 from usuarios.models import Usuario
@@ -33,6 +35,38 @@ class Propriedade(models.Model):
     def __str__(self):
         return self.titulo
 
+def chave_cidade(cidade):
+    """Nome da cidade sem acento, caixa ou espaços extras ("São  Paulo" -> "sao paulo")."""
+    sem_acento = unicodedata.normalize('NFKD', cidade or '').encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(sem_acento.casefold().split())
+
+
+class HistoricoPreco(models.Model):
+    """Registro append-only de cada preço que um imóvel já teve."""
+    propriedade = models.ForeignKey(Propriedade, on_delete=models.CASCADE, related_name='historico_precos')
+    preco = models.DecimalField(max_digits=10, decimal_places=2)
+    # copiado do imóvel para agregar por cidade sem join
+    cidade = models.CharField(max_length=100)
+    # chave normalizada (chave_cidade), comparada com `=` pelo índice
+    cidade_chave = models.CharField(max_length=100, default='')
+    data = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['data']
+        indexes = [
+            models.Index(fields=['propriedade', 'data']),
+            models.Index(fields=['cidade_chave', 'data']),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError('HistoricoPreco é append-only')
+        self.cidade_chave = chave_cidade(self.cidade)
+        return super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.propriedade_id}: R$ {self.preco} em {self.data:%Y-%m-%d}"
+
 class FotoPropriedade(models.Model):
     propriedade = models.ForeignKey(Propriedade, on_delete=models.CASCADE, related_name='fotos')
     imagem = models.FileField(upload_to='propriedades/')
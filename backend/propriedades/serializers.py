@@ -1,7 +1,7 @@
 from rest_framework import serializers
 from .models import Propriedade, FotoPropriedade, Comentario
 from usuarios.serializers import UsuarioSerializer
-from .models import ContratoSolicitacao
+from .models import ContratoSolicitacao, HistoricoPreco
 
 class ContratoSolicitacaoSerializer(serializers.ModelSerializer):
     solicitante = UsuarioSerializer(read_only=True)
@@ -73,6 +73,11 @@ class ContratoSolicitacaoSerializer(serializers.ModelSerializer):
 
         return rep
 
+class HistoricoPrecoSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = HistoricoPreco
+        fields = ['preco', 'data']
+
 class FotoPropriedadeSerializer(serializers.ModelSerializer):
     class Meta:
         model = FotoPropriedade
@@ -137,49 +137,235 @@ def contratos_post_save(sender, instance, created, **kwargs):
             notify(owner, msg, imovel=instance.imovel, data={'type': 'contrato', 'contrato_id': instance.id, 'event': 'primeiro_aluguel_pago'}, title='Pagamento recebido')
         except Exception:
             logger.exception('Error notifying owner about primeiro_aluguel_pago')
-# Em propriedades/signals.py (CRIE ESTE ARQUIVO)
-
-from django.db.models.signals import pre_save
-from django.dispatch import receiver
-from .models import Propriedade
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, pre_delete, pre_save
+from django.utils import timezone
+from .models import FotoPropriedade, Propriedade, HistoricoPreco
+from . import tempo_real
+from .historico import invalidar_serie_cidade
 from notificacoes.models import Notificacao # Importe seus modelos
 
+PRECO_ALERTA_PREFIXO = 'Alerta de preço!'
+
+
 @receiver(pre_save, sender=Propriedade)
 def verificar_mudanca_de_preco(sender, instance, **kwargs):
     """
     Este Signal é chamado ANTES de um objeto Propriedade ser salvo.
+    Só guarda o preço antigo; o alerta é disparado depois do commit.
     """
-    
+    instance._old_preco = None
+
     # Se o 'pk' (id) for None, o objeto está sendo criado, não atualizado.
     # Então, não fazemos nada.
     if instance.pk is None:
         return
 
+    # Pega só o preço "antigo" direto do banco de dados
+    instance._old_preco = (
+        Propriedade.objects.filter(pk=instance.pk).values_list('preco', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Propriedade)
+def registrar_historico_de_preco(sender, instance, created, **kwargs):
+    """Grava o preço no histórico na criação e a cada mudança."""
+    preco_antigo = getattr(instance, '_old_preco', None)
+    if not created and preco_antigo == instance.preco:
+        return
+    HistoricoPreco.objects.create(propriedade=instance, preco=instance.preco, cidade=instance.cidade)
+    invalidar_serie_cidade(instance.cidade)
+
+
+@receiver(post_save, sender=Propriedade)
+def agendar_alerta_de_preco(sender, instance, created, **kwargs):
+    """
+    Se o preço mudou, agenda o alerta para os usuários que favoritaram
+    o imóvel. O envio só acontece depois do commit, fora da requisição.
+    """
+    preco_antigo = getattr(instance, '_old_preco', None)
+    if created or preco_antigo is None or preco_antigo == instance.preco:
+        return
+
+    from notificacoes.utils import run_in_background
+
+    propriedade_id, preco_novo = instance.pk, instance.preco
+    transaction.on_commit(
+        lambda: run_in_background(notificar_mudanca_de_preco, propriedade_id, preco_antigo, preco_novo)
+    )
+
+
+@receiver(post_save, sender=Propriedade)
+def transmitir_imovel(sender, instance, created, **kwargs):
+    """Avisa quem assina o tópico do imóvel (depois do commit, agrupado)."""
+    if created:
+        # ninguém assina um imóvel que acabou de ser criado
+        return
+    preco_antigo = getattr(instance, '_old_preco', None)
+    mudanca = 'preco' if preco_antigo is not None and preco_antigo != instance.preco else 'dados'
+    propriedade_id = instance.pk
+    transaction.on_commit(lambda: tempo_real.agendar(propriedade_id, mudanca))
+
+
+# imóveis sendo apagados nesta thread: as fotos saem em cascata junto
+_removendo = threading.local()
+
+
+def _imoveis_removendo():
+    if not hasattr(_removendo, 'ids'):
+        _removendo.ids = set()
+    return _removendo.ids
+
+
+@receiver(pre_delete, sender=Propriedade)
+def marcar_imovel_removendo(sender, instance, **kwargs):
+    _imoveis_removendo().add(instance.pk)
+
+
+@receiver(post_delete, sender=Propriedade)
+def transmitir_imovel_removido(sender, instance, **kwargs):
+    propriedade_id = instance.pk
+    _imoveis_removendo().discard(propriedade_id)
+    transaction.on_commit(lambda: tempo_real.agendar(propriedade_id, 'removido'))
+
+
+@receiver(post_save, sender=FotoPropriedade)
+@receiver(post_delete, sender=FotoPropriedade)
+def transmitir_fotos(sender, instance, **kwargs):
+    propriedade_id = instance.propriedade_id
+    if propriedade_id in _imoveis_removendo():
+        # o evento 'removido' do imóvel já cobre as fotos
+        return
+    transaction.on_commit(lambda: tempo_real.agendar(propriedade_id, 'fotos'))
+
+
+@contextmanager
+def _trava_alerta(chave, espera=30, validade=120):
+    """
+    Trava curta no cache (cache.add) por imóvel. Espera até ``espera``
+    segundos; se não conseguir (ou o cache cair), segue sem ela: um alerta
+    duplicado é melhor que um perdido.
+    """
+    chave = f'{chave}:trava'
+    dono = uuid.uuid4().hex
+    limite = time.monotonic() + espera
+    obtida = False
     try:
-        # Pega a versão "antiga" do imóvel direto do banco de dados
-        original = Propriedade.objects.get(pk=instance.pk)
-    except Propriedade.DoesNotExist:
-        return # Objeto não existe, não faz nada
-
-    # Compara o preço antigo (do banco) com o novo (que está sendo salvo)
-    # Vamos assumir que seu campo de preço se chama 'preco'
-    if original.preco != instance.preco:
-        
-        # O PREÇO MUDOU!
-        # Agora, encontramos todos os usuários que favoritaram este imóvel.
-        # Assumindo que seu campo ManyToMany se chama 'favoritos'
-        usuarios_que_favoritaram = instance.favoritos.all()
-        
+        while not (obtida := cache.add(chave, dono, validade)) and time.monotonic() < limite:
+            time.sleep(0.05)
+    except Exception:
+        pass
+    if not obtida:
+        logger.warning('Price alert lock %s not acquired', chave)
+    try:
+        yield
+    finally:
+        try:
+            if obtida and cache.get(chave) == dono:
+                cache.delete(chave)
+        except Exception:
+            pass
+
+
+def notificar_mudanca_de_preco(propriedade_id, preco_antigo, preco_novo):
+    """
+    Cria um alerta de preço para cada usuário que favoritou o imóvel.
+
+    As notificações são inseridas em lotes (bulk_create) e os pushes
+    enviados por lote. Edições seguidas dentro de PRICE_ALERT_DEDUP_WINDOW
+    atualizam o alerta já enviado em vez de criar outro, então cada
+    usuário recebe um único alerta "de R$ X para R$ Z".
+    """
+    from notificacoes import contador, tempo_real
+    from notificacoes.utils import send_fcm_to_users
+
+    propriedade = Propriedade.objects.filter(pk=propriedade_id).only('id', 'titulo').first()
+    if propriedade is None:
+        return
+
+    janela = getattr(settings, 'PRICE_ALERT_DEDUP_WINDOW', timedelta(minutes=10))
+    lote = getattr(settings, 'NOTIFICATION_BATCH_SIZE', 500)
+    cache_key = f'preco_alerta:{propriedade_id}'
+
+    # alertas do mesmo imóvel rodam um de cada vez (ler e regravar o estado da
+    # janela no cache não tem corrida), sem travar a linha do imóvel
+    with _trava_alerta(cache_key):
+        # Se já houve um alerta recente, mantemos o preço original daquele alerta
+        anterior = cache.get(cache_key)
+        desde = timezone.now()
+        alertas_ids = []
+        if anterior:
+            preco_antigo = anterior['preco_original']
+            desde = anterior['desde']
+            alertas_ids = list(anterior.get('alertas') or [])
+        # os alertas desta janela são os ids guardados no cache, não um filtro pelo texto
+        alertas_recentes = Notificacao.objects.filter(pk__in=alertas_ids)
+
+        if preco_antigo == preco_novo:
+            # O preço voltou ao original: o alerta pendente não faz mais sentido
+            with transaction.atomic():
+                pendentes = alertas_recentes.filter(lida=False)
+                contador.decrementar(list(pendentes.values_list('usuario_id', flat=True)))
+                pendentes.delete()
+            cache.delete(cache_key)
+            return
+
         # Criamos a mensagem
         mensagem = (
-            f"Alerta de preço! O imóvel '{instance.titulo}' que você favoritou "
-            f"teve o preço alterado de R$ {original.preco} para R$ {instance.preco}."
+            f"{PRECO_ALERTA_PREFIXO} O imóvel '{propriedade.titulo}' que você favoritou "
+            f"teve o preço alterado de R$ {preco_antigo} para R$ {preco_novo}."
+        )
+
+        ja_alertados = set()
+        if alertas_ids:
+            with transaction.atomic():
+                ja_alertados = set(alertas_recentes.values_list('usuario_id', flat=True))
+                # alertas já lidos voltam a contar como não lidos
+                contador.incrementar(list(alertas_recentes.filter(lida=True).values_list('usuario_id', flat=True)))
+                alertas_recentes.update(mensagem=mensagem, lida=False, data_atualizacao=timezone.now())
+
+        # Usuários que favoritaram, lidos em blocos direto da tabela intermediária
+        usuarios_ids = (
+            Propriedade.favoritos.through.objects
+            .filter(propriedade_id=propriedade_id)
+            .values_list('usuario_id', flat=True)
+            .iterator(chunk_size=lote)
         )
 
-        # Criamos uma notificação para cada usuário
-        for usuario in usuarios_que_favoritaram:
-            Notificacao.objects.create(
-                usuario=usuario,
-                imovel=instance,
-                mensagem=mensagem
-            )
\ No newline at end of file
+        def guardar_estado():
+            cache.set(
+                cache_key, {'preco_original': preco_antigo, 'desde': desde, 'alertas': alertas_ids},
+                janela.total_seconds(),
+            )
+
+        def enviar(ids):
+            # cada lote na sua transação curta
+            with transaction.atomic():
+                criadas = Notificacao.objects.bulk_create(
+                    [Notificacao(usuario_id=uid, imovel_id=propriedade_id, mensagem=mensagem) for uid in ids],
+                    batch_size=lote,
+                )
+                # bulk_create não dispara signals: contador e tempo real à mão
+                contador.incrementar(ids)
+                tempo_real.emitir(criadas)
+            alertas_ids.extend(n.pk for n in criadas)
+            guardar_estado()
+            send_fcm_to_users(ids, 'Alerta de preço', mensagem, data={'type': 'preco', 'imovel': str(propriedade_id)})
+
+        pendentes = []
+        for usuario_id in usuarios_ids:
+            if usuario_id in ja_alertados:
+                continue
+            pendentes.append(usuario_id)
+            if len(pendentes) >= lote:
+                enviar(pendentes)
+                pendentes = []
+        if pendentes:
+            enviar(pendentes)
+        guardar_estado()
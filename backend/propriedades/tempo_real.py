@@ -0,0 +1,106 @@
+"""Atualizações ao vivo dos imóveis pelo grupo `imovel_{id}` do Channels.
+
+Quem está vendo um imóvel assina o tópico no mesmo WebSocket do chat
+(`{"type": "subscribe", "topic": "imovel:<id>"}`). Mudanças em Propriedade e
+FotoPropriedade são agendadas depois do commit, e só se o grupo do imóvel
+tiver alguém; as que chegam dentro de LISTING_UPDATE_INTERVAL segundos viram
+um único evento por imóvel. Uma única thread descarrega a fila: lê o estado
+final (dados principais, preço e fotos) uma vez por imóvel e envia.
+"""
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from mensagens import presence
+from notificacoes.utils import Descarregador
+
+from .models import FotoPropriedade, Propriedade
+
+logger = logging.getLogger(__name__)
+
+CAMPOS = (
+    'id', 'titulo', 'descricao', 'tipo', 'preco', 'cidade', 'estado', 'quartos', 'banheiros',
+    'area', 'mobiliado', 'aceita_pets', 'internet', 'estacionamento', 'data_atualizacao',
+)
+
+# (clientes, prefixo) do Redis do channel layer, ou None
+_redis = presence.PerLayer(lambda redis_layer: redis_layer)
+
+
+def grupo(propriedade_id):
+    return f'imovel_{int(propriedade_id)}'
+
+
+def serializar(propriedade_id):
+    """Estado atual do imóvel só com tipos simples (o layer Redis usa msgpack)."""
+    dados = Propriedade.objects.filter(pk=propriedade_id).values(*CAMPOS).first()
+    if dados is None:
+        return {'id': propriedade_id, 'removido': True}
+    for campo in ('preco', 'area'):
+        if dados[campo] is not None:
+            dados[campo] = str(dados[campo])
+    dados['data_atualizacao'] = dados['data_atualizacao'].isoformat()
+    storage = FotoPropriedade._meta.get_field('imagem').storage
+    dados['fotos'] = [
+        {'id': foto['id'], 'imagem': storage.url(foto['imagem']) if foto['imagem'] else None, 'principal': foto['principal']}
+        for foto in FotoPropriedade.objects.filter(propriedade_id=propriedade_id).order_by('id').values('id', 'imagem', 'principal')
+    ]
+    return dados
+
+
+def _enviar(propriedade_id, imovel, mudancas):
+    try:
+        channel_layer = get_channel_layer()
+        if channel_layer is not None:
+            async_to_sync(channel_layer.group_send)(grupo(propriedade_id), {
+                'type': 'imovel.update',
+                'imovel': imovel,
+                'changes': sorted(mudancas),
+            })
+    except Exception:
+        logger.exception('Failed to stream listing %s', propriedade_id)
+
+
+def tem_assinantes(propriedade_id):
+    """Se o grupo do imóvel tem algum canal; na dúvida, considera que sim."""
+    nome = grupo(propriedade_id)
+    try:
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return False
+        grupos = getattr(channel_layer, 'groups', None)
+        if isinstance(grupos, dict):
+            # InMemoryChannelLayer
+            return bool(grupos.get(nome))
+        redis_layer = _redis.get()
+        if redis_layer is not None:
+            clientes, prefixo = redis_layer
+            cliente = clientes[channel_layer.consistent_hash(nome)]
+            return bool(cliente.zcard(f'{prefixo}:group:{nome}'))
+    except Exception:
+        logger.exception('Failed to check subscribers of listing %s', propriedade_id)
+    return True
+
+
+def _descarregar(propriedade_id, mudancas):
+    try:
+        imovel = serializar(propriedade_id)
+    except Exception:
+        logger.exception('Failed to serialize listing %s', propriedade_id)
+        return
+    _enviar(propriedade_id, imovel, mudancas)
+
+
+def _descarregar_lote(lote):
+    for propriedade_id, mudancas in lote.items():
+        _descarregar(propriedade_id, mudancas)
+
+
+_fila = Descarregador(_descarregar_lote, 'LISTING_UPDATE_INTERVAL', 1.0, lambda pendentes, novas: pendentes | novas)
+
+
+def agendar(propriedade_id, mudanca):
+    """Agenda o envio; chamadas no mesmo imóvel dentro do intervalo se juntam."""
+    if tem_assinantes(propriedade_id):
+        _fila.agendar({propriedade_id: {mudanca}})
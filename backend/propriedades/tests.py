@@ -1,8 +1,15 @@
+from django.core.cache import cache
+import asyncio
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
 from usuarios.models import Usuario
-from .models import Propriedade, FotoPropriedade
+from .models import Propriedade, FotoPropriedade, HistoricoPreco
+from notificacoes.models import Notificacao
 from io import BytesIO
 from PIL import Image
 
@@ -100,7 +107,7 @@ class PropriedadesAPITests(APITestCase):
         )
         # voltar credenciais do owner
         resp = self.client.post(reverse('token_obtain_pair'), {"email": self.user.email, "password": "pass123"}, format='json')
-        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {resp.data['access']}')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {resp.data['access']}")
         url_upload = reverse('propriedade-upload-fotos', args=[prop.id])
         # imagem válida JPEG
         img = create_image_file('JPEG')
@@ -119,4 +126,199 @@ class PropriedadesAPITests(APITestCase):
             big.write(b"\0" * (5 * 1024 * 1024 + 2 - big.tell()))
         big.seek(0)
         r = self.client.post(url_upload, {"imagens": [big]}, format='multipart')
-        self.assertEqual(r.status_code, status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        self.assertEqual(r.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(NOTIFICATION_FANOUT_ASYNC=False)
+class AlertaDePrecoTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = Usuario.objects.create_user(email='dono@example.com', password='pass123', username='Dono')
+        self.fans = [
+            Usuario.objects.create_user(email=f'fan{i}@example.com', password='pass123', username=f'Fan{i}')
+            for i in range(3)
+        ]
+        self.prop = Propriedade.objects.create(
+            proprietario=self.owner, titulo='Kitnet Centro', tipo='kitnet', preco=900,
+            cidade='Palmas', estado='TO', cep='77000-000'
+        )
+        self.prop.favoritos.add(*self.fans)
+
+    def _set_preco(self, preco):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.prop.preco = preco
+            self.prop.save()
+
+    def test_alerta_criado_apos_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.prop.preco = 850
+            self.prop.save()
+        # nada é criado antes do commit
+        self.assertEqual(Notificacao.objects.count(), 0)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(Notificacao.objects.filter(imovel=self.prop).count(), 3)
+
+    def test_edicoes_seguidas_geram_um_alerta_por_usuario(self):
+        self._set_preco(850)
+        self._set_preco(800)
+        alertas = Notificacao.objects.filter(imovel=self.prop)
+        self.assertEqual(alertas.count(), 3)
+        self.assertIn('de R$ 900', alertas.first().mensagem)
+        self.assertIn('para R$ 800', alertas.first().mensagem)
+
+    def test_janela_so_mexe_nos_alertas_que_criou(self):
+        self._set_preco(850)
+        outra = Notificacao.objects.create(usuario=self.fans[0], imovel=self.prop, mensagem='Alerta de preço! outro aviso')
+        self._set_preco(800)
+        outra.refresh_from_db()
+        self.assertEqual(outra.mensagem, 'Alerta de preço! outro aviso')
+        self.assertEqual(Notificacao.objects.filter(imovel=self.prop, mensagem__contains='para R$ 800').count(), 3)
+
+    def test_trava_do_alerta_fica_no_cache(self):
+        from .signals import _trava_alerta
+
+        with _trava_alerta('preco_alerta:1'):
+            self.assertTrue(cache.get('preco_alerta:1:trava'))
+            # outro worker espera e, sem conseguir, segue com aviso no log
+            with self.assertLogs('propriedades.signals', 'WARNING'):
+                with _trava_alerta('preco_alerta:1', espera=0.1):
+                    pass
+            self.assertTrue(cache.get('preco_alerta:1:trava'))
+        self.assertIsNone(cache.get('preco_alerta:1:trava'))
+
+    def test_sem_mudanca_de_preco_nao_alerta(self):
+        self._set_preco(self.prop.preco)
+        self.prop.titulo = 'Outro título'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.prop.save()
+        self.assertEqual(Notificacao.objects.count(), 0)
+
+
+class HistoricoPrecoTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = Usuario.objects.create_user(email='hist@example.com', password='pass123', username='Hist')
+        self.client.force_authenticate(self.user)
+
+    def _criar(self, preco, cidade='Palmas'):
+        return Propriedade.objects.create(
+            proprietario=self.user, titulo='Casa', tipo='casa', preco=preco,
+            cidade=cidade, estado='TO', cep='77000-000'
+        )
+
+    def test_historico_por_imovel(self):
+        prop = self._criar(1000)
+        prop.preco = 1100
+        prop.save()
+        prop.titulo = 'Casa reformada'
+        prop.save()
+        r = self.client.get(reverse('propriedade-historico-preco', args=[prop.id]))
+        self.assertEqual(r.status_code, status.HTTP_200_OK)
+        self.assertEqual([h['preco'] for h in r.data], ['1000.00', '1100.00'])
+
+    def test_historico_e_append_only(self):
+        prop = self._criar(1000)
+        registro = HistoricoPreco.objects.get(propriedade=prop)
+        with self.assertRaises(ValueError):
+            registro.save()
+
+    def test_serie_por_cidade(self):
+        self._criar(1000)
+        self._criar(2000)
+        prop = self._criar(3000)
+        self._criar(9000, cidade='Gurupi')
+        url = reverse('historico_precos_cidade')
+        r = self.client.get(url, {'cidade': 'palmas'})
+        self.assertEqual(r.status_code, status.HTTP_200_OK)
+        mes = r.data['serie'][-1]
+        self.assertEqual(mes['imoveis'], 3)
+        self.assertEqual(mes['mediana'], 2000)
+        # um novo preço invalida o cache da cidade
+        prop.preco = 4000
+        prop.save()
+        r = self.client.get(url, {'cidade': 'Palmas'})
+        self.assertEqual(r.data['serie'][-1]['maximo'], 4000)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_serie_carrega_ultimo_preco_para_os_meses_seguintes(self):
+        from datetime import timedelta
+        from django.utils import timezone
+
+        parado = self._criar(1000, cidade='São Paulo')
+        mudou = self._criar(2000, cidade='São Paulo')
+        mudou.preco = 3000
+        mudou.save()
+        # tudo em 3 meses atrás, menos a mudança de preço (mês passado)
+        antes = timezone.now() - timedelta(days=90)
+        HistoricoPreco.objects.filter(cidade_chave='sao paulo').update(data=antes)
+        HistoricoPreco.objects.filter(propriedade=mudou, preco=3000).update(data=timezone.now() - timedelta(days=30))
+
+        r = self.client.get(reverse('historico_precos_cidade'), {'cidade': ' sao  PAULO'})
+        serie = r.data['serie']
+        self.assertGreaterEqual(len(serie), 3)
+        self.assertEqual((serie[0]['imoveis'], serie[0]['mediana']), (2, 1500))
+        # o imóvel parado continua contando depois do primeiro mês
+        self.assertTrue(all(m['imoveis'] == 2 for m in serie))
+        self.assertEqual((serie[-1]['minimo'], serie[-1]['maximo']), (1000, 3000))
+        self.assertEqual(HistoricoPreco.objects.filter(propriedade=parado).count(), 1)
+
+
+@override_settings(NOTIFICATION_FANOUT_ASYNC=False, LISTING_UPDATE_INTERVAL=0.2)
+class ImovelTempoRealTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = Usuario.objects.create_user(email='dono@example.com', password='pass123', username='Dono')
+        self.prop = Propriedade.objects.create(
+            proprietario=self.owner, titulo='Kitnet Centro', tipo='kitnet', preco=900,
+            cidade='Palmas', estado='TO', cep='77000-000'
+        )
+
+    def _eventos(self, mudar, espera=0.6):
+        async def cenario():
+            layer = get_channel_layer()
+            canal = await layer.new_channel()
+            await layer.group_add(f'imovel_{self.prop.id}', canal)
+            await sync_to_async(mudar)()
+            await asyncio.sleep(espera)
+            eventos = []
+            while True:
+                try:
+                    eventos.append(await asyncio.wait_for(layer.receive(canal), timeout=0.1))
+                except asyncio.TimeoutError:
+                    break
+            await layer.group_discard(f'imovel_{self.prop.id}', canal)
+            return eventos
+
+        return async_to_sync(cenario)()
+
+    def test_mudancas_seguidas_viram_um_evento(self):
+        def mudar():
+            for preco in (850, 800):
+                self.prop.preco = preco
+                self.prop.save()
+            FotoPropriedade.objects.create(propriedade=self.prop, imagem='propriedades/sala.jpg')
+
+        eventos = self._eventos(mudar)
+        self.assertEqual(len(eventos), 1)
+        self.assertEqual(eventos[0]['type'], 'imovel.update')
+        self.assertEqual(eventos[0]['changes'], ['fotos', 'preco'])
+        self.assertEqual(eventos[0]['imovel']['preco'], '800.00')
+        self.assertEqual(len(eventos[0]['imovel']['fotos']), 1)
+
+    @override_settings(LISTING_UPDATE_INTERVAL=0)
+    def test_remocao_sem_agrupamento(self):
+        prop_id = self.prop.id
+        FotoPropriedade.objects.create(propriedade=self.prop, imagem='propriedades/sala.jpg')
+        eventos = self._eventos(self.prop.delete, espera=0)
+        # as fotos apagadas em cascata não geram evento próprio
+        self.assertEqual(len(eventos), 1)
+        self.assertEqual(eventos[0]['imovel'], {'id': prop_id, 'removido': True})
+        self.assertEqual(eventos[0]['changes'], ['removido'])
+
+    @override_settings(LISTING_UPDATE_INTERVAL=0)
+    def test_sem_assinantes_nao_le_o_imovel(self):
+        from . import tempo_real
+
+        with self.assertNumQueries(0):
+            tempo_real.agendar(self.prop.id, 'dados')
@@ -13,4 +13,5 @@ urlpatterns = [
     # Payment webhooks removed
     path('propriedade/<int:propriedade_id>/favoritar/', views.favoritar_propriedade, name='favoritar_propriedade'),
     path('favoritos/', views.lista_favoritos, name='lista_favoritos'),    
+    path('historico-precos/', views.historico_precos_cidade, name='historico_precos_cidade'),
 ]
\ No newline at end of file
@@ -6,7 +6,8 @@ from django.db.models import Q
 from .models import Propriedade, FotoPropriedade, Comentario
 from .serializers import PropriedadeSerializer, FotoPropriedadeSerializer, ComentarioSerializer
 from .models import ContratoSolicitacao
-from .serializers import ContratoSolicitacaoSerializer
+from .serializers import ContratoSolicitacaoSerializer, HistoricoPrecoSerializer
+from .historico import serie_precos_cidade
 from .permissions import IsOwnerOrReadOnly, IsAuthorOrReadOnly
 from .pagination import StandardResultsSetPagination
 from django.shortcuts import render, get_object_or_404, redirect
@@ -17,8 +18,6 @@ import logging
 from rest_framework.permissions import AllowAny
 from notificacoes.models import Notificacao
 from notificacoes.utils import send_fcm_to_user
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
 import mercadopago
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
@@ -176,6 +175,13 @@ class PropriedadeViewSet(viewsets.ModelViewSet):
         serializer = FotoPropriedadeSerializer(fotos_salvas, many=True)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     
+    @action(detail=True, methods=['get'])
+    def historico_preco(self, request, pk=None):
+        """Série temporal de preços do imóvel (mais antigo primeiro)."""
+        propriedade = self.get_object()
+        serializer = HistoricoPrecoSerializer(propriedade.historico_precos.all(), many=True)
+        return Response(serializer.data)
+
     @action(detail=False, methods=['get'])
     def minhas_propriedades(self, request):
         propriedades = Propriedade.objects.filter(proprietario=request.user)
@@ -221,6 +227,16 @@ def lista_favoritos(request):
     return Response(serializer.data)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def historico_precos_cidade(request):
+    """Mediana e percentis mensais dos preços de uma cidade (?cidade=)."""
+    cidade = str(request.query_params.get('cidade') or '').strip()
+    if not cidade:
+        return Response({'detail': 'cidade é obrigatório'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'cidade': cidade, 'serie': serie_precos_cidade(cidade)})
+
+
 class ComentarioViewSet(viewsets.ModelViewSet):
     queryset = Comentario.objects.all()
     serializer_class = ComentarioSerializer
@@ -448,54 +464,23 @@ class ContratoSolicitacaoViewSet(viewsets.ModelViewSet):
         try:
             owner = obj.imovel.proprietario
             # create a Notificacao for the owner
-            owner_notif = Notificacao.objects.create(usuario=owner, imovel=obj.imovel, mensagem=f'Pagamento do primeiro aluguel para a solicitação #{obj.id} foi confirmado.')
+            Notificacao.objects.create(usuario=owner, imovel=obj.imovel, mensagem=f'Pagamento do primeiro aluguel para a solicitação #{obj.id} foi confirmado.')
             try:
                 # send FCM (title, body)
                 send_fcm_to_user(owner, 'Pagamento confirmado', f'Contrato #{obj.id} — pagamento confirmado.')
             except Exception:
                 pass
-            # push via websocket (channels) to owner group
-            try:
-                channel_layer = get_channel_layer()
-                payload = {
-                    'id': owner_notif.id,
-                    'mensagem': owner_notif.mensagem,
-                    'imovel': obj.imovel.id if obj.imovel else None,
-                    'lida': owner_notif.lida,
-                    'data_criacao': owner_notif.data_criacao.isoformat(),
-                }
-                async_to_sync(channel_layer.group_send)(f'user_{owner.id}', {
-                    'type': 'notification',
-                    'notification': payload,
-                })
-            except Exception:
-                pass
+            # the websocket push is sent by the Notificacao signal after commit
         except Exception:
             pass
 
         try:
             tenant = obj.solicitante
-            tenant_notif = Notificacao.objects.create(usuario=tenant, imovel=obj.imovel, mensagem=f'Seu pagamento para a solicitação #{obj.id} foi recebido.')
+            Notificacao.objects.create(usuario=tenant, imovel=obj.imovel, mensagem=f'Seu pagamento para a solicitação #{obj.id} foi recebido.')
             try:
                 send_fcm_to_user(tenant, 'Pagamento recebido', f'Seu pagamento para o contrato #{obj.id} foi confirmado.')
             except Exception:
                 pass
-            # push via websocket to tenant
-            try:
-                channel_layer = get_channel_layer()
-                payload = {
-                    'id': tenant_notif.id,
-                    'mensagem': tenant_notif.mensagem,
-                    'imovel': obj.imovel.id if obj.imovel else None,
-                    'lida': tenant_notif.lida,
-                    'data_criacao': tenant_notif.data_criacao.isoformat(),
-                }
-                async_to_sync(channel_layer.group_send)(f'user_{tenant.id}', {
-                    'type': 'notification',
-                    'notification': payload,
-                })
-            except Exception:
-                pass
         except Exception:
             pass
 
@@ -0,0 +1,69 @@
+"""Micro-benchmark dos formatos do WebSocket do chat (mensagens/wire.py).
+
+Uso (a partir de backend/):
+    python scripts/bench_wire.py [--n 20000]
+
+Mostra, por formato, bytes por frame e custo de encode/decode (µs/frame)
+para os frames mais comuns: mensagem de chat, notificação e typing.
+"""
+import argparse
+import os
+import sys
+import timeit
+
+OUTER_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if OUTER_BACKEND_DIR not in sys.path:
+    sys.path.insert(0, OUTER_BACKEND_DIR)
+
+from mensagens import wire  # noqa: E402  (sem Django: wire.py não importa nada dele)
+
+FRAMES = {
+    'message': {
+        'type': 'message',
+        'message': {
+            'id': 184467,
+            'conversation': 9312,
+            'sender': {'id': 41, 'nome': 'Ana Beatriz'},
+            'recipient': {'id': 77, 'nome': 'Bruno Carvalho'},
+            'text': 'Oi! O quarto ainda está disponível para o próximo semestre?',
+            'type': 'text',
+            'data': None,
+            'created_at': '2026-10-19T18:42:11.512391+00:00',
+        },
+    },
+    'notification': {
+        'type': 'notification',
+        'notification': {
+            'id': 55120, 'mensagem': 'Ana Beatriz te enviou 3 mensagens', 'lida': False,
+            'quantidade': 3, 'data_atualizacao': '2026-10-19T18:42:11.512391+00:00',
+        },
+    },
+    'typing': {'type': 'typing', 'from': 41, 'conversation': 9312, 'expires_in': 5},
+}
+
+
+def codecs():
+    yield 'json (padrão)', wire.DEFAULT
+    for name in wire.PREFERENCE:
+        if name in wire.CODECS:
+            yield name, wire.CODECS[name]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--n', type=int, default=20000, help='repetições por medida')
+    args = parser.parse_args()
+
+    print(f"orjson: {'sim' if wire.orjson else 'não'}  msgpack: {'sim' if wire.msgpack else 'não'}  n={args.n}")
+    print(f"{'frame':<13} {'formato':<22} {'bytes':>6} {'encode µs':>10} {'decode µs':>10}")
+    for frame_name, frame in FRAMES.items():
+        for codec_name, codec in codecs():
+            encoded = codec.encode(frame)
+            size = len(encoded if isinstance(encoded, bytes) else encoded.encode('utf-8'))
+            enc = min(timeit.repeat(lambda: codec.encode(frame), number=args.n, repeat=3)) / args.n * 1e6
+            dec = min(timeit.repeat(lambda: codec.decode(encoded), number=args.n, repeat=3)) / args.n * 1e6
+            print(f'{frame_name:<13} {codec_name:<22} {size:>6} {enc:>10.2f} {dec:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,25 @@
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
+from django.db.models import Case, IntegerField, Q, Value, When
 
 class EmailOrUsernameModelBackend(ModelBackend):
     def authenticate(self, request, username=None, password=None, **kwargs):
         UserModel = get_user_model()
         if username is None:
             username = kwargs.get(UserModel.USERNAME_FIELD)
-        try:
-            # Tenta autenticar por e-mail
-            user = UserModel.objects.get(email=username)
-        except UserModel.DoesNotExist:
-            try:
-                # Tenta autenticar por username
-                user = UserModel.objects.get(username=username)
-            except UserModel.DoesNotExist:
-                return None
+        if not username:
+            return None
+        # e-mail ou username numa consulta só (os dois indexados); e-mail tem prioridade
+        candidatos = list(
+            UserModel.objects.filter(Q(email=username) | Q(username=username))
+            .order_by(Case(When(email=username, then=Value(0)), default=Value(1), output_field=IntegerField()))[:2]
+        )
+        if not candidatos:
+            return None
+        user = candidatos[0]
+        if user.email != username and len(candidatos) > 1:
+            # username não é único: só autentica se não houver ambiguidade
+            return None
         if user.check_password(password) and self.user_can_authenticate(user):
             return user
         return None
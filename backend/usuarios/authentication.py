@@ -0,0 +1,25 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from . import cache_auth
+from .tokens import versao
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication que busca o usuário no cache (id + versão do token).
+
+    Só vai ao banco quando a entrada expirou (AUTH_USER_CACHE_TTL) ou foi
+    invalidada por um save/delete do Usuario.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            usuario_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+        usuario = cache_auth.obter(usuario_id, versao(validated_token))
+        if usuario is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        return usuario
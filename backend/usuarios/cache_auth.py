@@ -0,0 +1,69 @@
+"""Cache curto dos usuários autenticados por token.
+
+Evita um SELECT em ``usuarios_usuario`` a cada conexão WebSocket e a cada
+request REST (usuarios.authentication). A chave é id + versão do token
+(``Usuario.token_version``, claim ``ver``): trocar a senha muda a versão e
+os tokens antigos deixam de achar o usuário. As entradas vivem
+AUTH_USER_CACHE_TTL segundos e são apagadas sempre que o Usuario é salvo
+ou excluído (ver usuarios/signals.py), então mudanças como desativar a
+conta valem na hora.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+PREFIXO = 'auth_usuario:'
+
+
+def _ttl():
+    return getattr(settings, 'AUTH_USER_CACHE_TTL', 60)
+
+
+def chave(usuario_id, versao=0):
+    return f'{PREFIXO}{int(usuario_id)}:{int(versao)}'
+
+
+def obter_muitos(pares):
+    """{id: Usuario} para pares (id, versão) em cache (ausentes ficam de fora)."""
+    if not _ttl():
+        return {}
+    try:
+        achados = cache.get_many([chave(i, v) for i, v in pares])
+    except Exception:
+        return {}
+    return {usuario.pk: usuario for usuario in achados.values()}
+
+
+def guardar(usuarios):
+    ttl = _ttl()
+    if not ttl:
+        return
+    try:
+        cache.set_many({chave(u.pk, u.token_version): u for u in usuarios}, ttl)
+    except Exception:
+        pass
+
+
+def invalidar(usuario_id, versao=0):
+    # a versão anterior também: o save pode ter acabado de incrementá-la
+    try:
+        cache.delete_many([chave(usuario_id, v) for v in {versao, max(versao - 1, 0)}])
+    except Exception:
+        pass
+
+
+def obter(usuario_id, versao=0):
+    """
+    Usuario ativo pelo id, do cache ou do banco; None se não existir, estiver
+    inativo ou se ``versao`` não for mais a versão de token dele.
+    """
+    usuario = obter_muitos([(usuario_id, versao)]).get(int(usuario_id))
+    if usuario is None:
+        from .models import Usuario
+
+        usuario = Usuario.objects.filter(pk=usuario_id).first()
+        if usuario is None:
+            return None
+        guardar([usuario])
+    if not usuario.is_active or usuario.token_version != versao:
+        return None
+    return usuario
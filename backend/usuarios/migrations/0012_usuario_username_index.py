@@ -0,0 +1,18 @@
+# Generated by Django 5.0.4 on 2026-10-19 18:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0011_tokenrevogado'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='usuario',
+            name='username',
+            field=models.CharField(db_index=True, max_length=150),
+        ),
+    ]
@@ -32,7 +32,7 @@ class Usuario(AbstractBaseUser, PermissionsMixin):
     
     # keep email nullable to match existing migrations and avoid interactive prompts
     email = models.EmailField(blank=True, max_length=254, null=True, unique=True)
-    username = models.CharField(max_length=150)  # nome completo
+    username = models.CharField(max_length=150, db_index=True)  # nome completo (indexado: login e nomes únicos)
     avatar = models.ImageField(upload_to='usuarios/avatars/', null=True, blank=True)
     cpf = models.CharField(max_length=14, unique=True, null=True, blank=True, validators=[validar_cpf])
     data_nascimento = models.DateField(null=True, blank=True)
@@ -41,11 +41,38 @@ class Usuario(AbstractBaseUser, PermissionsMixin):
 
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # vai nos JWT (claim `ver`); trocar a senha incrementa e revoga os tokens antigos
+    token_version = models.PositiveIntegerField(default=0)
 
     objects = UsuarioManager()
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["username"]
 
+    def save(self, *args, **kwargs):
+        # `_password` só fica preenchido por set_password (não no upgrade de hash do login)
+        if self.pk is not None and getattr(self, '_password', None) is not None:
+            self.token_version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'token_version'}
+        return super().save(*args, **kwargs)
+
     def __str__(self):
         return self.email
+
+
+class TokenRevogado(models.Model):
+    """JTI de refresh token revogado (rotação ou logout) até o token expirar.
+
+    A consulta passa antes pelo cache e pelo filtro de Bloom de
+    usuarios.revogacao; as linhas expiradas são apagadas em lotes.
+    """
+    jti = models.CharField(max_length=255, unique=True)
+    expira_em = models.DateTimeField(db_index=True)
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = "Tokens revogados"
+
+    def __str__(self):
+        return self.jti
@@ -0,0 +1,164 @@
+"""Revogação de refresh tokens sem consulta ao banco no caminho comum.
+
+Um JTI revogado vai para a tabela TokenRevogado (até o token expirar), para
+o cache compartilhado e para um filtro de Bloom deste processo. A checagem:
+
+1. cache: achou, está revogado;
+2. filtro de Bloom (sincronizado com a tabela a cada REVOCATION_SYNC_INTERVAL
+   segundos, só as linhas novas): "não está" é definitivo;
+3. só os "talvez" do filtro (revogados de verdade ou falso positivo, ~0,1%)
+   vão ao banco.
+
+Uma revogação feita em outro worker e já fora do cache só é vista depois da
+próxima sincronização. As linhas expiradas são apagadas em lotes, no máximo
+uma vez a cada REVOCATION_PRUNE_INTERVAL segundos.
+"""
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import TokenRevogado
+
+PREFIXO = 'jwt_revogado:'
+CHAVE_PODA = 'jwt_revogados:poda'
+
+
+class FiltroBloom:
+    def __init__(self, capacidade, taxa_erro=0.001):
+        self.capacidade = max(int(capacidade), 1)
+        self.bits = max(int(-self.capacidade * math.log(taxa_erro) / (math.log(2) ** 2)), 8)
+        self.hashes = max(int(round(self.bits / self.capacidade * math.log(2))), 1)
+        self._array = bytearray((self.bits + 7) // 8)
+        self.total = 0
+
+    def _posicoes(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, item):
+        for pos in self._posicoes(item):
+            self._array[pos >> 3] |= 1 << (pos & 7)
+        self.total += 1
+
+    def __contains__(self, item):
+        return all(self._array[pos >> 3] & (1 << (pos & 7)) for pos in self._posicoes(item))
+
+
+class _Estado:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self, capacidade=None):
+        self.bloom = FiltroBloom(
+            capacidade or getattr(settings, 'REVOCATION_BLOOM_CAPACITY', 100_000),
+            getattr(settings, 'REVOCATION_BLOOM_ERROR_RATE', 0.001),
+        )
+        self.marca = 0
+        self.sincronizado_em = None
+
+
+_estado = _Estado()
+
+
+def chave(jti):
+    return f'{PREFIXO}{jti}'
+
+
+def _sincronizar():
+    """Traz para o filtro as revogações gravadas desde a última vez."""
+    intervalo = getattr(settings, 'REVOCATION_SYNC_INTERVAL', 30)
+    agora = time.monotonic()
+    with _estado.lock:
+        if _estado.sincronizado_em is not None and agora - _estado.sincronizado_em < intervalo:
+            return
+        novas = list(
+            TokenRevogado.objects.filter(id__gt=_estado.marca, expira_em__gt=timezone.now())
+            .order_by('id').values_list('id', 'jti')
+        )
+        if _estado.bloom.total + len(novas) > _estado.bloom.capacidade:
+            # filtro cheio: recomeça maior, só com o que ainda não expirou
+            vivos = list(TokenRevogado.objects.filter(expira_em__gt=timezone.now()).order_by('id').values_list('id', 'jti'))
+            _estado.reiniciar(max(_estado.bloom.capacidade, 2 * len(vivos)))
+            novas = vivos
+        for pk, jti in novas:
+            _estado.bloom.add(jti)
+            _estado.marca = pk
+        _estado.sincronizado_em = agora
+
+
+def esta_revogado(jti):
+    try:
+        if cache.get(chave(jti)):
+            return True
+    except Exception:
+        pass
+    _sincronizar()
+    if jti not in _estado.bloom:
+        return False
+    revogado = TokenRevogado.objects.filter(jti=jti, expira_em__gt=timezone.now()).exists()
+    if revogado:
+        try:
+            cache.set(chave(jti), 1, 300)
+        except Exception:
+            pass
+    return revogado
+
+
+def revogar(token):
+    """
+    Revoga o refresh ``token`` (objeto do SimpleJWT). Retorna False se ele já
+    estava revogado, o que na rotação indica reuso do mesmo token.
+    """
+    jti = token[api_settings.JTI_CLAIM]
+    expira_em = datetime.fromtimestamp(token['exp'], tz=dt_timezone.utc)
+    try:
+        with transaction.atomic():
+            TokenRevogado.objects.create(jti=jti, expira_em=expira_em)
+    except IntegrityError:
+        return False
+    restante = int((expira_em - timezone.now()).total_seconds())
+    try:
+        if restante > 0:
+            cache.set(chave(jti), 1, restante)
+    except Exception:
+        pass
+    with _estado.lock:
+        _estado.bloom.add(jti)
+    _agendar_poda()
+    return True
+
+
+def podar(lote=None):
+    """Apaga as revogações de tokens já expirados, em lotes; retorna o total."""
+    lote = lote or getattr(settings, 'REVOCATION_PRUNE_BATCH', 1000)
+    expirados = TokenRevogado.objects.filter(expira_em__lte=timezone.now())
+    total = 0
+    while True:
+        ids = list(expirados.order_by('pk').values_list('pk', flat=True)[:lote])
+        if not ids:
+            return total
+        apagados, _ = TokenRevogado.objects.filter(pk__in=ids).delete()
+        total += apagados
+
+
+def _agendar_poda():
+    intervalo = getattr(settings, 'REVOCATION_PRUNE_INTERVAL', 3600)
+    try:
+        # um worker por intervalo
+        if not intervalo or not cache.add(CHAVE_PODA, 1, intervalo):
+            return
+    except Exception:
+        return
+    from notificacoes.utils import run_in_background
+
+    transaction.on_commit(lambda: run_in_background(podar))
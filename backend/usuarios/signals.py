@@ -0,0 +1,12 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import cache_auth
+from .models import Usuario
+
+
+@receiver(post_save, sender=Usuario)
+@receiver(post_delete, sender=Usuario)
+def invalidar_cache_de_autenticacao(sender, instance, **kwargs):
+    # perfil, senha ou is_active mudaram: a próxima autenticação relê do banco
+    cache_auth.invalidar(instance.pk, instance.token_version)
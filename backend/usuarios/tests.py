@@ -1,3 +1,225 @@
-from django.test import TestCase
+import asyncio
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from backend.jwt_auth_middleware import TokenAuthMiddleware
+from . import cache_auth
+from .tokens import VersionedRefreshToken
+from .models import Usuario
+
+
+class TokenAuthMiddlewareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.usuarios = [
+            Usuario.objects.create_user(email=f'u{i}@example.com', password='pass123', username=f'U{i}')
+            for i in range(5)
+        ]
+        cache.clear()
+
+    def _conectar(self, tokens):
+        vistos = []
+
+        async def inner(scope, receive, send):
+            vistos.append(scope['user'])
+
+        middleware = TokenAuthMiddleware(inner)
+
+        async def tempestade():
+            await asyncio.gather(*[
+                middleware({'type': 'websocket', 'query_string': f'token={t}'.encode(), 'headers': []}, None, None)
+                for t in tokens
+            ])
+
+        async_to_sync(tempestade)()
+        return vistos
+
+    def test_reconexao_em_massa_vira_uma_consulta(self):
+        tokens = [str(AccessToken.for_user(u)) for u in self.usuarios] * 4
+        with CaptureQueriesContext(connection) as ctx:
+            vistos = self._conectar(tokens)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual({u.pk for u in vistos}, {u.pk for u in self.usuarios})
+
+        with CaptureQueriesContext(connection) as ctx:
+            self._conectar(tokens[:5])
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+    def test_salvar_usuario_invalida_cache_e_inativo_e_recusado(self):
+        usuario = self.usuarios[0]
+        token = str(AccessToken.for_user(usuario))
+        self._conectar([token])
+        self.assertIn(usuario.pk, cache_auth.obter_muitos([(usuario.pk, 0)]))
+
+        usuario.is_active = False
+        usuario.save()
+        self.assertEqual(cache_auth.obter_muitos([(usuario.pk, 0)]), {})
+        self.assertFalse(self._conectar([token])[0].is_authenticated)
+
+    def test_header_authorization_e_token_invalido(self):
+        usuario = self.usuarios[1]
+        vistos = []
+
+        async def inner(scope, receive, send):
+            vistos.append((scope['user'], scope['token_exp']))
+
+        middleware = TokenAuthMiddleware(inner)
+        token = AccessToken.for_user(usuario)
+        async_to_sync(middleware)({'type': 'websocket', 'headers': [(b'authorization', f'Bearer {token}'.encode())]}, None, None)
+        async_to_sync(middleware)({'type': 'websocket', 'query_string': b'token=lixo', 'headers': []}, None, None)
+        refresh = VersionedRefreshToken.for_user(usuario)
+        async_to_sync(middleware)({'type': 'websocket', 'query_string': f'token={refresh}'.encode(), 'headers': []}, None, None)
+        self.assertEqual((vistos[0][0].pk, vistos[0][1]), (usuario.pk, token['exp']))
+        self.assertFalse(vistos[1][0].is_authenticated)
+        # refresh token não serve de access
+        self.assertFalse(vistos[2][0].is_authenticated)
+
+
+class CachedJWTAuthenticationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.usuario = Usuario.objects.create_user(email='rest@example.com', password='pass123', username='Rest')
+        self.token = str(VersionedRefreshToken.for_user(self.usuario).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+    def test_segunda_requisicao_nao_consulta_usuario(self):
+        url = reverse('user-me')
+        self.assertEqual(self.client.get(url).status_code, 200)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertFalse([q for q in ctx.captured_queries if 'usuarios_usuario' in q['sql']])
+
+    def test_inativo_e_troca_de_senha_revogam(self):
+        url = reverse('user-me')
+        self.client.get(url)
+        self.usuario.is_active = False
+        self.usuario.save()
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+        self.usuario.is_active = True
+        self.usuario.set_password('nova-senha')
+        self.usuario.save()
+        self.assertEqual(self.usuario.token_version, 1)
+        self.assertEqual(self.client.get(url).status_code, 401)
+        novo = str(VersionedRefreshToken.for_user(self.usuario).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {novo}')
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_login_emite_token_com_versao(self):
+        r = self.client.post(reverse('token_obtain_pair'), {'email': 'rest@example.com', 'password': 'pass123'}, format='json')
+        self.assertEqual(AccessToken(r.data['access'])['ver'], 0)
+        # upgrade de hash no login não conta como troca de senha
+        self.usuario.refresh_from_db()
+        self.assertEqual(self.usuario.token_version, 0)
+
+
+@override_settings(REVOCATION_SYNC_INTERVAL=3600, NOTIFICATION_FANOUT_ASYNC=False)
+class RevogacaoTests(APITestCase):
+    def setUp(self):
+        from . import revogacao
+
+        cache.clear()
+        revogacao._estado.reiniciar()
+        self.usuario = Usuario.objects.create_user(email='ref@example.com', password='pass123', username='Ref')
+        self.refresh = str(VersionedRefreshToken.for_user(self.usuario))
+
+    def test_rotacao_revoga_o_refresh_usado(self):
+        url = reverse('token_refresh')
+        r = self.client.post(url, {'refresh': self.refresh}, format='json')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(self.client.post(url, {'refresh': self.refresh}, format='json').status_code, 401)
+        self.assertEqual(self.client.post(url, {'refresh': r.data['refresh']}, format='json').status_code, 200)
+
+    def test_checagem_nao_consulta_o_banco(self):
+        from . import revogacao
+
+        revogacao.esta_revogado('aquece')
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertFalse(revogacao.esta_revogado('nunca-revogado'))
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        token = VersionedRefreshToken(self.refresh)
+        self.assertTrue(revogacao.revogar(token))
+        self.assertFalse(revogacao.revogar(token))
+        cache.clear()
+        # fora do cache o filtro de Bloom manda para o banco, que confirma
+        self.assertTrue(revogacao.esta_revogado(token['jti']))
+
+    def test_logout_e_poda_em_lotes(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from . import revogacao
+        from .models import TokenRevogado
+
+        r = self.client.post(reverse('logout'), {'refresh': self.refresh}, format='json')
+        self.assertEqual(r.status_code, 205)
+        self.assertEqual(self.client.post(reverse('token_refresh'), {'refresh': self.refresh}, format='json').status_code, 401)
+
+        # já revogado, ou de antes da troca de senha: as mesmas regras do refresh
+        self.assertEqual(self.client.post(reverse('logout'), {'refresh': self.refresh}, format='json').status_code, 401)
+        antigo = str(VersionedRefreshToken.for_user(self.usuario))
+        self.usuario.set_password('outra123')
+        self.usuario.save()
+        self.assertEqual(self.client.post(reverse('logout'), {'refresh': antigo}, format='json').status_code, 401)
+        self.assertEqual(self.client.post(reverse('logout'), {}, format='json').status_code, 400)
+
+        passado = timezone.now() - timedelta(days=1)
+        TokenRevogado.objects.bulk_create([TokenRevogado(jti=f'velho-{i}', expira_em=passado) for i in range(5)])
+        self.assertEqual(revogacao.podar(lote=2), 5)
+        self.assertEqual(TokenRevogado.objects.count(), 1)
+
+    def test_filtro_bloom_sem_falso_negativo(self):
+        from .revogacao import FiltroBloom
+
+        filtro = FiltroBloom(1000, 0.01)
+        for i in range(1000):
+            filtro.add(f'jti-{i}')
+        self.assertTrue(all(f'jti-{i}' in filtro for i in range(1000)))
+        falsos = sum(f'outro-{i}' in filtro for i in range(10000))
+        self.assertLess(falsos, 300)
+
+
+class LoginEUsernameTests(TestCase):
+    def test_login_por_email_ou_username_numa_consulta(self):
+        from .auth_backend import EmailOrUsernameModelBackend
+
+        usuario = Usuario.objects.create_user(email='joao@example.com', password='pass123', username='Joao')
+        backend = EmailOrUsernameModelBackend()
+        for login in ('joao@example.com', 'Joao'):
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(backend.authenticate(None, username=login, password='pass123'), usuario)
+            self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertIsNone(backend.authenticate(None, username='Joao', password='errada'))
+        # username repetido é ambíguo; e-mail continua funcionando
+        Usuario.objects.create_user(email='joao2@example.com', password='pass123', username='Joao')
+        self.assertIsNone(backend.authenticate(None, username='Joao', password='pass123'))
+        self.assertEqual(backend.authenticate(None, username='joao@example.com', password='pass123'), usuario)
+
+    def test_username_unico_pelo_maior_sufixo(self):
+        from .views import _ensure_unique_username
+
+        self.assertEqual(_ensure_unique_username('Maria Silva'), 'MariaSilva')
+        for nome in ('MariaSilva', 'MariaSilva1', 'MariaSilva7', 'MariaSilvaLima', 'MariaSilva12x', 'mariasilva30'):
+            Usuario.objects.create(email=f'{nome}@example.com', username=nome)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(_ensure_unique_username('Maria Silva'), 'MariaSilva8')
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(_ensure_unique_username('MariaSilvaLima'), 'MariaSilvaLima1')
+
+    def test_username_unico_usa_intervalo_do_indice(self):
+        from .views import _ensure_unique_username
+
+        for nome in ('Ana', 'Ana9', 'Ana10', 'Ana:1', 'Ana/2', 'ana11', 'AnaB'):
+            Usuario.objects.create(email=f'{nome.replace(":", "").replace("/", "")}@example.com', username=nome)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(_ensure_unique_username('Ana'), 'Ana11')
+        sql = ctx.captured_queries[0]['sql']
+        self.assertIn('"username" >=', sql)
+        self.assertIn('"username" <', sql)
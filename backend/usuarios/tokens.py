@@ -0,0 +1,73 @@
+"""JWT com a versão de token do usuário (claim ``ver``).
+
+O refresh carrega a versão e o access copia os claims do refresh, então
+todo token emitido por aqui (login, social, /token/) é revogado quando
+``Usuario.token_version`` muda. Tokens sem o claim valem como versão 0.
+
+Na rotação (/token/refresh/) o refresh usado é revogado (usuarios.revogacao):
+reapresentar um refresh já trocado ou de logout dá 401.
+"""
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+CLAIM_VERSAO = 'ver'
+
+
+def versao(validated_token):
+    try:
+        return int(validated_token.get(CLAIM_VERSAO) or 0)
+    except (TypeError, ValueError):
+        return -1
+
+
+class VersionedRefreshToken(RefreshToken):
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token[CLAIM_VERSAO] = getattr(user, 'token_version', 0)
+        return token
+
+
+class VersionedTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = VersionedRefreshToken
+
+
+def validar_refresh(raw, token_class=RefreshToken):
+    """
+    Refresh ``raw`` decodificado se ainda vale: não revogado e emitido para a
+    versão de token atual de um usuário ativo. InvalidToken se não.
+    """
+    from . import cache_auth, revogacao
+
+    try:
+        refresh = token_class(raw)
+    except TokenError as e:
+        raise InvalidToken(e.args[0])
+    if revogacao.esta_revogado(refresh[api_settings.JTI_CLAIM]):
+        raise InvalidToken(_('Token is blacklisted'))
+    if cache_auth.obter(refresh[api_settings.USER_ID_CLAIM], versao(refresh)) is None:
+        raise InvalidToken(_('User not found'))
+    return refresh
+
+
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    """TokenRefreshSerializer com revogação sem o app token_blacklist."""
+
+    def validate(self, attrs):
+        from . import revogacao
+
+        refresh = validar_refresh(attrs['refresh'], self.token_class)
+
+        data = {'access': str(refresh.access_token)}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            # a inserção é o que vale: dois refresh simultâneos com o mesmo token, só um passa
+            if api_settings.BLACKLIST_AFTER_ROTATION and not revogacao.revogar(refresh):
+                raise InvalidToken(_('Token is blacklisted'))
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+        return data
@@ -1,10 +1,11 @@
 from django.urls import path
-from .views import UsuarioCreateView, CheckEmailView, LoginView, UserPreferenceView, UserMeView, GoogleSocialLoginView, FacebookSocialLoginView
+from .views import UsuarioCreateView, CheckEmailView, LoginView, LogoutView, UserPreferenceView, UserMeView, GoogleSocialLoginView, FacebookSocialLoginView
 
 urlpatterns = [
     path('usercreate/', UsuarioCreateView.as_view(), name='usuario-create'),
     path('check-email/', CheckEmailView.as_view(), name='check-email'),
     path('login/', LoginView.as_view(), name='login'),
+    path('logout/', LogoutView.as_view(), name='logout'),
     path('preferences/', UserPreferenceView.as_view(), name='user-preferences'),
     path('me/', UserMeView.as_view(), name='user-me'),
     path('social/google/', GoogleSocialLoginView.as_view(), name='social-google'),
@@ -4,11 +4,17 @@ from rest_framework.views import APIView
 from .serializers import UsuarioSerializer, LoginSerializer, UserPreferenceSerializer
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework_simplejwt.tokens import RefreshToken
+from .tokens import VersionedRefreshToken, validar_refresh
+from . import revogacao
 from django.contrib.auth import login
+from rest_framework_simplejwt.exceptions import InvalidToken
+from django.db import models
+from django.db.models import Count, Max, Q
+from django.db.models.functions import Cast, Substr
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.parsers import MultiPartParser, FormParser
 import json
+import re
 import urllib.request
 import urllib.error
 
@@ -44,6 +50,26 @@ class CheckEmailView(APIView):
         exists = Usuario.objects.filter(email=email).exists()
         return Response({"exists": exists}, status=status.HTTP_200_OK)
 
+class LogoutView(APIView):
+    """POST {"refresh": "..."} revoga o refresh token (o access expira sozinho).
+
+    Passa pelas mesmas checagens do /token/refresh/: refresh já revogado ou
+    de antes da troca de senha dá 401.
+    """
+
+    def post(self, request):
+        token = request.data.get('refresh') if isinstance(request.data, dict) else None
+        if not token:
+            return Response({'detail': 'Refresh token ausente'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            refresh = validar_refresh(token)
+        except InvalidToken:
+            return Response({'detail': 'Refresh token inválido'}, status=status.HTTP_401_UNAUTHORIZED)
+        if not revogacao.revogar(refresh):
+            # outra requisição revogou o mesmo token entre a checagem e a inserção
+            return Response({'detail': 'Refresh token inválido'}, status=status.HTTP_401_UNAUTHORIZED)
+        return Response(status=status.HTTP_205_RESET_CONTENT)
+
 class LoginView(APIView):
     def post(self, request):
         serializer = LoginSerializer(data=request.data)
@@ -52,7 +78,7 @@ class LoginView(APIView):
             login(request, user)
             
             # Gerar token JWT
-            refresh = RefreshToken.for_user(user)
+            refresh = VersionedRefreshToken.for_user(user)
             
             return Response({
                 'tokens': {
@@ -71,13 +97,27 @@ class LoginView(APIView):
 # ---- Social Login Endpoints ----
 
 def _ensure_unique_username(base: str) -> str:
+    """`base` se estiver livre, senão `base` + (maior sufixo numérico existente + 1).
+
+    Uma consulta só, em vez de testar base1, base2... Lacunas na numeração
+    não são reaproveitadas. O intervalo [base, base + ':') usa o índice de
+    username (os dígitos vêm antes de ':' na ordem binária) e, como a
+    comparação é sensível a maiúsculas, não pega "mariasilva7"; a regex
+    descarta o resto do intervalo ("MariaSilva12x"). Nada de ``startswith``:
+    no SQLite vira um LIKE sem distinção de caixa.
+    """
     base = (base or 'user').strip().replace(' ', '')
-    candidate = base
-    idx = 1
-    while Usuario.objects.filter(username=candidate).exists():
-        candidate = f"{base}{idx}"
-        idx += 1
-    return candidate
+    sufixo = Cast(Substr('username', len(base) + 1), models.BigIntegerField())
+    encontrado = Usuario.objects.filter(
+        username__gte=base, username__lt=f'{base}:',
+        username__regex=rf'^{re.escape(base)}([0-9]{{1,9}})?$',
+    ).aggregate(
+        existe=Count('pk', filter=Q(username=base)),
+        maior=Max(sufixo, filter=~Q(username=base)),
+    )
+    if not encontrado['existe']:
+        return base
+    return f"{base}{(encontrado['maior'] or 0) + 1}"
 
 class GoogleSocialLoginView(APIView):
     """Recebe id_token do Google (One Tap/Sign In) e retorna JWT da aplicação."""
@@ -109,7 +149,7 @@ class GoogleSocialLoginView(APIView):
             user.username = username
             user.save()
 
-        refresh = RefreshToken.for_user(user)
+        refresh = VersionedRefreshToken.for_user(user)
         return Response({
             'tokens': {
                 'refresh': str(refresh),
@@ -152,7 +192,7 @@ class FacebookSocialLoginView(APIView):
             user.username = username
             user.save()
 
-        refresh = RefreshToken.for_user(user)
+        refresh = VersionedRefreshToken.for_user(user)
         return Response({
             'tokens': {
                 'refresh': str(refresh),
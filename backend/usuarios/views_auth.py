@@ -3,7 +3,11 @@ from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
 
+from .tokens import VersionedRefreshToken
+
 class EmailTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = VersionedRefreshToken
+
     @classmethod
     def get_token(cls, user):
         return super().get_token(user)